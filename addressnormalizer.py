@@ -0,0 +1,173 @@
+"""
+Batch UK address normalizer - splits raw cafe address text ("12 High Street, Shoreditch, London E1 6AN, UK") into
+street, city and postcode with a compiled UK postcode grammar instead of checking each word for digits.
+
+The postcode is only accepted if the outward code (area + district, e.g. 'EC1N') and the inward code (sector +
+unit, e.g. '7TE') are valid, and is always formatted 'OUTWARD INWARD'. Street and city tokens repeat across
+thousands of cafes (city names, 'Street', 'Road' ...) so their normalised forms are memoized, as are whole addresses.
+
+    normalizer = AddressNormalizer()
+    normalizer.normalise_many(address_texts)  # [NormalizedAddress(street, city, postcode, valid_postcode), ...]
+"""
+import functools
+import re
+from typing import NamedTuple
+
+# UK postcode grammar - outward code: area (1-2 letters) + district, inward code: sector digit + 2 unit letters
+OUTWARD_PATTERN = (r"(?:[A-PR-UWYZ][0-9][0-9A-HJKPSTUW]?"  # A9, A99, A9A
+                   r"|[A-PR-UWYZ][A-HK-Y][0-9][0-9ABEHMNPRV-Y]?)")  # AA9, AA99, AA9A
+INWARD_PATTERN = r"[0-9][ABD-HJLNP-UW-Z]{2}"
+POSTCODE_REGEX = re.compile(rf"(?<![A-Z0-9])(GIR|{OUTWARD_PATTERN})\s*(0AA|{INWARD_PATTERN})(?![A-Z0-9])",
+                            re.IGNORECASE)
+OUTWARD_REGEX = re.compile(rf"{OUTWARD_PATTERN}|GIR", re.IGNORECASE)
+INWARD_REGEX = re.compile(INWARD_PATTERN, re.IGNORECASE)
+
+# trailing address parts naming the country - not part of the street or city
+COUNTRY_NAMES = {"uk", "u.k.", "united kingdom", "great britain", "gb", "england", "scotland", "wales",
+                 "northern ireland"}
+
+# the common well-formed address - 'street[, street ...], City OUTWARD INWARD[, country]' with a city of letters only
+# and a valid postcode. Parsed with this one anchored match before falling back to the full grammar.
+COUNTRY_PATTERN = "|".join(re.escape(name) for name in sorted(COUNTRY_NAMES))
+WELL_FORMED_REGEX = re.compile(rf"(.*), ([A-Za-z][A-Za-z'.-]*(?: [A-Za-z][A-Za-z'.-]*)*) "
+                               rf"({OUTWARD_PATTERN}) ({INWARD_PATTERN})(?:, (?:{COUNTRY_PATTERN}))?", re.IGNORECASE)
+
+
+class NormalizedAddress(NamedTuple):
+    street: str
+    city: str
+    postcode: str
+    valid_postcode: bool  # False if no valid postcode was found - postcode is then the best guess, or ""
+
+
+def is_valid_outward(code):
+    return OUTWARD_REGEX.fullmatch(code) is not None
+
+
+def is_valid_inward(code):
+    return INWARD_REGEX.fullmatch(code) is not None
+
+
+@functools.lru_cache(maxsize=65536)
+def normalise_postcode(text):
+    """
+    'ec1n7te' / 'EC1N  7TE' -> 'EC1N 7TE' - None if the text is not a valid UK postcode.
+    """
+    match = POSTCODE_REGEX.fullmatch(text.strip())
+    if match is None:
+        return None
+    outward, inward = match.groups()
+    if (outward.upper() == "GIR") != (inward.upper() == "0AA"):  # GIR only with 0AA (Girobank)
+        return None
+    return f"{outward.upper()} {inward.upper()}"
+
+
+@functools.lru_cache(maxsize=65536)
+def normalise_token(token):
+    """collapses whitespace and strips stray punctuation from a street / city token"""
+    return " ".join(token.split()).strip(" ,;")
+
+
+def find_postcode(text):
+    """(match start, match end, formatted postcode) of the last valid postcode in the text - None if none"""
+    found = None
+    for match in POSTCODE_REGEX.finditer(text):
+        postcode = normalise_postcode(match.group(0))
+        if postcode is not None:
+            found = (match.start(), match.end(), postcode)
+    return found
+
+
+def guess_postcode(words):
+    """
+    fallback for text without a valid postcode - the words containing a digit, as the original parser did.
+    :return: (postcode guess, remaining words)
+    """
+    postcode_words = [word for word in words if any(char.isdigit() for char in word)]
+    other_words = [word for word in words if word not in postcode_words]
+    guess = "".join(postcode_words).upper()
+    if len(guess) > 3:
+        guess = f"{guess[:-3]} {guess[-3:]}"
+    return guess, other_words
+
+
+def remove_city(street_parts, city):
+    """drops street parts that only repeat the city, and the city when it ends a street part ('... Road London')"""
+    if not city:
+        return street_parts
+    city_key = city.lower()
+    parts = []
+    for part in street_parts:
+        if part.lower() == city_key:
+            continue
+        if part.lower().endswith(" " + city_key):
+            part = part[:-len(city_key)].rstrip()
+        parts.append(part)
+    return parts
+
+
+class AddressNormalizer:
+    """
+    normalises UK address text to (street, city, postcode) - results of each distinct address text are memoized
+    (up to 'max_cached' addresses), so repeated calls over a growing dataset only parse the new addresses.
+    """
+    def __init__(self, max_cached=100000):
+        self.max_cached = max_cached
+        self.cache = {}
+
+    def normalise(self, address_text):
+        result = self.cache.get(address_text)
+        if result is None:
+            result = self.parse(address_text)
+            if len(self.cache) < self.max_cached:
+                self.cache[address_text] = result
+        return result
+
+    def normalise_many(self, address_texts):
+        """normalises a batch of address texts - list of NormalizedAddress in the same order"""
+        return [self.normalise(address_text) for address_text in address_texts]
+
+    def parse(self, address_text):
+        match = WELL_FORMED_REGEX.fullmatch(address_text)
+        if match is not None:
+            street, city, outward, inward = match.groups()
+            # the street parts joined as below - unless a part needs stripping of ';' or repeats the city
+            if ";" not in street and city.lower() not in street.lower():
+                return NormalizedAddress(" ".join(street.replace(",", " ").split()), city,
+                                         f"{outward.upper()} {inward.upper()}", True)
+
+        parts = [normalise_token(part) for part in address_text.split(",")]
+        parts = [part for part in parts if part]
+        while parts and parts[-1].lower() in COUNTRY_NAMES:  # '[-1]' is the country - not needed
+            parts.pop()
+        if not parts:
+            return NormalizedAddress("", "", "", False)
+
+        # postcode and city are usually the last part, but search backwards in case a district follows them
+        for position in range(len(parts) - 1, -1, -1):
+            found = find_postcode(parts[position])
+            if found is None:
+                continue
+            start, end, postcode = found
+            city = normalise_token(parts[position][:start] + " " + parts[position][end:])
+            street_parts = parts[:position]
+            if not city and street_parts and position == len(parts) - 1:
+                city = street_parts.pop()  # postcode on its own - the city is the part before it
+            elif not city and position < len(parts) - 1:
+                city = parts[position + 1]  # 'street, E1 6AN, London'
+            street = " ".join(remove_city(street_parts, city))
+            return NormalizedAddress(street, city, postcode, True)
+
+        # no valid postcode - fall back to the words containing a digit in the last part
+        guess, city_words = guess_postcode(parts[-1].split())
+        city = " ".join(city_words)
+        street = " ".join(remove_city(parts[:-1], city))
+        return NormalizedAddress(street, city, guess, False)
+
+
+default_normalizer = AddressNormalizer()  # shared by parse_uk_address
+
+
+def normalise_addresses(address_texts):
+    """normalises a batch of UK address texts with the shared normalizer"""
+    return default_normalizer.normalise_many(address_texts)
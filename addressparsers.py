@@ -0,0 +1,77 @@
+"""
+Per-country parsers for the cafe address text, e.g. "12 High Street, London E1 6AN, UK".
+Each parser returns (street, city, postcode) from the address text - the last comma separated part is always the
+country, the part before it holds the postcode and city.
+"""
+import re
+from addressnormalizer import default_normalizer
+
+
+def parse_uk_address(location_text):
+    """
+    UK address - postcode and city in either order ("London E1 6AN" / "E1 6AN London").
+    The postcode is found and validated with the UK postcode grammar in addressnormalizer.py, and formatted with a
+    space between the outward and inward codes.
+    """
+    street, city, postcode, _ = default_normalizer.normalise(location_text)
+    return street, city, postcode
+
+
+def make_postcode_city_parser(postcode_pattern):
+    """
+    returns a parser for countries writing the postcode before (or after) the city, e.g. "10115 Berlin".
+    :param postcode_pattern: regex of the country postcode format
+    """
+    postcode_regex = re.compile(rf"(?<![\w-])({postcode_pattern})(?![\w-])")
+
+    def parse_address(location_text):
+        parts = [part.strip() for part in location_text.split(',')][:-1]  # '[-1]' is the country - not needed
+        if not parts:
+            return "", "", ""
+
+        # postcode and city are usually the last part, but search backwards in case a district follows them
+        for position in range(len(parts) - 1, -1, -1):
+            match = postcode_regex.search(parts[position])
+            if match:
+                postcode = match.group(1)
+                city = (parts[position][:match.start()] + " " + parts[position][match.end():]).strip()
+                city = " ".join(city.split())
+                street = ", ".join(parts[:position])
+                return street, city, postcode
+
+        # no postcode found - last part is the city
+        return ", ".join(parts[:-1]), parts[-1], ""
+
+    return parse_address
+
+
+# postcode formats of the countries listed on europeancoffeetrip - countries not listed use the generic parser
+ADDRESS_PARSERS = {
+    "UK": parse_uk_address,
+    "AT": make_postcode_city_parser(r"\d{4}"),
+    "BE": make_postcode_city_parser(r"\d{4}"),
+    "CH": make_postcode_city_parser(r"\d{4}"),
+    "CZ": make_postcode_city_parser(r"\d{3} ?\d{2}"),
+    "DE": make_postcode_city_parser(r"\d{5}"),
+    "DK": make_postcode_city_parser(r"\d{4}"),
+    "ES": make_postcode_city_parser(r"\d{5}"),
+    "FI": make_postcode_city_parser(r"\d{5}"),
+    "FR": make_postcode_city_parser(r"\d{5}"),
+    "GR": make_postcode_city_parser(r"\d{3} ?\d{2}"),
+    "HU": make_postcode_city_parser(r"\d{4}"),
+    "IE": make_postcode_city_parser(r"[A-Z]\d[\dW] ?[0-9AC-FHKNPRTV-Y]{4}|D\d{1,2}"),
+    "IT": make_postcode_city_parser(r"\d{5}"),
+    "NL": make_postcode_city_parser(r"\d{4} ?[A-Z]{2}"),
+    "NO": make_postcode_city_parser(r"\d{4}"),
+    "PL": make_postcode_city_parser(r"\d{2}-\d{3}"),
+    "PT": make_postcode_city_parser(r"\d{4}-\d{3}"),
+    "SE": make_postcode_city_parser(r"\d{3} ?\d{2}"),
+    "SK": make_postcode_city_parser(r"\d{3} ?\d{2}"),
+}
+generic_address_parser = make_postcode_city_parser(r"[A-Z]{0,2}-?\d[\d\- ]{2,8}\d")
+
+
+def parse_address(location_text, country="UK"):
+    """returns (street, city, postcode) from the address text using the parser for the country"""
+    parser = ADDRESS_PARSERS.get(country, generic_address_parser)
+    return parser(location_text)
@@ -0,0 +1,129 @@
+"""
+Benchmark of the UK address normalizer (addressnormalizer.py) against the original character-by-character parser.
+Checks both on the tricky address corpus (fixtures/tricky_addresses.json), then times a batch of distinct addresses
+built from the corpus (each with its own unit number). The normalizer's memoized results and the postcode / token
+lru_caches are cleared before every run, so the rate is the cost of parsing each address once - the rate of a
+dataset parsed again (memoized) is not a speed-up of the parser.
+
+Usage:
+    python benchmarks/bench_addresses.py [--batch 20000] [--repeat 5]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from addressnormalizer import AddressNormalizer, normalise_postcode, normalise_token  # noqa: E402
+from standin_server import FIXTURES_DIR  # noqa: E402
+
+
+def original_parse_uk_address(location_text):
+    """the address parser CafeData.get_location used before the normalizer - kept for comparison"""
+    location_text = location_text.split(', ')[:-1]
+    postcode_city = location_text[-1].split(" ")
+    postcode = []
+    city = []
+    for text in postcode_city:
+        postcode_text = False
+        for char in text:
+            if char.isdigit():
+                postcode.append(text)
+                postcode_text = True
+                break
+        if not postcode_text:
+            city.append(text)
+    postcode_joined = "".join(postcode).strip()
+    postcode = postcode_joined[0:-3] + " " + postcode_joined[-3:]
+    city = " ".join(city).strip()
+    street = " ".join(location_text[:-1]).strip()
+    if "UK" in street:
+        street = street.replace("UK", "")
+    if city in street:
+        street = street.replace(city, "")
+    return street, city, postcode
+
+
+def load_corpus():
+    with open(os.path.join(FIXTURES_DIR, "tricky_addresses.json"), "r") as file:
+        return json.load(file)["addresses"]
+
+
+def check_corpus(corpus, parse):
+    """returns the corpus entries the parser gets wrong - (address, expected, got)"""
+    wrong = []
+    for entry in corpus:
+        expected = (entry["street"], entry["city"], entry["postcode"])
+        try:
+            got = tuple(parse(entry["address"])[:3])
+        except Exception as e:  # the original parser fails on some malformed text
+            got = repr(e)
+        if got != expected:
+            wrong.append((entry["address"], expected, got))
+    return wrong
+
+
+def distinct_addresses(corpus, count):
+    """count different addresses - the corpus addresses with a unit number in front"""
+    return [f"Unit {number // len(corpus) + 1}, {corpus[number % len(corpus)]['address']}" for number in range(count)]
+
+
+def clear_caches():
+    normalise_postcode.cache_clear()
+    normalise_token.cache_clear()
+
+
+def time_batch(parse_batch, addresses, repeat):
+    """best seconds of 'repeat' runs - the lru_caches are cleared before each"""
+    best = None
+    for _ in range(repeat):
+        clear_caches()
+        start = time.perf_counter()
+        parse_batch(addresses)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def safe_original(address):
+    try:
+        return original_parse_uk_address(address)
+    except IndexError:
+        return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="UK address normalizer benchmark")
+    parser.add_argument("--batch", type=int, default=20000, help="addresses per batch")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    corpus = load_corpus()
+    for name, parse in (("original", original_parse_uk_address), ("normalizer", AddressNormalizer().normalise)):
+        wrong = check_corpus(corpus, parse)
+        print(f"{name:<12}{len(corpus) - len(wrong)}/{len(corpus)} corpus addresses correct")
+        for address, expected, got in wrong:
+            print(f"    {address!r}\n        expected {expected}\n        got      {got}")
+
+    # the whole corpus, and only the well-formed addresses the original parser got right - the usual crawl case
+    original_wrong = {address for address, _, _ in check_corpus(corpus, original_parse_uk_address)}
+    batches = {
+        "": distinct_addresses(corpus, args.batch),
+        " (well-formed)": distinct_addresses([entry for entry in corpus if entry["address"] not in original_wrong],
+                                             args.batch),
+    }
+    results = {}
+    for label, addresses in batches.items():
+        results["original" + label] = time_batch(lambda batch: [safe_original(address) for address in batch],
+                                                 addresses, args.repeat)
+        # a new normalizer per run - no address is memoized before it is parsed
+        results["normalizer" + label] = time_batch(lambda batch: AddressNormalizer().normalise_many(batch),
+                                                   addresses, args.repeat)
+    print(f"\n{'parser':<28}{'addresses/s':>14}{'us/address':>12}")
+    for name, seconds in results.items():
+        print(f"{name:<28}{args.batch / seconds:>14.0f}{seconds / args.batch * 1e6:>12.2f}")
+    for label in batches:
+        print(f"normalizer{label} is {results['normalizer' + label] / results['original' + label]:.1f}x the time per "
+              f"address of the original")
@@ -0,0 +1,83 @@
+"""
+Start up cost of each cli.py stage - the modules a stage imports before it does any work, imported in a fresh
+interpreter. Compared with the modules main.py imported at load before the heavy imports were made lazy (selenium,
+requests, beautiful soup, tqdm, the staged pipeline and the stores).
+
+Reports the median wall time of 'python -c "import ..."' over --repeat runs, less the time of an empty interpreter,
+and the slowest imports of the stage (python -X importtime).
+
+Usage:
+    python benchmarks/bench_import_time.py [--repeat 10] [--top 3]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# stage: modules imported before the stage starts work
+STAGES = {
+    "query (csv)": ["cli", "workqueue"],
+    "query (sqlite)": ["cli", "resultstore"],
+    "export": ["cli", "workqueue", "writers"],
+    "geocode --offline": ["cli", "main", "extractCafeData", "geocache", "postcodeindex"],
+    "geocode": ["cli", "main", "extractCafeData", "geocache", "postcodeindex", "httpclient"],
+    "extract --from-archive": ["cli", "main", "geocache", "postcodeindex", "pipeline", "pagearchive", "bs4"],
+    "extract (resume)": ["cli", "main", "geocache", "postcodeindex", "httpclient", "tqdm"],
+    "extract --link": ["cli", "main", "geocache", "postcodeindex", "httpclient", "bs4"],
+    "extract --staged": ["cli", "main", "geocache", "postcodeindex", "httpclient", "tqdm", "pipeline", "bs4"],
+    "discover (http)": ["cli", "main", "geocache", "postcodeindex", "httpclient", "bs4"],
+    "discover (browser)": ["cli", "main", "geocache", "postcodeindex", "httpclient", "selenium.webdriver",
+                           "selenium.webdriver.support.ui", "selenium.webdriver.firefox.options"],
+    # what 'import main' cost before the lazy imports
+    "main.py eager imports": ["main", "httpclient", "geocache", "postcodeindex", "resultstore", "regions", "workqueue",
+                              "tqdm", "pipeline", "bs4", "selenium.webdriver", "selenium.webdriver.support.ui",
+                              "selenium.webdriver.firefox.options"],
+}
+INTERPRETER_MODULES = {"site", "encodings", "_frozen_importlib_external"}  # imported by the empty interpreter too
+
+
+def run_python(code, importtime=False):
+    """seconds to run the code in a fresh interpreter - and stderr, for -X importtime"""
+    command = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", code]
+    start = time.perf_counter()
+    result = subprocess.run(command, cwd=PACKAGE_DIR, capture_output=True, text=True, check=True)
+    return time.perf_counter() - start, result.stderr
+
+
+def median_seconds(code, repeat):
+    return statistics.median(run_python(code)[0] for _ in range(repeat))
+
+
+def slowest_imports(code, top):
+    """(cumulative microseconds, module) of the slowest top level imports of the code"""
+    _, stderr = run_python(code, importtime=True)
+    imports = []
+    for line in stderr.splitlines():
+        parts = line.split("|")
+        if len(parts) == 3 and parts[1].strip().isdigit() and not parts[2].startswith("   "):
+            # top level imports - one space of indent after the '|'
+            module = parts[2].strip()
+            if module not in INTERPRETER_MODULES and int(parts[1]) >= 1000:  # 1 ms or more
+                imports.append((int(parts[1]), module))
+    return sorted(imports, reverse=True)[:top]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import time of each cli.py stage")
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--top", type=int, default=3, help="slowest imports listed for each stage")
+    args = parser.parse_args()
+
+    interpreter = median_seconds("pass", args.repeat)
+    print(f"empty interpreter {interpreter * 1000:.0f} ms (subtracted)\n")
+    print(f"{'stage':<24}{'import ms':>10}  slowest imports")
+    for stage, modules in STAGES.items():
+        code = "; ".join(f"import {module}" for module in modules)
+        seconds = median_seconds(code, args.repeat) - interpreter
+        slowest = ", ".join(f"{module} {microseconds / 1000:.0f}"
+                            for microseconds, module in slowest_imports(code, args.top))
+        print(f"{stage:<24}{seconds * 1000:>10.0f}  {slowest}")
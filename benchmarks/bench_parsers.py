@@ -0,0 +1,75 @@
+"""
+Micro-benchmark of the cafe page parser backends (parsers.py) on saved cafe pages.
+Parses each page with every backend, runs the CafeData extractors (no geocoding), checks the extracted data is
+identical to the original 'html.parser' backend and reports the mean time per page.
+
+Usage:
+    python benchmarks/bench_parsers.py saved_pages_dir [--repeat 5]
+saved_pages_dir holds cafe pages saved as .html files.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from extractCafeData import CafeData  # noqa: E402
+from parsers import BACKENDS, LXML_AVAILABLE, parse_cafe_page  # noqa: E402
+
+
+def extract_fields(page_html, backend):
+    """parses and extracts the page data without geocoding - returns the extracted values"""
+    cafe = CafeData(parse_cafe_page(page_html, backend), 0, "", None, False)
+    cafe.get_name()
+    cafe.get_opening()
+    cafe.get_services()
+    cafe.get_location()
+    return (cafe.name, cafe.city, cafe.street_location, cafe.opening, cafe.postcode, cafe.wifi,
+            cafe.laptop_friendly, cafe.pet_friendly)
+
+
+def load_pages(pages_dir):
+    pages = []
+    for filename in sorted(os.listdir(pages_dir)):
+        if filename.endswith(".html"):
+            with open(os.path.join(pages_dir, filename), "r", encoding="utf-8") as file:
+                pages.append((filename, file.read()))
+    return pages
+
+
+def run_benchmark(pages, repeat):
+    backends = [backend for backend in BACKENDS if backend != "lxml" or LXML_AVAILABLE]
+    expected = {filename: extract_fields(page_html, "html.parser") for filename, page_html in pages}
+
+    results = {}
+    for backend in backends:
+        # check output identical to the original backend
+        for filename, page_html in pages:
+            if extract_fields(page_html, backend) != expected[filename]:
+                raise AssertionError(f"{backend} extracted different data from {filename}")
+
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for _, page_html in pages:
+                extract_fields(page_html, backend)
+        results[backend] = (time.perf_counter() - start) / (repeat * len(pages))
+
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare cafe page parser backends")
+    parser.add_argument("pages_dir")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    saved_pages = load_pages(args.pages_dir)
+    if not saved_pages:
+        sys.exit(f"No .html pages found in {args.pages_dir}")
+
+    timings = run_benchmark(saved_pages, args.repeat)
+    baseline = timings["html.parser"]
+    print(f"{len(saved_pages)} pages, {args.repeat} repeats - output identical for all backends")
+    for backend_name, mean_time in timings.items():
+        print(f"{backend_name:>12}: {mean_time * 1000:8.2f} ms/page  ({baseline / mean_time:.1f}x)")
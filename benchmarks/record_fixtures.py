@@ -0,0 +1,65 @@
+"""
+Records real cafe pages and their geocode responses into benchmarks/fixtures, for the stand-in server to replay.
+Pages are saved to fixtures/pages/<cafe slug>.html and geocode responses are added to fixtures/geocode.json.
+Requests are made at most one per 2 seconds (site) / 1 per second (Nominatim) - as the scraper does.
+
+Usage:
+    python benchmarks/record_fixtures.py cafes_links.txt --count 20
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from urllib.parse import urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import extractCafeData  # noqa: E402
+from extractCafeData import CafeData  # noqa: E402
+from httpclient import get_client  # noqa: E402
+from parsers import parse_cafe_page  # noqa: E402
+from standin_server import FIXTURES_DIR  # noqa: E402
+
+
+def record_fixtures(links, fixtures_dir=FIXTURES_DIR):
+    pages_dir = os.path.join(fixtures_dir, "pages")
+    os.makedirs(pages_dir, exist_ok=True)
+    geocode_filename = os.path.join(fixtures_dir, "geocode.json")
+    with open(geocode_filename, "r") as file:
+        geocodes = json.load(file)
+
+    for link in links:
+        slug = urlparse(link).path.strip("/").split("/")[-1]
+        response = get_client().get(link)
+        with open(os.path.join(pages_dir, f"{slug}.html"), "w", encoding="utf-8") as file:
+            file.write(response.text)
+        time.sleep(2)
+
+        try:
+            cafe = CafeData(parse_cafe_page(response.text), 0, link, None, False)
+            cafe.get_location()
+        except AttributeError:
+            print(f"{slug}: no address - page saved without a geocode response")
+            continue
+        if cafe.postcode and cafe.postcode not in geocodes:
+            geocode_response = get_client().get(extractCafeData.nominatim_url, params={
+                'postalcode': cafe.postcode, 'country': cafe.country, 'format': 'json', 'addressdetails': 1},
+                headers={'User-Agent': os.getenv("OSM_USER_AGENT")})
+            geocodes[cafe.postcode] = geocode_response.json()
+            time.sleep(1)
+        print(f"{slug}: recorded")
+
+    with open(geocode_filename, "w") as file:
+        json.dump(geocodes, file, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Record cafe pages and geocode responses as benchmark fixtures")
+    parser.add_argument("links_filename")
+    parser.add_argument("--count", type=int, default=20, help="number of cafe links to record")
+    args = parser.parse_args()
+
+    with open(args.links_filename, "r") as links_file:
+        cafe_links = [line.strip() for line in links_file if line.strip()][:args.count]
+    record_fixtures(cafe_links)
@@ -0,0 +1,244 @@
+"""
+Offline scraper benchmarks against the local stand-in server (standin_server.py) - no requests to
+europeancoffeetrip.com or Nominatim.
+
+Reports links/sec, p50 / p99 per-link latency and peak memory (tracemalloc, measured in a separate pass so it does
+not slow the timed pass) for:
+    discover            ExtractCafeLinks.discover_links_http over the listing page
+    geocode_address     each fixture address geocoded (no cache)
+    extract_all_data    CafeData.extract_all_data on pre-fetched pages (parse + extract + geocode)
+    create_cafe_data    the full fetch / extract / save pipeline
+    staged_pipeline     create_cafe_data with the staged process pool pipeline (pipeline.py) - per-link latency is
+                        the mean, as links are not fetched and extracted in one call
+
+Usage:
+    python benchmarks/run_benchmarks.py --links 200 --workers 4 --latency 0.05 --rate-429 0.01 --json results.json
+    python benchmarks/run_benchmarks.py --baseline results.json --tolerance 0.2   # exits 1 on a regression
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import extractCafeData  # noqa: E402
+import main  # noqa: E402
+from cafelinks import ExtractCafeLinks  # noqa: E402
+from extractCafeData import CafeData, geocode_address  # noqa: E402
+from httpclient import HttpClient, get_client, use_client  # noqa: E402
+from parsers import parse_cafe_page  # noqa: E402
+from ratelimit import AdaptiveRateLimiter  # noqa: E402
+from standin_server import StandInServer  # noqa: E402
+
+
+def percentile(sorted_values, fraction):
+    """nearest-rank percentile of already sorted values"""
+    if not sorted_values:
+        return None
+    rank = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[rank]
+
+
+def summarise(name, latencies, total_seconds, peak_bytes):
+    latencies = sorted(latencies)
+    return {
+        "name": name,
+        "links": len(latencies),
+        "seconds": round(total_seconds, 4),
+        "links_per_sec": round(len(latencies) / total_seconds, 2) if total_seconds else None,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3) if latencies else None,
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3) if latencies else None,
+        "peak_memory_mb": round(peak_bytes / 1e6, 2) if peak_bytes is not None else None,
+    }
+
+
+def measure(name, workload, memory=True):
+    """
+    runs the workload (returns a list of per-link latencies) timed, then again under tracemalloc for peak memory.
+    """
+    start = time.perf_counter()
+    latencies = workload()
+    total_seconds = time.perf_counter() - start
+
+    peak_bytes = None
+    if memory:
+        tracemalloc.start()
+        workload()
+        peak_bytes = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    return summarise(name, latencies, total_seconds, peak_bytes)
+
+
+def discover_workload(server):
+    def workload():
+        scraper = ExtractCafeLinks("unused.txt")
+        scraper.cafe_website = f"{server.base_url}/uk/"
+        scraper.individual_cafe_hyperlink_prefix = f"{server.base_url}/cafe/"
+        start = time.perf_counter()
+        scraper.discover_links_http()
+        elapsed = time.perf_counter() - start
+        # latency per link discovered
+        return [elapsed / len(scraper.cafe_hyperlink_list)] * len(scraper.cafe_hyperlink_list)
+    return workload
+
+
+def geocode_workload(server):
+    def workload():
+        latencies = []
+        for number in range(server.fixtures.link_count):
+            cafe = CafeData(parse_cafe_page(server.fixtures.cafe_page(f"cafe-{number}")), 0, "", None, False)
+            cafe.get_location()
+            start = time.perf_counter()
+            geocode_address(cafe.postcode, street=cafe.street_location, city=cafe.city)
+            latencies.append(time.perf_counter() - start)
+        return latencies
+    return workload
+
+
+def extract_workload(server):
+    links = server.cafe_links()
+    pages = [get_client().get(link).text for link in links]  # fetched before timing
+
+    def workload():
+        latencies = []
+        for number, page_html in enumerate(pages):
+            start = time.perf_counter()
+            try:
+                CafeData(parse_cafe_page(page_html, main.html_parser_backend), number, links[number], None,
+                         False).extract_all_data()
+            except AttributeError:
+                pass  # failure injected page - counted with its latency
+            latencies.append(time.perf_counter() - start)
+        return latencies
+    return workload
+
+
+def create_cafe_data_workload(server, workers, requests_per_second):
+    links = server.cafe_links()
+
+    def workload():
+        latencies = []
+        fetch_cafe_data = main.fetch_cafe_data
+
+        def timed_fetch_cafe_data(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fetch_cafe_data(*args, **kwargs)
+            finally:
+                latencies.append(time.perf_counter() - start)
+
+        with tempfile.TemporaryDirectory() as work_dir:
+            links_filename = os.path.join(work_dir, "cafes_links.txt")
+            with open(links_filename, "w") as file:
+                file.write("\n".join(links) + "\n")
+            main.fetch_cafe_data = timed_fetch_cafe_data
+            try:
+                main.create_cafe_data(links_filename, os.path.join(work_dir, "all_cafes_csv.csv"), workers=workers,
+                                      requests_per_second=requests_per_second, detailed_report=False)
+            finally:
+                main.fetch_cafe_data = fetch_cafe_data
+        return latencies
+    return workload
+
+
+def staged_pipeline_workload(server, workers, requests_per_second):
+    links = server.cafe_links()
+
+    def workload():
+        with tempfile.TemporaryDirectory() as work_dir:
+            links_filename = os.path.join(work_dir, "cafes_links.txt")
+            with open(links_filename, "w") as file:
+                file.write("\n".join(links) + "\n")
+            start = time.perf_counter()
+            main.create_cafe_data(links_filename, os.path.join(work_dir, "all_cafes_csv.csv"), workers=workers,
+                                  requests_per_second=requests_per_second, detailed_report=False, staged=True)
+            elapsed = time.perf_counter() - start
+        return [elapsed / len(links)] * len(links)
+    return workload
+
+
+def check_regressions(results, baseline, tolerance):
+    """returns a list of regressions - throughput lower, or p99 latency higher, than the baseline by 'tolerance'"""
+    regressions = []
+    baseline_results = {result["name"]: result for result in baseline["results"]}
+    for result in results:
+        previous = baseline_results.get(result["name"])
+        if previous is None:
+            continue
+        if previous["links_per_sec"] and result["links_per_sec"] < previous["links_per_sec"] * (1 - tolerance):
+            regressions.append(f"{result['name']}: links/sec {result['links_per_sec']} "
+                               f"(baseline {previous['links_per_sec']})")
+        if previous["p99_ms"] and result["p99_ms"] > previous["p99_ms"] * (1 + tolerance):
+            regressions.append(f"{result['name']}: p99 {result['p99_ms']} ms (baseline {previous['p99_ms']} ms)")
+    return regressions
+
+
+def run_benchmarks(args):
+    server = StandInServer(latency=args.latency, jitter=args.jitter, rate_429=args.rate_429,
+                           failure_rate=args.failure_rate, link_count=args.links)
+    benchmarks = {
+        "discover": lambda: discover_workload(server),
+        "geocode_address": lambda: geocode_workload(server),
+        "extract_all_data": lambda: extract_workload(server),
+        "create_cafe_data": lambda: create_cafe_data_workload(server, args.workers, args.rps),
+        "staged_pipeline": lambda: staged_pipeline_workload(server, args.workers, args.rps),
+    }
+    selected = args.only or list(benchmarks)
+
+    results = []
+    with server:
+        extractCafeData.nominatim_url = f"{server.base_url}/search"
+        use_client(HttpClient(timeout=main.request_timeout, retries=main.request_retries, pool_size=args.workers,
+                              rate_limiter=AdaptiveRateLimiter(args.rps, args.rps)))
+        for name in selected:
+            results.append(measure(name, benchmarks[name](), memory=not args.no_memory))
+        server_counts = dict(server.counts)
+
+    return {
+        "settings": {"links": args.links, "workers": args.workers, "rps": args.rps, "latency": args.latency,
+                     "jitter": args.jitter, "rate_429": args.rate_429, "failure_rate": args.failure_rate},
+        "server_responses": server_counts,
+        "results": results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline scraper benchmarks against a local stand-in server")
+    parser.add_argument("--links", type=int, default=100, help="number of cafe links served")
+    parser.add_argument("--workers", type=int, default=main.fetch_workers)
+    parser.add_argument("--rps", type=float, default=1000.0, help="per host requests per second limit")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--rate-429", type=float, default=0.0, help="fraction of 429 responses")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="fraction of 500 / dropped connections")
+    parser.add_argument("--only", nargs="+", choices=["discover", "geocode_address", "extract_all_data",
+                                                      "create_cafe_data", "staged_pipeline"])
+    parser.add_argument("--no-memory", action="store_true", help="skip the peak memory pass")
+    parser.add_argument("--json", help="save the results to this file")
+    parser.add_argument("--baseline", help="results file to compare against - exits 1 on a regression")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed fraction worse than the baseline")
+    args = parser.parse_args()
+
+    report = run_benchmarks(args)
+    print(f"\n{'benchmark':<18}{'links':>7}{'links/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'peak MB':>10}")
+    for result in report["results"]:
+        print(f"{result['name']:<18}{result['links']:>7}{result['links_per_sec']:>10}{result['p50_ms']:>10}"
+              f"{result['p99_ms']:>10}{str(result['peak_memory_mb']):>10}")
+    print(f"server responses: {report['server_responses']}")
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(report, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, "r") as file:
+            regressions = check_regressions(report["results"], json.load(file), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
@@ -0,0 +1,209 @@
+"""
+Local stand-in for europeancoffeetrip.com and the Nominatim search api, replaying the fixtures in
+benchmarks/fixtures so the scraper can be measured without hitting the real sites.
+
+Routes:
+    /uk/                listing page - the first cafes, and a 'load more' button pointing at /uk/more/
+    /uk/more/           the remaining cafes
+    /cafe/<slug>/       cafe page - fixtures/pages/<slug>.html if recorded, else rendered from fixtures/cafe_page.html
+                        (with an ETag - a 304 for a matching If-None-Match)
+    /search             geocode response for the 'postalcode' parameter from fixtures/geocode.json
+
+Failure injection: every response waits 'latency' seconds (+/- jitter), and a fraction of requests get a 429 with a
+Retry-After header, or fail with a 500 / dropped connection.
+
+Run on its own:
+    python benchmarks/standin_server.py --port 8700 --links 500 --latency 0.05 --rate-429 0.02
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from string import Template
+from urllib.parse import parse_qs, urlparse
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+DAYS = 7
+
+
+class Fixtures:
+    """the recorded / template pages and geocode responses"""
+    def __init__(self, fixtures_dir=FIXTURES_DIR, link_count=100):
+        self.fixtures_dir = fixtures_dir
+        self.link_count = link_count
+        with open(os.path.join(fixtures_dir, "cafe_page.html"), "r", encoding="utf-8") as file:
+            self.cafe_template = Template(file.read())
+        with open(os.path.join(fixtures_dir, "listing.html"), "r", encoding="utf-8") as file:
+            self.listing_template = Template(file.read())
+        with open(os.path.join(fixtures_dir, "addresses.json"), "r") as file:
+            self.cafes = json.load(file)["cafes"]
+        with open(os.path.join(fixtures_dir, "geocode.json"), "r") as file:
+            self.geocodes = json.load(file)
+        self.pages_dir = os.path.join(fixtures_dir, "pages")
+
+    def cafe_slugs(self):
+        """recorded pages first, then template pages up to link_count"""
+        recorded = []
+        if os.path.isdir(self.pages_dir):
+            recorded = sorted(filename[:-5] for filename in os.listdir(self.pages_dir) if filename.endswith(".html"))
+        template_slugs = [f"cafe-{number}" for number in range(max(0, self.link_count - len(recorded)))]
+        return (recorded + template_slugs)[:self.link_count]
+
+    def cafe_page(self, slug):
+        """recorded page if saved, else the template filled with one of the fixture addresses"""
+        recorded = os.path.join(self.pages_dir, f"{slug}.html")
+        if os.path.exists(recorded):
+            with open(recorded, "r", encoding="utf-8") as file:
+                return file.read()
+        number = int(slug.rsplit("-", 1)[-1]) if slug.rsplit("-", 1)[-1].isdigit() else 0
+        cafe = self.cafes[number % len(self.cafes)]
+        hours = {f"hours_{day}": ("8am-5pm" if day < 5 else "9am-4pm") for day in range(DAYS)}
+        if number % 3 == 0:
+            hours["hours_6"] = "Closed"
+        services = []
+        if number % 2 == 0:
+            services.append('          <tr><td><i class="icon-wifi"></i></td><td>Free Wi-Fi</td></tr>')
+        if number % 3 != 1:
+            services.append('          <tr><td><i class="icon-laptop"></i></td><td>Laptop Friendly</td></tr>')
+        if number % 4 == 0:
+            services.append('          <tr><td><i class="icon-dog"></i></td><td>Dog Friendly</td></tr>')
+        return self.cafe_template.substitute(name=f"fixture cafe {number}", address=cafe["address"],
+                                             services="\n".join(services), **hours)
+
+    def listing_page(self, base_url, first_count):
+        anchors = "\n".join(f'      <a href="{base_url}/cafe/{slug}/">{slug}</a>'
+                            for slug in self.cafe_slugs()[:first_count])
+        return self.listing_template.substitute(first_cafes=anchors)
+
+    def more_cafes(self, base_url, first_count):
+        return "\n".join(f'<a href="{base_url}/cafe/{slug}/">{slug}</a>' for slug in self.cafe_slugs()[first_count:])
+
+    def geocode(self, postcode):
+        return self.geocodes.get(postcode, [])
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive connections, like the real sites
+
+    def log_message(self, format, *args):  # no request logging - it would distort the benchmark
+        pass
+
+    def do_GET(self):
+        settings = self.server.settings
+        delay = settings["latency"] + random.uniform(-settings["jitter"], settings["jitter"])
+        if delay > 0:
+            time.sleep(delay)
+
+        roll = random.random()
+        if roll < settings["rate_429"]:
+            self.server.count("429")
+            return self.send_body(429, "Too Many Requests", "text/plain", {"Retry-After": "1"})
+        roll -= settings["rate_429"]
+        if roll < settings["failure_rate"]:
+            self.server.count("failure")
+            if random.random() < 0.5:
+                self.close_connection = True  # dropped connection
+                self.connection.shutdown(2)
+                return
+            return self.send_body(500, "Internal Server Error", "text/plain")
+
+        url = urlparse(self.path)
+        fixtures = self.server.fixtures
+        base_url = f"http://{self.headers.get('Host')}"
+        first_count = settings["first_cafes"]
+        self.server.count("ok")
+        if url.path == "/uk/":
+            return self.send_body(200, fixtures.listing_page(base_url, first_count), "text/html")
+        if url.path == "/uk/more/":
+            return self.send_body(200, fixtures.more_cafes(base_url, first_count), "text/html")
+        if url.path.startswith("/cafe/"):
+            page = fixtures.cafe_page(url.path.strip("/").split("/")[-1])
+            etag = f'"{hashlib.sha1(page.encode("utf-8")).hexdigest()}"'
+            if self.headers.get("If-None-Match") == etag:
+                self.server.count("not_modified")
+                return self.send_body(304, "", "text/html", {"ETag": etag})
+            return self.send_body(200, page, "text/html", {"ETag": etag})
+        if url.path == "/search":
+            postcode = parse_qs(url.query).get("postalcode", [""])[0]
+            return self.send_body(200, json.dumps(fixtures.geocode(postcode)), "application/json")
+        return self.send_body(404, "Not Found", "text/plain")
+
+    def send_body(self, status, body, content_type, headers=None):
+        data = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", f"{content_type}; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class StandInServer(ThreadingHTTPServer):
+    """
+    :param latency: seconds added to every response
+    :param jitter: random +/- seconds added to the latency
+    :param rate_429: fraction of requests answered with 429 Too Many Requests
+    :param failure_rate: fraction of requests answered with a 500 or a dropped connection
+    :param link_count: number of cafe links on the listing page
+    """
+    daemon_threads = True
+
+    def __init__(self, port=0, latency=0.0, jitter=0.0, rate_429=0.0, failure_rate=0.0, link_count=100,
+                 fixtures_dir=FIXTURES_DIR):
+        super().__init__(("127.0.0.1", port), StandInHandler)
+        self.fixtures = Fixtures(fixtures_dir, link_count)
+        self.settings = {"latency": latency, "jitter": jitter, "rate_429": rate_429, "failure_rate": failure_rate,
+                         "first_cafes": min(24, link_count)}
+        self.counts = {}
+        self.counts_lock = threading.Lock()
+        self.thread = None
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def count(self, outcome):
+        with self.counts_lock:
+            self.counts[outcome] = self.counts.get(outcome, 0) + 1
+
+    def cafe_links(self):
+        return [f"{self.base_url}/cafe/{slug}/" for slug in self.fixtures.cafe_slugs()]
+
+    def start(self):
+        """serves in a background thread"""
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the benchmark fixtures as a local stand-in site")
+    parser.add_argument("--port", type=int, default=8700)
+    parser.add_argument("--links", type=int, default=100, help="number of cafe links on the listing page")
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--rate-429", type=float, default=0.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = StandInServer(args.port, args.latency, args.jitter, args.rate_429, args.failure_rate, args.links)
+    print(f"Stand-in server on {server.base_url} - listing page {server.base_url}/uk/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
@@ -1,20 +1,128 @@
 """
-Extracts all hyperlinks of individual cafes from europeancoffeetrip website
+Extracts all hyperlinks of individual cafes from europeancoffeetrip website.
+By default the links are read over plain HTTP from the listing page and its 'load more' data source - the headless
+Firefox (selenium) path is used as a fallback, or if discovery_mode is "browser".
+The lean browser mode blocks images, css, fonts and other hosts, and reads the cafe links with a script in the page
+instead of copying the whole page html out of the browser.
+Selenium, beautiful soup and requests are only imported when used - so importing this module is cheap when the links
+file already exists.
 """
-from bs4 import BeautifulSoup
-import time
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException, ElementClickInterceptedException, ElementNotInteractableException
-from selenium.webdriver.firefox.options import Options
+from urllib.parse import urljoin, quote
 import os
+import queue
+import threading
+
+LEAN_ALLOWED_HOSTS = ["europeancoffeetrip.com"]  # hosts (and their subdomains) the lean browser may load from
+
+# cafe hrefs of the listing containers - run in the page, so only the links leave the browser
+CAFE_LINKS_SCRIPT = """
+const [containerIds, prefix] = arguments;
+const links = [];
+for (const id of containerIds) {
+    const container = document.getElementById(id);
+    if (!container) continue;
+    for (const anchor of container.querySelectorAll("a[href]")) {
+        const href = anchor.getAttribute("href");
+        if (href.startsWith(prefix)) links.push(href);
+    }
+}
+return links;
+"""
+ANCHOR_COUNT_SCRIPT = """
+return arguments[0].reduce((total, id) => {
+    const container = document.getElementById(id);
+    return total + (container ? container.querySelectorAll("a[href]").length : 0);
+}, 0);
+"""
+
+
+class LinkDiscoveryError(Exception):
+    """the cafe links could not be read from the listing page over HTTP"""
+
+
+def blocking_pac_url(allowed_hosts):
+    """
+    proxy auto-config url sending requests to the allowed hosts direct, and every other host to a closed local port -
+    so third party scripts, trackers and ads fail straight away
+    """
+    conditions = " || ".join(f'dnsDomainIs(host, ".{host}") || host == "{host}"' for host in allowed_hosts)
+    pac = f"function FindProxyForURL(url, host) {{ return ({conditions}) ? 'DIRECT' : 'PROXY 127.0.0.1:9'; }}"
+    return f"data:application/x-ns-proxy-autoconfig,{quote(pac)}"
+
+
+def create_firefox_driver(lean=False):
+    """
+    starts a headless firefox browser.
+    :param lean: block images, css, fonts and hosts other than LEAN_ALLOWED_HOSTS, and return from page loads once
+    the html is ready rather than waiting for every resource
+    """
+    from selenium import webdriver  # selenium only imported when a browser is started
+    from selenium.webdriver.firefox.options import Options
+    firefox_options = Options()
+    firefox_options.add_argument("--disable-extensions")
+    firefox_options.add_argument("--headless")
+    firefox_options.set_preference("dom.push.enabled", False)
+    if lean:
+        firefox_options.page_load_strategy = "eager"
+        firefox_options.set_preference("permissions.default.image", 2)  # 2 - blocked
+        firefox_options.set_preference("permissions.default.stylesheet", 2)
+        firefox_options.set_preference("gfx.downloadable_fonts.enabled", False)
+        firefox_options.set_preference("browser.display.use_document_fonts", 0)
+        firefox_options.set_preference("media.autoplay.default", 5)  # 5 - all media blocked
+        firefox_options.set_preference("network.prefetch-next", False)
+        firefox_options.set_preference("network.dns.disablePrefetch", True)
+        firefox_options.set_preference("network.http.speculative-parallel-limit", 0)
+        firefox_options.set_preference("network.proxy.type", 2)  # 2 - proxy auto-config
+        firefox_options.set_preference("network.proxy.autoconfig_url", blocking_pac_url(LEAN_ALLOWED_HOSTS))
+    return webdriver.Firefox(options=firefox_options)  # path to gecko driver already on path
+
+
+class BrowserPool:
+    """
+    bounded pool of reusable headless browsers shared between worker threads - browsers are only started when first
+    needed, at most 'size' are open, and all are closed with the pool.
+    :param lean: start lean browsers (see create_firefox_driver)
+    """
+    def __init__(self, size, lean=False):
+        self.size = size
+        self.lean = lean
+        self.available = queue.Queue()
+        self.drivers = []
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """returns a free browser - starting a new one if below the pool size, else waits for one to be released"""
+        try:
+            return self.available.get_nowait()
+        except queue.Empty:
+            pass
+        with self.lock:
+            if len(self.drivers) < self.size:
+                driver = create_firefox_driver(self.lean)
+                self.drivers.append(driver)
+                return driver
+        return self.available.get()
+
+    def release(self, driver):
+        self.available.put(driver)
+
+    def close(self):
+        with self.lock:
+            for driver in self.drivers:
+                driver.quit()
+            self.drivers = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
 
 
 class ExtractCafeLinks:
 
-    def __init__(self, result_txt_filename):
+    def __init__(self, result_txt_filename, discovery_mode="http", browser_pool=None, lean_browser=False,
+                 overwrite_links=None):
         self.cafe_website = "https://europeancoffeetrip.com/uk/"
         self.more_cafes_button_id = "cg-more"
         self.initial_cafes_id = "first-cafes"
@@ -25,32 +133,154 @@ class ExtractCafeLinks:
         self.cafe_hyperlink_list = None  # holds all hyperlink to individual cafes
         self.driver = None
         self.txt_file_name = result_txt_filename
+        self.discovery_mode = discovery_mode  # "http" (browser fallback) or "browser"
+        self.browser_pool = browser_pool  # shared BrowserPool - a browser is started for this scraper if None
+        # lean browser - resources blocked, links read in the page (a pooled browser is lean if its pool is)
+        self.lean_browser = browser_pool.lean if browser_pool is not None else lean_browser
+        self.ajax_url = "https://europeancoffeetrip.com/wp-admin/admin-ajax.php"  # default 'load more' endpoint
+        # answer to 'delete and update the previous links file' without asking (unattended runs) - asked if None.
+        # The file name is then not asked for either
+        self.overwrite_links = overwrite_links
+        self.max_load_more_pages = 100  # most 'load more' data source requests / browser button clicks
 
     def run_webscraping(self):
         run = self.check_if_existing_file()
         if run:
+            self.discover_links()
+            self.save_cafelinks_to_txt()
+
+    def discover_links(self):
+        """gets all the cafe links from the website (without saving) - returns the list of links"""
+        import requests
+        if self.discovery_mode == "http":
+            try:
+                self.discover_links_http()
+            except (LinkDiscoveryError, requests.exceptions.RequestException) as e:
+                print(f"HTTP link discovery failed ({e}) - using browser")
+                self.run_browser_discovery()
+        else:
+            self.run_browser_discovery()
+        return self.cafe_hyperlink_list
+
+    def run_browser_discovery(self):
+        """loads the listing page in headless firefox, clicks 'load more' and extracts the links"""
+        if self.browser_pool is None:
             self.setup_geckodriver() # 1
+        else:
+            self.driver = self.browser_pool.acquire()  # 1 - reuse a pooled browser
+        try:
             self.open_website()  # 2
             self.load_more_cafes() # 3
-            self.check_additional_cafes_loaded()  # 4
-            self.get_all_links()  # 5
-            self.save_cafelinks_to_txt()
+            if self.lean_browser:
+                self.get_all_links_in_browser()  # 4 - only the links leave the browser
+            else:
+                self.check_additional_cafes_loaded()  # 4
+                self.get_all_links()  # 5
+        finally:
+            if self.browser_pool is not None:
+                self.browser_pool.release(self.driver)
+                self.driver = None
+
+    def discover_links_http(self):
+        """
+        reads the cafe links without a browser. The initial cafes are in the listing page html. The additional cafes
+        are either already in the page (hidden until 'load more' is clicked) or loaded from the data source given by
+        the 'load more' button attributes.
+        """
+        from bs4 import BeautifulSoup, SoupStrainer
+        from httpclient import get_client
+        response = get_client().get(self.cafe_website)
+        response.raise_for_status()
+        # only build the cafe containers and the 'load more' button
+        page = BeautifulSoup(response.text, 'html.parser', parse_only=SoupStrainer(
+            id=[self.initial_cafes_id, self.additional_cafes_loaded_id, self.more_cafes_button_id]))
+
+        first_cafes_container = page.find(id=self.initial_cafes_id)
+        if first_cafes_container is None:
+            raise LinkDiscoveryError(f"no '{self.initial_cafes_id}' container in {self.cafe_website}")
+        first_cafes_anchors = first_cafes_container.find_all('a', href=True)
+
+        second_cafes_container = page.find(id=self.additional_cafes_loaded_id)
+        if second_cafes_container is not None:
+            second_cafes_anchors = second_cafes_container.find_all('a', href=True)
+        else:
+            second_cafes_anchors = self.load_more_cafes_http(page.find(id=self.more_cafes_button_id))
+
+        self.cafe_hyperlink_list = self.extract_anchor_links(first_cafes_anchors, second_cafes_anchors)
+        print(f"{len(self.cafe_hyperlink_list)} cafe links obtained over HTTP")
+
+    def load_more_cafes_http(self, load_more_button):
+        """
+        requests the additional cafes from the 'load more' data source - a url on the button (data-url, data-href or
+        href) or a WordPress ajax action (data-action with the other data-* attributes as parameters).
+        Pages through the source while the button has a page attribute and new cafes are returned.
+        """
+        from bs4 import BeautifulSoup, SoupStrainer
+        from httpclient import get_client
+        if load_more_button is None:
+            raise LinkDiscoveryError("no additional cafes container or 'load more' button in the page")
+
+        attributes = {name[5:]: value for name, value in load_more_button.attrs.items() if name.startswith("data-")}
+        source_url = attributes.pop("url", None) or attributes.pop("href", None) or load_more_button.get("href")
+        if not source_url and "action" not in attributes:
+            raise LinkDiscoveryError("'load more' button has no data source attributes")
+
+        page_key = next((key for key in ("page", "paged") if key in attributes), None)
+        if page_key is not None and not str(attributes[page_key]).strip().isdigit():
+            raise LinkDiscoveryError(f"'load more' button has a non numeric {page_key}: {attributes[page_key]!r}")
+        all_anchors = []
+        seen_links = set()
+        for _ in range(self.max_load_more_pages):
+            if source_url:
+                response = get_client().get(urljoin(self.cafe_website, source_url), params=attributes or None)
+            else:
+                response = get_client().post(self.ajax_url, data=attributes)
+            response.raise_for_status()
+
+            anchors = BeautifulSoup(self.get_fragment_html(response), 'html.parser',
+                                    parse_only=SoupStrainer('a', href=True)).find_all('a')
+            new_anchors = [anchor for anchor in anchors if anchor['href'] not in seen_links]
+            if not new_anchors or page_key is None:
+                all_anchors.extend(new_anchors)
+                break
+            all_anchors.extend(new_anchors)
+            seen_links.update(anchor['href'] for anchor in new_anchors)
+            attributes[page_key] = str(int(attributes[page_key]) + 1)  # next page
+
+        return all_anchors
+
+    @staticmethod
+    def get_fragment_html(response):
+        """html of a 'load more' response - either html, or json with the html in a 'html' / 'data' field"""
+        if "json" not in response.headers.get("Content-Type", ""):
+            return response.text
+        data = response.json()
+        if isinstance(data, dict):
+            data = data.get("html") or data.get("data") or ""
+            if isinstance(data, dict):
+                data = data.get("html", "")
+        if not isinstance(data, str):
+            raise LinkDiscoveryError("unexpected 'load more' json response")
+        return data
 
     def setup_geckodriver(self):
-        firefox_options = Options()
-        firefox_options.add_argument("--disable-extensions")
-        firefox_options.add_argument("--headless")
-        firefox_options.set_preference("dom.push.enabled", False)
-        self.driver = webdriver.Firefox(options=firefox_options)  # path to gecko driver already on path
+        self.driver = create_firefox_driver(self.lean_browser)
 
     def open_website(self):
         self.driver.get(self.cafe_website)
         print(f"Website {self.cafe_website} opened")
 
     def load_more_cafes(self):
-        """clicks button to load additional cafe data"""
+        """
+        clicks the button to load additional cafe data until it is gone - after each click waits until more cafes
+        are in the page or the button is removed / hidden, instead of fixed sleeps
+        """
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support import expected_conditions as EC
+        from selenium.webdriver.support.ui import WebDriverWait
+        from selenium.common.exceptions import TimeoutException, StaleElementReferenceException
         try:
-            load_more = WebDriverWait(self.driver, self.driver_timeout_time).until(EC.presence_of_element_located(
+            WebDriverWait(self.driver, self.driver_timeout_time).until(EC.presence_of_element_located(
                 (By.ID, self.more_cafes_button_id)))
         except TimeoutException:
 
@@ -58,23 +288,61 @@ class ExtractCafeLinks:
             MAYBE COULD EXTRACT ANY DIV CONTAINER NAMES AND THEN UPDATE THE CLASS VARIABLE"""
 
             print("No load button loaded")
-
-        else:
+            return
+
+        clicks = 0
+        while clicks < self.max_load_more_pages:
+            load_more = self.find_load_more_button()
+            if load_more is None:
+                break
+            anchors_before = self.count_cafe_anchors()
+            try:
+                self.click_load_more(load_more)
+            except (TimeoutException, StaleElementReferenceException):
+                break  # button removed, or never clickable
+            clicks += 1
             try:
-                self.driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-                time.sleep(3)
-                load_more.click()
-            except (ElementClickInterceptedException, ElementNotInteractableException):
-                # Scroll into view
-                self.driver.execute_script("arguments[0].scrollIntoView({ behavior: 'smooth' });",
-                                           load_more)
-                time.sleep(3)
-                load_more.click()
-
-        print(f"Load more cafes button clicked")
+                WebDriverWait(self.driver, self.driver_timeout_time).until(
+                    lambda driver: self.count_cafe_anchors() > anchors_before or self.find_load_more_button() is None)
+            except TimeoutException:
+                print("No more cafes loaded")
+                break
+
+        print(f"Load more cafes button clicked {clicks} times")
+
+    def find_load_more_button(self):
+        """the 'load more' button - None if removed or hidden"""
+        from selenium.webdriver.common.by import By
+        from selenium.common.exceptions import StaleElementReferenceException
+        buttons = self.driver.find_elements(By.ID, self.more_cafes_button_id)
+        try:
+            return buttons[0] if buttons and buttons[0].is_displayed() else None
+        except StaleElementReferenceException:
+            return None
+
+    def click_load_more(self, load_more):
+        """scrolls the button into view and clicks it once clickable - clicked by script if covered by another element"""
+        from selenium.webdriver.support import expected_conditions as EC
+        from selenium.webdriver.support.ui import WebDriverWait
+        from selenium.common.exceptions import ElementClickInterceptedException, ElementNotInteractableException
+        self.driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", load_more)
+        WebDriverWait(self.driver, self.driver_timeout_time).until(EC.element_to_be_clickable(load_more))
+        try:
+            load_more.click()
+        except (ElementClickInterceptedException, ElementNotInteractableException):
+            self.driver.execute_script("arguments[0].click();", load_more)
+
+    def count_cafe_anchors(self):
+        """number of links in the cafe containers"""
+        return self.driver.execute_script(ANCHOR_COUNT_SCRIPT,
+                                          [self.initial_cafes_id, self.additional_cafes_loaded_id])
 
     def check_additional_cafes_loaded(self):
         """checks if the other cafe data has loaded"""
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support import expected_conditions as EC
+        from selenium.webdriver.support.ui import WebDriverWait
+        from selenium.common.exceptions import TimeoutException
         try:
             WebDriverWait(self.driver, 10).until(
                 EC.presence_of_element_located((By.ID, self.additional_cafes_loaded_id)))
@@ -92,6 +360,7 @@ class ExtractCafeLinks:
 
     def get_html_soup(self, page_html):
         """passes page html to create a beautiful soup object"""
+        from bs4 import BeautifulSoup
         self.bsoup = BeautifulSoup(page_html, 'html.parser')
         print("Extracted beautiful soup html")
 
@@ -111,6 +380,13 @@ class ExtractCafeLinks:
 
         print("cafe links obtained")
 
+    def get_all_links_in_browser(self):
+        """reads the cafe hrefs of the cafe containers with one script in the page - the html is never copied out"""
+        self.cafe_hyperlink_list = self.driver.execute_script(
+            CAFE_LINKS_SCRIPT, [self.initial_cafes_id, self.additional_cafes_loaded_id],
+            self.individual_cafe_hyperlink_prefix)
+        print(f"{len(self.cafe_hyperlink_list)} cafe links obtained in the browser")
+
     def extract_anchor_links(self, first_anchor_list, second_anchor_list):
         """extracts the correct hyperlink leading to each individual cafe data"""
 
@@ -157,9 +433,10 @@ class ExtractCafeLinks:
 
     def save_cafelinks_to_txt(self):
         """writes each extracted hyperlink to txt file"""
-        user_input = input(f"\nDefault file name: {self.txt_file_name}\nChange file name: 'Y/N'\n")
-        if user_input.lower() == "y":
-            self.update_filename()
+        if self.overwrite_links is None:  # unattended runs keep the default file name
+            user_input = input(f"\nDefault file name: {self.txt_file_name}\nChange file name: 'Y/N'\n")
+            if user_input.lower() == "y":
+                self.update_filename()
         with open(self.txt_file_name, "w") as file:
             for cafe_link in self.cafe_hyperlink_list:
                 file.write(cafe_link + '\n')
@@ -169,8 +446,11 @@ class ExtractCafeLinks:
         """checks if txt file of cafe links already created. Deletes and updates if user selects."""
         if os.path.exists(f"./{self.txt_file_name}"):
             print(f"file: '{self.txt_file_name}' with cafe links already created")
-            user_input = input("Delete and update the previous txt file? 'Y/N'\n")
-            if user_input.lower() == 'y':
+            if self.overwrite_links is None:
+                overwrite = input("Delete and update the previous txt file? 'Y/N'\n").lower() == 'y'
+            else:
+                overwrite = self.overwrite_links
+            if overwrite:
                 self.delete_txt_file()
             else:
                 return False
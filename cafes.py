@@ -0,0 +1,80 @@
+"""
+Library api - streams the cafe data of a list of links as immutable CafeRecords (records.py), without main.py's
+input() prompts, csv file or checkpoint journal. Results can go to any sink with constant memory:
+
+    from cafes import iter_cafes
+    for record in iter_cafes(links, workers=4):
+        print(record.name, record.latitude, record.longitude)
+
+Records are yielded in link order. Pages are fetched by a pool of worker threads sharing the pooled http client
+(httpclient.py) and its per-host rate limiter, with at most workers * 2 pages in memory at a time.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+import requests
+from extractCafeData import CafeData
+from httpclient import check_page_response, get_client
+from parsers import parse_cafe_page
+from pagearchive import archive_page
+from ratelimit import HostRateLimiter
+
+
+def extract_cafe(link, number, country="UK", parser_backend=None, geocode=True):
+    """
+    fetches and extracts a single cafe link - returns its CafeRecord, raises AttributeError if unavailable and
+    requests.HTTPError for an error page (non 2xx response)
+    """
+    response = get_client().get(link)
+    check_page_response(response)  # error pages are neither archived nor parsed
+    archive_page(link, response.text)
+    cafe = CafeData(parse_cafe_page(response.text, parser_backend), number, link, None, False, country)
+    cafe.extract_all_data(geocode)
+    return cafe.to_record()
+
+
+def iter_cafes(links, workers=4, requests_per_second=None, country="UK", parser_backend=None, geocode=True,
+               on_error=None, rate_limiter=None):
+    """
+    generator of the CafeRecord of each cafe link, in link order - the record ID is the link position + 1.
+    Unavailable pages and failed requests are skipped.
+    :param links: iterable of cafe links - read lazily
+    :param requests_per_second: fixed maximum requests per second to each host - if None the pace is set by the
+    http client's adaptive rate limiter (see ratelimit.py)
+    :param geocode: False leaves latitude / longitude as None (no openstreetmap requests)
+    :param on_error: called with (link, exception) for each skipped link
+    :param rate_limiter: HostRateLimiter to share with other callers - one is created from requests_per_second if None
+    """
+    if rate_limiter is None and requests_per_second:
+        rate_limiter = HostRateLimiter(requests_per_second)
+
+    def fetch(link, number):
+        if rate_limiter is not None:
+            rate_limiter.acquire(link)
+        return extract_cafe(link, number, country, parser_backend, geocode)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = deque()  # (link, future) in link order
+        numbered_links = enumerate(links, start=1)
+
+        def submit_next():
+            item = next(numbered_links, None)
+            if item is None:
+                return False
+            number, link = item
+            pending.append((link, executor.submit(fetch, link, number)))
+            return True
+
+        for _ in range(workers * 2):
+            if not submit_next():
+                break
+
+        while pending:
+            link, future = pending.popleft()
+            submit_next()
+            try:
+                record = future.result()
+            except (AttributeError, requests.exceptions.RequestException) as e:
+                if on_error is not None:
+                    on_error(link, e)
+                continue
+            yield record
@@ -0,0 +1,104 @@
+"""
+Append-only checkpoint journal of processed cafe links, so an interrupted extraction resumes without re-reading the
+output CSV, and is keyed by link url so it still resumes correctly if the links file changes.
+Each line: status, link index, link url, time - tab separated. The journal is compacted to one line per link when
+opened, so it does not grow across resumed and --retry-failed runs.
+"""
+import os
+import threading
+import time
+
+DONE = "done"  # cafe data extracted and saved
+UNCHANGED = "unchanged"  # page not modified since last fetched (conditional request)
+UNAVAILABLE = "unavailable"  # page fetched but cafe data could not be extracted
+FAILED = "failed"  # page could not be fetched
+
+PROCESSED_STATUSES = (DONE, UNCHANGED, UNAVAILABLE, FAILED)
+RETRY_STATUSES = (UNAVAILABLE, FAILED)
+
+
+def read_last_line(filename):
+    """returns the last non-empty line of a file by reading backwards from the end - None if the file is empty"""
+    with open(filename, "rb") as file:
+        file.seek(0, os.SEEK_END)
+        position = file.tell()
+        block_size = 4096
+        data = b""
+        while position > 0:
+            read_size = min(block_size, position)
+            position -= read_size
+            file.seek(position)
+            data = file.read(read_size) + data
+            lines = data.rstrip(b"\r\n").split(b"\n")
+            if len(lines) > 1 or (position == 0 and lines[0]):
+                return lines[-1].rstrip(b"\r").decode("utf-8")
+    return None
+
+
+class CheckpointJournal:
+    """status of each processed link - last entry for a link wins"""
+    def __init__(self, journal_filename):
+        self.journal_filename = journal_filename
+        self.statuses = {}  # link: status
+        self.lock = threading.Lock()
+        self.load()
+        self.file = open(self.journal_filename, "a")
+
+    def load(self):
+        """
+        reads the statuses from a previous run - ignores a partly written last line (interrupted run). The file is
+        rewritten with only the last line of each link if any lines were superseded or partly written
+        """
+        if not os.path.exists(self.journal_filename):
+            return
+        last_lines = {}  # link: last line
+        line_count = 0
+        with open(self.journal_filename, "r") as file:
+            for line in file:
+                line_count += 1
+                parts = line.rstrip("\n").split("\t")
+                if len(parts) == 4 and parts[0] in PROCESSED_STATUSES and line.endswith("\n"):
+                    self.statuses[parts[2]] = parts[0]
+                    last_lines.pop(parts[2], None)  # kept in order of the last entry
+                    last_lines[parts[2]] = line
+        if line_count > len(last_lines):
+            self.compact(last_lines.values())
+
+    def compact(self, lines):
+        """replaces the journal with the lines - written to a temporary file first, so a crash keeps the old one"""
+        temp_filename = f"{self.journal_filename}.tmp"
+        with open(temp_filename, "w") as file:
+            file.writelines(lines)
+        os.replace(temp_filename, self.journal_filename)
+
+    def record(self, link, index, status):
+        """appends the status of a link and flushes - so the entry survives the run being stopped"""
+        with self.lock:
+            self.file.write(f"{status}\t{index}\t{link}\t{time.time():.0f}\n")
+            self.file.flush()
+            self.statuses[link] = status
+
+    def get_status(self, link):
+        """returns the recorded status of the link, None if not processed"""
+        return self.statuses.get(link)
+
+    def is_processed(self, link):
+        return link in self.statuses
+
+    def failed_links(self):
+        """links whose last attempt was unavailable or failed"""
+        return [link for link, status in self.statuses.items() if status in RETRY_STATUSES]
+
+    def __len__(self):
+        return len(self.statuses)
+
+    def clear(self):
+        """deletes all entries - for restarting the extraction"""
+        with self.lock:
+            self.file.close()
+            self.file = open(self.journal_filename, "w")
+            self.statuses = {}
+
+    def close(self):
+        with self.lock:
+            self.file.close()
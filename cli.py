@@ -0,0 +1,267 @@
+"""
+Single stage commands - each imports only what its stage needs, so short runs (a resume, re-extracting one cafe, a
+query against the output) start without loading selenium, or requests / beautiful soup for the stages that make no
+requests. Settings (filenames, rate limits, output format ...) are the settings in main.py - main.py is not imported
+by export / query.
+
+    python cli.py discover                  # cafe links to cafes_links.txt
+    python cli.py extract                   # cafe data of the links, resuming from the checkpoint journal
+    python cli.py extract --link URL [--from-archive]   # re-extract single cafes into the output
+    python cli.py geocode                   # latitude / longitude of the saved cafes still missing them
+    python cli.py export all_cafes.sqlite   # output converted to another format (by extension, else parquet)
+    python cli.py query --city London --wifi [--near LATITUDE LONGITUDE] [--open-at DAY TIME]
+
+discover and extract take --unattended / --restart like main.py. geocode --offline and extract --from-archive make no
+requests, so requests is not imported either. Run benchmarks/bench_import_time.py for the start up cost of each stage.
+"""
+import argparse
+import csv
+import os
+import sys
+
+DEFAULT_OUTPUT = "all_cafes_csv.csv"  # main.extracted_cafe_data_csv - not imported by export / query
+
+
+def output_format_of(filename):
+    """'csv', 'sqlite' or 'parquet' from the output filename - any other extension is parquet (e.g. '.parquet')"""
+    if filename.endswith(".sqlite"):
+        return "sqlite"
+    if filename.endswith(".csv"):
+        return "csv"
+    return "parquet"
+
+
+def read_output_rows(filename):
+    """row dicts of a csv, parquet or sqlite output"""
+    from workqueue import read_shard
+    return read_shard(filename, output_format_of(filename))
+
+
+def setup_main(args, http=True):
+    """
+    imports main.py with the command line flags applied, and sets up the shared http client / caches.
+    :param http: False for the stages that make no requests - the http client (and requests) is then not loaded
+    """
+    import main
+    main.unattended = main.unattended or getattr(args, "unattended", False)
+    main.unattended_restart = main.unattended_restart or getattr(args, "restart", False)
+    main.use_shared_clients(http)
+    return main
+
+
+def main_output_filename(main):
+    return main.get_output_filename(main.extracted_cafe_data_csv, main.output_format)
+
+
+def discover(args):
+    """cafe links of the listing page saved to the links file"""
+    main = setup_main(args)
+    main.create_link_scraper().run_webscraping()
+
+
+def extract(args):
+    """cafe data of the links file - or only the given links, updated in the output"""
+    main = setup_main(args, http=not (args.link and args.from_archive))
+    main.staged_pipeline = main.staged_pipeline or args.staged
+    if args.link:
+        extract_single_cafes(main, args.link, args.from_archive)
+        return
+
+    page_archive = None
+    if main.archive_pages:
+        from pagearchive import PageArchive, use_page_archive
+        page_archive = PageArchive(main.page_archive_filename, main.page_archive_compression)
+        use_page_archive(page_archive)
+    try:
+        from refresh import PageHashStore
+        main.create_cafe_data(main.cafe_links_txt_filename, main_output_filename(main),
+                              retry_failed=args.retry_failed, output_format=main.output_format,
+                              page_hashes=PageHashStore(main.page_hashes_filename))
+    finally:
+        if page_archive is not None:
+            page_archive.close()
+
+
+def extract_single_cafes(main, links, from_archive=False):
+    """
+    extracts the cafes of the links - fetched, or from the page archive - and replaces their rows in the output.
+    Cafes keep the ID of their position in the links file, and the country of their row in the output (UK for new
+    cafes) - the country selects the address parser.
+    """
+    from refresh import read_links
+    link_indexes = {link: index for index, link in enumerate(read_links(main.cafe_links_txt_filename))}
+    countries = {}
+    if os.path.exists(main_output_filename(main)):
+        countries = {row["Link"]: row.get("Country") or "UK" for row in read_output_rows(main_output_filename(main))}
+    page_archive = None
+    if from_archive:
+        from pagearchive import PageArchive
+        page_archive = PageArchive(main.page_archive_filename, main.page_archive_compression)
+
+    updated_rows = {}
+    try:
+        for link in links:
+            number = link_indexes.get(link, len(link_indexes)) + 1
+            country = countries.get(link, "UK")
+            if page_archive is not None:
+                from pipeline import extract_page
+                page_html = page_archive.get(link)
+                if page_html is None:
+                    print(f"{link} is not archived")
+                    continue
+                cafe = extract_page(link, number, page_html, main.html_parser_backend, country)
+                if cafe is not None:
+                    cafe.get_latitude_longitude()
+            else:
+                import requests
+                try:
+                    cafe = main.fetch_cafe_data(link, number, main_output_filename(main), False, None,
+                                                country=country)
+                except AttributeError:
+                    cafe = None
+                except requests.exceptions.RequestException as e:
+                    print(f"{link} could not be fetched: {e}")
+                    continue
+            if cafe is None:
+                print(f"{link} unavailable")
+                continue
+            updated_rows[link] = cafe.get_row()
+    finally:
+        if page_archive is not None:
+            page_archive.close()
+    replaced, added, _ = main.update_output_rows(main_output_filename(main), updated_rows, [], main.output_format)
+    print(f"{replaced} cafes updated, {added} added")
+
+
+def geocode(args):
+    """latitude / longitude of the saved cafes without them - from the postcode index / geocode cache / openstreetmap"""
+    main = setup_main(args, http=not args.offline)
+    import extractCafeData
+    from writers import row_from_dict
+    if args.offline:
+        extractCafeData.use_offline_geocoding(True)
+    output_filename = main_output_filename(main)
+    updated_rows = {}
+    for row in read_output_rows(output_filename):
+        if row["Latitude"] not in (None, "") or not (row["Postcode"] or row["Street"]):
+            continue
+        lat, lon = extractCafeData.geocode_address(row["Postcode"], row["Street"], row["City"],
+                                                   row.get("Country") or "UK")
+        if lat is not None:
+            row["Latitude"], row["Longitude"] = lat, lon
+            updated_rows[row["Link"]] = row_from_dict(row)
+    replaced, _, _ = main.update_output_rows(output_filename, updated_rows, [], main.output_format)
+    print(f"{replaced} cafes geocoded")
+
+
+def export(args):
+    """the output rows written to another output file - the format is taken from the filename"""
+    from writers import create_writer, row_from_dict
+    if os.path.exists(args.destination):  # writers add to an existing output
+        sys.exit(f"{args.destination} already exists")
+    rows = read_output_rows(args.output)
+    with create_writer(output_format_of(args.destination), args.destination) as writer:
+        for row in rows:
+            writer.write_row(row_from_dict(row))
+    print(f"{len(rows)} cafes exported to {args.destination}")
+
+
+def query(args):
+    """cafes of the output matching the filters, as csv on stdout"""
+    from writers import CSV_HEADER
+    output_format = output_format_of(args.output)
+    status = None if args.include_closed else "open"
+    if output_format == "sqlite":  # filtered by the database indexes
+        from resultstore import ResultStore
+        store = ResultStore(args.output, read_only=True)
+        rows = store.query(args.city, args.postcode, args.wifi or None, args.laptop or None, args.pet or None, status)
+        store.close()
+    else:
+        rows = [row for row in read_output_rows(args.output) if matches(row, args, status)]
+
+    if args.open_at:
+        from openinghours import OpeningHoursIndex  # requires numpy
+        open_now = OpeningHoursIndex([row["Opening"] or "" for row in rows]).open_at(*args.open_at)
+        rows = [row for row, is_open in zip(rows, open_now) if is_open]
+    if args.near:
+        from spatialindex import SpatialIndex, row_flags
+        from writers import to_float
+        records = [(position, to_float(row["Latitude"]), to_float(row["Longitude"]), row_flags(row))
+                   for position, row in enumerate(rows) if row["Latitude"] not in (None, "")]
+        nearest = SpatialIndex(records).nearest(*args.near, k=args.k, include_closed=True)
+        rows = [rows[position] for _, position in nearest]
+
+    writer = csv.writer(sys.stdout)
+    writer.writerow(CSV_HEADER)
+    for row in rows:
+        writer.writerow([row.get(column) if row.get(column) is not None else "" for column in CSV_HEADER])
+
+
+def matches(row, args, status):
+    """True if a csv / parquet row passes the query filters"""
+    if args.city and (row["City"] or "").lower() != args.city.lower():
+        return False
+    if args.postcode:
+        postcode = (row["Postcode"] or "").upper()
+        if postcode != args.postcode.upper() and not postcode.startswith(f"{args.postcode.upper()} "):
+            return False
+    for flag, column in ((args.wifi, "Wifi"), (args.laptop, "Laptop Friendly"), (args.pet, "Pet Friendly")):
+        if flag and not row[column]:
+            return False
+    return status is None or (row.get("Status") or "open") == status
+
+
+def positive_int(text):
+    """argparse type - an integer of 1 or more"""
+    value = int(text)
+    if value < 1:
+        raise argparse.ArgumentTypeError(f"must be 1 or more, got {value}")
+    return value
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Run a single stage of the cafe data extraction")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    def add_command(name, function, help_text, prompts=False):
+        command = commands.add_parser(name, help=help_text)
+        command.set_defaults(function=function)
+        if prompts:
+            command.add_argument("--unattended", action="store_true",
+                                 help="never prompt - keep and resume the previous links and output")
+            command.add_argument("--restart", action="store_true",
+                                 help="with --unattended, delete the previous links and output")
+        return command
+
+    add_command("discover", discover, "save the cafe links of the listing page", prompts=True)
+
+    command = add_command("extract", extract, "extract the cafe data of the saved links", prompts=True)
+    command.add_argument("--staged", action="store_true", help="parse in a pool of processes fed by async fetchers")
+    command.add_argument("--retry-failed", action="store_true", help="only the links unavailable or failed before")
+    command.add_argument("--link", nargs="+", metavar="URL", help="only these cafes, updated in the output")
+    command.add_argument("--from-archive", action="store_true", help="with --link, from the page archive")
+
+    command = add_command("geocode", geocode, "fill in the missing latitude / longitude of the saved cafes")
+    command.add_argument("--offline", action="store_true", help="only the postcode index and geocode cache")
+
+    command = add_command("export", export, "convert the output to another format")
+    command.add_argument("destination", help="file - format by extension: .csv, .sqlite, else a parquet directory")
+    command.add_argument("--output", default=DEFAULT_OUTPUT, help="output file to export")
+
+    command = add_command("query", query, "print the cafes of the output matching the filters as csv")
+    command.add_argument("--output", default=DEFAULT_OUTPUT, help="output file to query (csv, sqlite or parquet)")
+    command.add_argument("--city")
+    command.add_argument("--postcode", help="full postcode or outward code e.g. 'E1'")
+    command.add_argument("--wifi", action="store_true")
+    command.add_argument("--laptop", action="store_true")
+    command.add_argument("--pet", action="store_true")
+    command.add_argument("--include-closed", action="store_true")
+    command.add_argument("--open-at", nargs=2, metavar=("DAY", "TIME"), help="e.g. saturday 10:30 (requires numpy)")
+    command.add_argument("--near", nargs=2, type=float, metavar=("LATITUDE", "LONGITUDE"))
+    command.add_argument("--k", type=positive_int, default=5, help="with --near, number of nearest cafes")
+    return parser
+
+
+if __name__ == "__main__":
+    args = build_parser().parse_args()
+    args.function(args)
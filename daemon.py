@@ -0,0 +1,251 @@
+"""
+Unattended refresh daemon - keeps the cafe data fresh continuously instead of through periodic full re-scrapes.
+Every cafe is in a priority queue ordered by the time since it was last refreshed. Each interval the daemon spends a
+request budget on the stalest cafes (conditional requests - unchanged pages cost a 304), updating the output in
+place, then sleeps until the next interval. The listing is re-read every discover_interval_seconds: new cafes are
+refreshed first, and cafes no longer listed are marked closed.
+
+Runs without any prompts, from a config file (all settings optional):
+
+    [daemon]
+    links_filename = cafes_links.txt
+    output_filename = all_cafes_csv.sqlite
+    output_format = sqlite
+    interval_seconds = 600
+    requests_per_interval = 60
+    discover_interval_seconds = 86400
+
+    python daemon.py --config daemon.ini [--once]
+Stops after the current batch on SIGINT / SIGTERM.
+"""
+import argparse
+import configparser
+import heapq
+import os
+import signal
+import sqlite3
+import threading
+import time
+import main
+from cafelinks import ExtractCafeLinks
+from instrumentation import metrics
+from refresh import PageHashStore, diff_links, read_links, save_page_state
+from resultstore import ResultStore
+
+DEFAULT_CONFIG = {
+    "links_filename": main.cafe_links_txt_filename,
+    "output_filename": main.extracted_cafe_data_csv,
+    "output_format": "csv",  # "csv" or "sqlite" - csv is rewritten each interval, sqlite updated in place
+    "schedule_filename": "refresh_schedule.sqlite",
+    "listing_url": "https://europeancoffeetrip.com/uk/",
+    "country": "UK",
+    "interval_seconds": "600",
+    "requests_per_interval": "60",  # cafe pages fetched each interval (geocode lookups are not counted)
+    "discover_interval_seconds": "86400",  # re-read the listing for new / removed cafes - 0 never
+    "fetch_workers": str(main.fetch_workers),
+}
+
+
+class RefreshSchedule:
+    """
+    priority queue of cafe links by last refresh time, saved in sqlite so the daemon carries on where it stopped.
+    Links never refreshed come first, in link order.
+    """
+    def __init__(self, db_filename):
+        self.db_filename = db_filename
+        self.connection = sqlite3.connect(db_filename)
+        with self.connection:
+            self.connection.execute("CREATE TABLE IF NOT EXISTS schedule ("
+                                    "link TEXT PRIMARY KEY, link_index INTEGER NOT NULL, last_refreshed REAL NOT NULL)")
+        self.entries = {}  # link: (last_refreshed, link_index)
+        self.heap = []  # (last_refreshed, link_index, link) - entries no longer in self.entries are skipped
+        for link, link_index, last_refreshed in self.connection.execute("SELECT * FROM schedule"):
+            self.push(link, last_refreshed, link_index)
+
+    def push(self, link, last_refreshed, link_index):
+        self.entries[link] = (last_refreshed, link_index)
+        heapq.heappush(self.heap, (last_refreshed, link_index, link))
+
+    def sync_links(self, links, refreshed_times=None):
+        """
+        updates the schedule to the listed links - new links are added as never refreshed, unless their time is in
+        refreshed_times (e.g. from an existing output). Links no longer listed are removed.
+        :return: (new links, removed links)
+        """
+        refreshed_times = refreshed_times or {}
+        new_links, _, removed_links = diff_links(list(self.entries), links)
+        link_indexes = {link: index for index, link in enumerate(links)}
+        with self.connection:
+            for link in removed_links:
+                del self.entries[link]
+            self.connection.executemany("DELETE FROM schedule WHERE link = ?", [(link,) for link in removed_links])
+            for link in new_links:
+                self.push(link, refreshed_times.get(link, 0.0), link_indexes[link])
+            self.connection.executemany("INSERT OR REPLACE INTO schedule VALUES (?, ?, ?)",
+                                        [(link, link_indexes[link], self.entries[link][0]) for link in new_links])
+        return new_links, removed_links
+
+    def stalest(self, count):
+        """the count least recently refreshed links as (index, link) - they stay scheduled until marked refreshed"""
+        stalest = []
+        taken = []
+        while self.heap and len(stalest) < count:
+            last_refreshed, link_index, link = heapq.heappop(self.heap)
+            if self.entries.get(link) != (last_refreshed, link_index):
+                continue  # removed, or refreshed since this heap entry
+            stalest.append((link_index, link))
+            taken.append((last_refreshed, link_index, link))
+        for entry in taken:  # back in the heap until refreshed
+            heapq.heappush(self.heap, entry)
+        return stalest
+
+    def mark_refreshed(self, links, refreshed=None):
+        refreshed = refreshed or time.time()
+        links = [link for link in links if link in self.entries]
+        with self.connection:
+            for link in links:
+                self.push(link, refreshed, self.entries[link][1])
+            self.connection.executemany("UPDATE schedule SET last_refreshed = ? WHERE link = ?",
+                                        [(refreshed, link) for link in links])
+
+    def __len__(self):
+        return len(self.entries)
+
+    def close(self):
+        self.connection.close()
+
+
+class RefreshDaemon:
+    """
+    :param config: the [daemon] section of the config file (DEFAULT_CONFIG for missing settings)
+    """
+    def __init__(self, config):
+        self.links_filename = config["links_filename"]
+        self.output_format = config["output_format"]
+        if self.output_format not in ("csv", "sqlite"):
+            raise ValueError(f"Unsupported daemon output format: {self.output_format}. Options: csv, sqlite")
+        self.output_filename = config["output_filename"]
+        self.listing_url = config["listing_url"]
+        self.country = config["country"]
+        self.interval_seconds = config.getfloat("interval_seconds")
+        self.requests_per_interval = config.getint("requests_per_interval")
+        self.discover_interval_seconds = config.getfloat("discover_interval_seconds")
+        self.fetch_workers = config.getint("fetch_workers")
+        self.schedule = RefreshSchedule(config["schedule_filename"])
+        self.page_hashes = PageHashStore(main.page_hashes_filename)
+        self.stopped = threading.Event()
+        self.last_discovery = None
+
+    def stop(self, *_):
+        """stops after the current batch (signal handler)"""
+        print("Stopping after the current batch")
+        self.stopped.set()
+
+    def start(self):
+        """
+        schedules the links of the links file - cafes already in a sqlite output keep their last update time.
+        The listing is next read discover_interval_seconds after the links file was saved
+        """
+        refreshed_times = {}
+        if self.output_format == "sqlite" and os.path.exists(self.output_filename):
+            store = ResultStore(self.output_filename, read_only=True)
+            refreshed_times = {row["Link"]: row["Last Updated"] for row in store.query(status=None)}
+            store.close()
+        new_links, removed_links = self.schedule.sync_links(read_links(self.links_filename), refreshed_times)
+        if os.path.exists(self.links_filename):  # the links file is saved by each discovery
+            self.last_discovery = os.path.getmtime(self.links_filename)
+        print(f"{len(self.schedule)} cafes scheduled ({len(new_links)} new, {len(removed_links)} removed)")
+
+    def discover(self):
+        """re-reads the listing - new cafes are scheduled first, cafes no longer listed are marked closed"""
+        scraper = ExtractCafeLinks(self.links_filename, main.link_discovery_mode, lean_browser=main.lean_browser,
+                                   overwrite_links=True)
+        scraper.cafe_website = self.listing_url
+        links = scraper.discover_links()
+        self.last_discovery = time.time()
+        if not links:
+            print("No cafe links discovered - schedule unchanged")
+            return
+        new_links, removed_links = self.schedule.sync_links(links)
+        if removed_links:
+            self.save({}, removed_links)
+        scraper.save_cafelinks_to_txt()
+        print(f"Discovered {len(links)} cafes: {len(new_links)} new, {len(removed_links)} closed")
+
+    def discovery_due(self):
+        if self.discover_interval_seconds <= 0:
+            return False
+        return self.last_discovery is None or time.time() - self.last_discovery >= self.discover_interval_seconds
+
+    def refresh_batch(self):
+        """refreshes the stalest cafes within the request budget - returns the number checked"""
+        batch = self.schedule.stalest(self.requests_per_interval)
+        updated_rows = {}
+        updated_pages = {}
+        checked = []
+        # any error of a page is caught, so a page that keeps failing moves to the back of the queue
+        for index, link, link_data, error in main.process_links(
+                batch, self.output_filename, False, self.fetch_workers, None, conditional=True,
+                page_hashes=self.page_hashes, country=self.country, catch_all=True):
+            if error is not None:  # tried again once it is the stalest again
+                print(f"Cafe {index} could not be refreshed: {error!r}")
+                metrics.increment("fetch_failures")
+            elif link_data is not None:
+                updated_pages[link] = (link_data.content_hash, link_data.validators)
+                updated_rows[link] = link_data.get_row()
+            checked.append(link)
+            if self.stopped.is_set():
+                break
+        self.save(updated_rows, [])
+        save_page_state(self.page_hashes, updated_pages)  # only once the rows are saved - else they are fetched again
+        self.schedule.mark_refreshed(checked)
+        print(f"{time.strftime('%Y-%m-%d %H:%M:%S')} refreshed {len(checked)} cafes, {len(updated_rows)} changed")
+        return len(checked)
+
+    def save(self, updated_rows, closed_links):
+        """updates the output in place"""
+        main.update_output_rows(self.output_filename, updated_rows, closed_links, self.output_format)
+
+    def run(self, once=False):
+        """refreshes a batch each interval until stopped - or one batch if once"""
+        self.start()
+        while not self.stopped.is_set():
+            started = time.monotonic()
+            try:
+                if self.discovery_due():
+                    self.discover()
+                if len(self.schedule) > 0:
+                    self.refresh_batch()
+            except Exception as e:  # e.g. the output locked while saving - the batch is tried again next interval
+                print(f"{time.strftime('%Y-%m-%d %H:%M:%S')} refresh failed: {e!r}")
+                metrics.increment("refresh_failures")
+            if once:
+                break
+            self.stopped.wait(max(0.0, self.interval_seconds - (time.monotonic() - started)))
+        self.schedule.close()
+        self.page_hashes.close()
+
+
+def read_config(config_filename):
+    """the [daemon] section of the config file, with DEFAULT_CONFIG for missing settings"""
+    config = configparser.ConfigParser(defaults=DEFAULT_CONFIG)
+    if config_filename is not None:
+        if not config.read(config_filename):
+            raise FileNotFoundError(f"Config file not found: {config_filename}")
+    if not config.has_section("daemon"):
+        config.add_section("daemon")
+    return config["daemon"]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Unattended refresh of the stalest cafes each interval")
+    parser.add_argument("--config", help="config file with a [daemon] section")
+    parser.add_argument("--once", action="store_true", help="refresh one batch and exit (e.g. from cron)")
+    args = parser.parse_args()
+
+    main.unattended = True
+    main.use_shared_clients()
+    daemon = RefreshDaemon(read_config(args.config))
+    signal.signal(signal.SIGINT, daemon.stop)
+    signal.signal(signal.SIGTERM, daemon.stop)
+    daemon.run(args.once)
@@ -1,10 +1,42 @@
 """Extracts information from the individual cafe hyperlinks, saves to a csv file."""
 
-import time
 import os
-import csv
-import requests
 import json
+from geocache import make_geocode_key
+from writers import CsvWriter, to_float
+from records import CafeRecord
+from addressparsers import parse_address
+from instrumentation import metrics, timed
+
+
+nominatim_url = os.getenv("NOMINATIM_URL", "https://nominatim.openstreetmap.org/search")  # openstreetmap search api
+geocode_cache = None  # optional GeocodeCache - set with use_geocode_cache()
+postcode_index = None  # optional offline PostcodeIndex - set with use_postcode_index()
+street_precision = True  # full addresses still go to openstreetmap when a postcode index is set - False for centroids
+offline = False  # if True, only the postcode index and geocode cache are used - no openstreetmap requests
+
+
+def use_geocode_cache(cache):
+    """sets the persistent cache used by geocode_address (None to disable)"""
+    global geocode_cache
+    geocode_cache = cache
+
+
+def use_postcode_index(index, full_street_precision=True):
+    """
+    sets the offline postcode index used by geocode_address (None to disable).
+    :param full_street_precision: only answer postcode only lookups offline (and the fallback when a full address is
+    not found), full addresses still use openstreetmap. If False, every cafe gets its postcode centroid
+    """
+    global postcode_index, street_precision
+    postcode_index = index
+    street_precision = full_street_precision
+
+
+def use_offline_geocoding(enabled=True):
+    """geocode only from the postcode index and geocode cache, without openstreetmap requests (re-extraction)"""
+    global offline
+    offline = enabled
 
 
 def geocode_address(postcode, street=None, city=None, country="UK"):
@@ -12,10 +44,43 @@ def geocode_address(postcode, street=None, city=None, country="UK"):
     Gets and returns the Latitude and Longitude, from; street address, postcode, town/city, provided in the UK.
     Passes the full address first to openstreetmap api, but if unsuccessful, passes only the postcode to get a
     more approximate address.
+    Results are read from / saved to the geocode cache if one is set. If an offline postcode index is set, the
+    postcode centroid is returned from it without any request (unless full street precision is needed).
+    Latitude / longitude are returned as floats from every source (None if not found).
+    """
+    if postcode_index is not None and country == "UK" and (not street_precision or not (street and city)):
+        location = postcode_index.lookup(postcode)
+        if location is not None:
+            return to_float(location[0]), to_float(location[1])
+
+    if geocode_cache is None:
+        (lat, lon), _ = request_geocode(postcode, street, city, country)
+    else:
+        tier, key = make_geocode_key(postcode, street, city, country)
+        lat, lon = geocode_cache.lookup(tier, key, lambda: request_geocode(postcode, street, city, country))
+
+    if lat is None and street and city:
+        metrics.increment("geocode_fallbacks")
+        # issue with identifying openstreetmap location from full address - call function again with lower precision
+        lat, lon = geocode_address(postcode, country=country)
+
+    return to_float(lat), to_float(lon)  # openstreetmap and the geocode cache give strings
+
+
+def request_geocode(postcode, street=None, city=None, country="UK"):
+    """
+    Requests the Latitude and Longitude from the openstreetmap api.
+    :return: ((lat, lon), cacheable) - lat/lon None if not found. Not cacheable if the response could not be read.
     """
     lat = None
     lon = None
-    url = "https://nominatim.openstreetmap.org/search"
+    cacheable = False
+    url = nominatim_url
+    if offline:
+        metrics.increment("geocode_offline_misses")
+        return (lat, lon), cacheable
+    import requests  # only imported by the runs making openstreetmap requests
+    from httpclient import get_client
 
     if street and city:  # full address details
         params = {
@@ -30,6 +95,7 @@ def geocode_address(postcode, street=None, city=None, country="UK"):
     else:  # only pass the postcode for search - less specific
         params = {
             'postalcode': postcode,
+            'country': country,
             'format': 'json',
             'addressdetails': 1
         }
@@ -40,7 +106,19 @@ def geocode_address(postcode, street=None, city=None, country="UK"):
 
 
     # get API response
-    response = requests.get(url, params=params, headers=headers)
+    try:
+        with metrics.timer("geocode_request"):
+            response = get_client().get(url, params=params, headers=headers)
+        metrics.increment("geocode_requests", tier="address" if street and city else "postcode")
+    except requests.exceptions.RequestException as e:
+        metrics.increment("geocode_failures")
+        print(f"OpenStreetMap request failed: {e}")
+        return (lat, lon), cacheable
+
+    if response.status_code != 200:  # still rate limited / failing after the client's retries
+        metrics.increment("geocode_failures")
+        print(f"OpenStreetMap request failed: {response.status_code} {response.reason}")
+        return (lat, lon), cacheable
 
     try:
         data = response.json()
@@ -48,29 +126,27 @@ def geocode_address(postcode, street=None, city=None, country="UK"):
             if data:  # extract latitude and longitude
                 lat = data[0]["lat"]
                 lon = data[0]["lon"]
-            else:  # issue with identifying openstreetmap location from full address
-                time.sleep(1)
-                if street and city:
-                    # call function again with lower precision
-                    lat, lon = geocode_address(postcode)
+            cacheable = True
 
         except KeyError:
             print("OpenStreetMap response data for latitude / longitude has changed. please review:")
             print(json.dumps(data, indent=4))  # print response data for review
 
     except requests.exceptions.JSONDecodeError:
+        metrics.increment("geocode_failures")
         print("Failed to parse JSON:")
         print(response.text)
 
-    return lat, lon
+    return (lat, lon), cacheable
 
 
 class CafeData:
-    def __init__(self, soup, number, link, cafe_data_csvfile, report_level):
+    def __init__(self, soup, number, link, cafe_data_csvfile, report_level, country="UK"):
         self.id = number  # current link index number
         self.link = link  # cafe hyperlink
         self.bSoup = soup  # beautiful soup object
         self.save_filename = cafe_data_csvfile  # csv filename
+        self.country = country  # country code - selects the address parser
 
         # individual cafa data to extract
         self.name = None  # cafe name
@@ -88,23 +164,32 @@ class CafeData:
         self.service_friendly_html_class = "cafe-services"
         self.latitude = None
         self.longitude = None
+        self.status = "open"  # "closed" once the cafe is no longer listed on the website
+        self.content_hash = None  # hash of the cafe containers html - to detect changed pages on refresh
+        self.validators = None  # (etag, last_modified) of the page response - saved once the row is written
 
         self.detailed_report = report_level
 
-    def extract_all_data(self):
-        """extracts all information from cafe hyperlink"""
+    def extract_all_data(self, geocode=True):
+        """
+        extracts all information from cafe hyperlink.
+        :param geocode: False leaves the latitude / longitude to a later stage (see pipeline.py)
+        """
         self.get_name()
         self.get_opening()
         self.get_services()
         self.get_location()
-        self.get_latitude_longitude()
+        if geocode:
+            self.get_latitude_longitude()
 
+    @timed("extract_name")
     def get_name(self):
         """find and extract the cafe name"""
         try:
             name = self.bSoup.find("h1", class_=self.name_html_class)
             self.name = name.get_text().title()  # update the name attribute
         except:
+            metrics.increment("extraction_failures", field="name")
             if self.detailed_report:
                 print("No name found for")
 
@@ -112,54 +197,24 @@ class CafeData:
             print(f"Name: {self.name}")
 
 
+    @timed("extract_location")
     def get_location(self):
         """
         Gets formatted street address, postcode and city from the address text - since the address format is not
-        always consistent.
+        always consistent. Parsed with the address parser for the cafe country (addressparsers.py).
         Sets: Postcode, City, Street.
         """
         location = self.bSoup.find("div", class_=self.location_html_class)
         location_text = location.get_text()
 
-        # split into street, and postcode + city ('[-1]' is just 'UK' - not needed)
-        location_text = location_text.split(', ')[:-1]
-
-        # 1. get the postcode and city location from the location text
-        postcode_city = location_text[-1].split(" ")  # postcode and city
-        postcode = []
-        city = []
-        # postcode - either singular or including space must contain a digit
-        for text in postcode_city:
-            postcode_text = False
-            for char in text:
-                # if digit in word = postcode
-                if char.isdigit():
-                    postcode.append(text)
-                    postcode_text = True
-                    break
-            # if no digit in word - is city/town name
-            if not postcode_text:
-                city.append(text)
-
-        # format postcode - each postcode inward code is always 3 characters long - add space before last 3 chars
-        postcode_joined = "".join(postcode).strip()
-        self.postcode = postcode_joined[0:-3] + " " + postcode_joined[-3:]
-
-        self.city = " ".join(city).strip()  # set city name
-
-        # 2. get the street location
-        street = " ".join(location_text[:-1]).strip()  # '[-1]' is postcode and city name
-        if "UK" in street:
-            street = street.replace("UK", "")  # remove redundant 'UK' from address
-        if self.city in street:
-            street = street.replace(self.city, "")  # remove redundant 'City' - occasionally repeats
-        self.street_location = street
+        self.street_location, self.city, self.postcode = parse_address(location_text, self.country)
 
         if self.detailed_report:
             print(f"Postcode: {self.postcode}")
             print(f"city: {self.city}")
             print(f"street_location: {self.street_location}")
 
+    @timed("extract_opening")
     def get_opening(self):
         """
         Condenses multiple row opening time table into a single line string.
@@ -182,6 +237,7 @@ class CafeData:
             re-run
             is there an error logging file i can create?
             """
+            metrics.increment("extraction_failures", field="opening")
             print("Could not get opening times")
 
         if self.detailed_report:
@@ -207,7 +263,7 @@ class CafeData:
             open_string = f"Monday - Friday: {times[0]}|Saturday - Sunday: {times[5]}"
 
         # weekdays not same but weekend is
-        elif not weekend_same_time and weekend_same_time:
+        elif not weekday_same_time and weekend_same_time:
             open_string = (f"Monday: {times[0]}|Tuesday: {times[1]}|Wednesday: {times[2]}|Thursday: {times[3]}"
                            f"|Friday: {times[4]}|Saturday - Sunday: {times[5]}")
 
@@ -217,14 +273,17 @@ class CafeData:
 
         return open_string
 
+    @timed("geocode")
     def get_latitude_longitude(self):
         """get the latitude and longitude for the cafe address"""
         if self.street_location and self.postcode and self.city:  # get lat lon with more precision
-            self.latitude, self.longitude = geocode_address(self.postcode, street=self.street_location, city=self.city)
+            self.latitude, self.longitude = geocode_address(self.postcode, street=self.street_location, city=self.city,
+                                                            country=self.country)
 
 
         elif self.postcode:  # get lat lon with less precision
-            self.latitude, self.longitude = geocode_address(self.postcode, street=self.street_location, city=self.city)
+            self.latitude, self.longitude = geocode_address(self.postcode, street=self.street_location, city=self.city,
+                                                            country=self.country)
 
         else:
             print("Address has not been obtained to determine latitude and longitude")
@@ -241,6 +300,7 @@ class CafeData:
             pass
         return url
 
+    @timed("extract_services")
     def get_services(self):
         """get the wi-fi, pet, and laptop friendly text from cafe link if present"""
         try:
@@ -259,6 +319,7 @@ class CafeData:
                     self.laptop_friendly = "Laptop Friendly"
 
         except:
+            metrics.increment("extraction_failures", field="services")
             if self.detailed_report:
                 print("No Service data available")
 
@@ -267,23 +328,28 @@ class CafeData:
             print(f"Allows Pets: {self.pet_friendly}")
             print(f"Laptop Friendly: {self.laptop_friendly}")
 
-    def save_entry(self):
+    def get_row(self):
+        """returns the extracted cafe data in the csv column order (writers.CSV_HEADER)"""
+        return [self.id, self.name, self.link, self.city, self.street_location, self.opening, self.postcode,
+                self.url_location, self.wifi, self.laptop_friendly,
+                self.pet_friendly, self.latitude, self.longitude, self.country, self.status]
+
+    def to_record(self):
+        """returns the extracted cafe data as an immutable CafeRecord (records.py)"""
+        return CafeRecord(self.id, self.name, self.link, self.city, self.street_location, self.opening, self.postcode,
+                          self.url_location, self.wifi, self.laptop_friendly, self.pet_friendly,
+                          to_float(self.latitude), to_float(self.longitude), self.country, self.status)
+
+    def save_entry(self, writer=None):
         """
-        saves cafe data to csv file.
-        Creates csv headers if no previous file created then adds data as row in csv file.
-        Update row headers and column position if editing or re-ordering data.
+        saves cafe data to the writer (csv or parquet, see writers.py) - returns True if the row was written out,
+        False if still buffered in the writer.
+        Without a writer the row is appended to the csv file straight away, creating the csv headers if no previous
+        file created.
         """
-        # if file not yet created
-        if not os.path.isfile(self.save_filename):
-            with open(self.save_filename, "w") as file:
-                writer = csv.writer(file)
-                # create csv header
-                writer.writerow(["ID", "Name", "Link", "City", "Street", "Opening", "Postcode", "Url Location",
-                                 "Wifi", "Laptop Friendly", "Pet Friendly", "Latitude", "Longitude"])
-
-        # add extracted cafe data to csv
-        with open(self.save_filename, "a") as file:
-            writer = csv.writer(file)
-            writer.writerow([self.id, self.name, self.link, self.city, self.street_location, self.opening, self.postcode,
-                             self.url_location, self.wifi, self.laptop_friendly,
-                             self.pet_friendly, self.latitude, self.longitude])
+        if writer is not None:
+            return writer.write_row(self.to_record())
+
+        with CsvWriter(self.save_filename, flush_every=1) as csv_writer:
+            csv_writer.write_row(self.to_record())
+        return True
@@ -0,0 +1,130 @@
+"""
+Persistent SQLite cache for geocode_address results, so re-runs and resumed runs do not geocode the same
+addresses again. Full address and postcode only lookups are kept as separate tiers.
+"""
+import sqlite3
+import threading
+import time
+
+
+def normalise_text(text):
+    """lower case and collapse whitespace - so small formatting differences map to the same key"""
+    if not text:
+        return ""
+    return " ".join(text.lower().split())
+
+
+def normalise_postcode(postcode):
+    """upper case with no spaces e.g. 'sw1a 1aa' -> 'SW1A1AA'"""
+    if not postcode:
+        return ""
+    return "".join(postcode.upper().split())
+
+
+def make_geocode_key(postcode, street=None, city=None, country="UK"):
+    """
+    returns the cache tier and key for a lookup. Only the postcode (and country) is used for postcode only lookups,
+    matching the lower precision request made to the api.
+    """
+    if street and city:
+        tier = "address"
+        parts = (normalise_text(street), normalise_text(city), normalise_postcode(postcode), normalise_text(country))
+    else:
+        tier = "postcode"
+        parts = ("", "", normalise_postcode(postcode), normalise_text(country))
+    return tier, "|".join(parts)
+
+
+class InFlightLookup:
+    """a lookup currently being requested - other threads asking for the same key wait for its result"""
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = (None, None)
+
+
+class GeocodeCache:
+    """
+    Caches latitude / longitude for each address key, including negative (not found) results.
+    Entries older than 'ttl' seconds (or 'negative_ttl' if not found) are requested again. Once more than
+    'max_entries' are held the least recently used entries are removed.
+    """
+    def __init__(self, db_filename, ttl=30 * 24 * 3600, negative_ttl=7 * 24 * 3600, max_entries=100000):
+        self.db_filename = db_filename
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.lock = threading.Lock()  # one connection shared by all worker threads
+        self.inflight = {}  # key: InFlightLookup
+        self.inflight_lock = threading.Lock()
+        self.connection = sqlite3.connect(db_filename, check_same_thread=False)
+        self.create_table()
+
+    def create_table(self):
+        with self.lock, self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS geocodes ("
+                "key TEXT PRIMARY KEY, tier TEXT NOT NULL, lat TEXT, lon TEXT, "
+                "created REAL NOT NULL, accessed REAL NOT NULL)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS geocodes_accessed ON geocodes (accessed)")
+
+    def get(self, tier, key):
+        """returns (True, (lat, lon)) if a fresh entry is cached, else (False, None)"""
+        now = time.time()
+        with self.lock, self.connection:
+            row = self.connection.execute("SELECT lat, lon, created FROM geocodes WHERE key = ? AND tier = ?",
+                                          (key, tier)).fetchone()
+            if row is None:
+                return False, None
+            lat, lon, created = row
+            max_age = self.ttl if lat is not None else self.negative_ttl
+            if now - created > max_age:  # expired - request again
+                return False, None
+            self.connection.execute("UPDATE geocodes SET accessed = ? WHERE key = ?", (now, key))
+        return True, (lat, lon)
+
+    def put(self, tier, key, lat, lon):
+        """saves a result (lat and lon None if not found) and evicts the least recently used entries if full"""
+        now = time.time()
+        with self.lock, self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO geocodes (key, tier, lat, lon, created, accessed) "
+                                    "VALUES (?, ?, ?, ?, ?, ?)", (key, tier, lat, lon, now, now))
+            count = self.connection.execute("SELECT COUNT(*) FROM geocodes").fetchone()[0]
+            if count > self.max_entries:
+                self.connection.execute("DELETE FROM geocodes WHERE key IN "
+                                        "(SELECT key FROM geocodes ORDER BY accessed LIMIT ?)",
+                                        (count - self.max_entries,))
+
+    def lookup(self, tier, key, fetch):
+        """
+        returns the cached (lat, lon) for the key, else calls 'fetch' to request it. Concurrent lookups of the same
+        key are merged into the single request.
+        :param fetch: function returning ((lat, lon), cacheable) - failed requests are not cached
+        """
+        hit, value = self.get(tier, key)
+        if hit:
+            return value
+
+        with self.inflight_lock:
+            lookup = self.inflight.get(key)
+            leader = lookup is None
+            if leader:
+                lookup = self.inflight[key] = InFlightLookup()
+
+        if not leader:  # same key already being requested by another thread
+            lookup.done.wait()
+            return lookup.value
+
+        try:
+            value, cacheable = fetch()
+            if cacheable:
+                self.put(tier, key, *value)
+            lookup.value = value
+            return value
+        finally:
+            with self.inflight_lock:
+                del self.inflight[key]
+            lookup.done.set()
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
@@ -0,0 +1,193 @@
+"""
+Shared HTTP client for the cafe page and geocode requests.
+One pooled requests session (keep-alive connections reused between requests), gzip/brotli compression, timeouts,
+retries, and ETag / Last-Modified conditional requests so unchanged pages return a 304 instead of being downloaded
+again.
+Each request waits for the adaptive per-host rate limiter (ratelimit.py), retries connection errors and 429 / 5xx
+responses with exponential backoff and jitter (at least the Retry-After time), and waits through the circuit
+breaker once a host keeps failing.
+"""
+import sqlite3
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from ratelimit import AdaptiveRateLimiter, CircuitBreaker, RETRY_STATUSES, backoff_delay, parse_retry_after
+from instrumentation import metrics
+
+try:  # requests only decodes brotli responses when a brotli package is installed
+    import brotli  # noqa: F401
+    ACCEPT_ENCODING = "gzip, deflate, br"
+except ImportError:
+    try:
+        import brotlicffi  # noqa: F401
+        ACCEPT_ENCODING = "gzip, deflate, br"
+    except ImportError:
+        ACCEPT_ENCODING = "gzip, deflate"
+
+
+class ValidatorStore:
+    """saves the ETag and Last-Modified response headers for each url in sqlite"""
+    def __init__(self, db_filename):
+        self.db_filename = db_filename
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(db_filename, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute("CREATE TABLE IF NOT EXISTS validators ("
+                                    "url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT)")
+
+    def get(self, url):
+        """returns (etag, last_modified) for the url - both None if not saved"""
+        with self.lock:
+            row = self.connection.execute("SELECT etag, last_modified FROM validators WHERE url = ?",
+                                          (url,)).fetchone()
+        return row if row else (None, None)
+
+    def put(self, url, etag, last_modified):
+        with self.lock, self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO validators (url, etag, last_modified) VALUES (?, ?, ?)",
+                                    (url, etag, last_modified))
+
+    def put_many(self, validators):
+        """saves the validators of the urls (dict of url: (etag, last_modified))"""
+        with self.lock, self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO validators (url, etag, last_modified) "
+                                        "VALUES (?, ?, ?)", [(url, etag, last_modified)
+                                                             for url, (etag, last_modified) in validators.items()])
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+class HttpClient:
+    """
+    pooled session shared by all worker threads.
+    :param timeout: (connect, read) timeout in seconds
+    :param retries: GET retries for connection errors and 429 / 5xx responses
+    :param backoff_factor: maximum seconds between retries grow as backoff_factor * 2 ** retry (random jitter)
+    :param pool_size: keep-alive connections kept open per host - should be at least the number of workers
+    :param validator_db: sqlite file for ETag / Last-Modified headers - conditional requests disabled if None
+    :param rate_limiter: AdaptiveRateLimiter - defaults to 0.5 - 2 requests per second per host
+    :param circuit_breaker: CircuitBreaker - defaults to holding requests back for 60 seconds after 5 failures in a row
+    """
+    def __init__(self, timeout=(10, 30), retries=3, backoff_factor=1, pool_size=10, validator_db=None,
+                 rate_limiter=None, circuit_breaker=None):
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers["Accept-Encoding"] = ACCEPT_ENCODING
+        self.validators = ValidatorStore(validator_db) if validator_db else None
+        self.rate_limiter = rate_limiter or AdaptiveRateLimiter()
+        self.circuit_breaker = circuit_breaker or CircuitBreaker()
+
+    def request(self, method, url, retry=True, **kwargs):
+        """
+        sends the request through the rate limiter and circuit breaker, retrying connection errors and 429 / 5xx
+        responses. The last response is returned if all retries fail, the last connection error is raised.
+        While the circuit of the host is open the request waits (see CircuitBreaker.wait) rather than failing.
+        """
+        attempts = self.retries + 1 if retry else 1
+        for attempt in range(attempts):
+            self.circuit_breaker.wait(url)
+            self.rate_limiter.acquire(url)
+            try:
+                response = self.session.request(method, url, timeout=self.timeout, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                self.rate_limiter.record(url, None)
+                self.circuit_breaker.record_failure(url)
+                metrics.increment("request_retries", reason="connection")
+                if attempt + 1 == attempts:
+                    raise
+                time.sleep(backoff_delay(attempt, self.backoff_factor))
+                continue
+            except requests.exceptions.RequestException:  # e.g. a broken response - not retried
+                self.circuit_breaker.record_failure(url)  # also ends a trial request, else the host waits forever
+                raise
+
+            if response.status_code not in RETRY_STATUSES:
+                self.rate_limiter.record(url, response.status_code)
+                self.circuit_breaker.record_success(url)
+                return response
+
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            self.rate_limiter.record(url, response.status_code, retry_after)
+            self.circuit_breaker.record_failure(url)
+            metrics.increment("request_retries", reason=str(response.status_code))
+            if attempt + 1 == attempts:
+                return response
+            # the limiter already waits out Retry-After - backoff spreads the retries of concurrent workers
+            time.sleep(backoff_delay(attempt, self.backoff_factor))
+        return response
+
+    def get(self, url, params=None, headers=None, conditional=False):
+        """
+        GET request through the pooled session.
+        :param conditional: send the saved ETag / Last-Modified - the response is a 304 if unchanged.
+        The validators of the response are not saved here - see save_validators.
+        """
+        request_headers = dict(headers or {})
+        if conditional and self.validators is not None:
+            etag, last_modified = self.validators.get(url)
+            if etag:
+                request_headers["If-None-Match"] = etag
+            if last_modified:
+                request_headers["If-Modified-Since"] = last_modified
+
+        return self.request("GET", url, params=params, headers=request_headers)
+
+    def save_validators(self, validators):
+        """
+        saves the validators (dict of url: (etag, last_modified), see response_validators) so the next refresh run
+        can make conditional requests. Only called once the page's row is written - a 304 for a page whose row was
+        lost would leave the cafe missing from the output.
+        """
+        if self.validators is not None and validators:
+            self.validators.put_many(validators)
+
+    def post(self, url, data=None, headers=None):
+        """POST request through the pooled session (e.g. the site's 'load more' ajax endpoint)"""
+        return self.request("POST", url, retry=False, data=data, headers=headers)
+
+    def close(self):
+        self.session.close()
+        if self.validators is not None:
+            self.validators.close()
+
+
+client = None  # shared HttpClient - created on first use if not set with use_client()
+client_lock = threading.Lock()
+
+
+def use_client(http_client):
+    """sets the shared client used for all requests"""
+    global client
+    client = http_client
+
+
+def get_client():
+    """returns the shared client, creating one with default settings if not set"""
+    global client
+    with client_lock:
+        if client is None:
+            client = HttpClient()
+        return client
+
+
+def response_validators(response):
+    """returns (etag, last_modified) of a 200 response - None if it has neither"""
+    if response.status_code != 200:
+        return None
+    etag = response.headers.get("ETag")
+    last_modified = response.headers.get("Last-Modified")
+    return (etag, last_modified) if etag or last_modified else None
+
+
+def check_page_response(response):
+    """raises requests.HTTPError unless the page was fetched (2xx) or is not modified (304)"""
+    if response.status_code != 304 and not 200 <= response.status_code < 300:
+        raise requests.exceptions.HTTPError(f"{response.status_code} response for {response.url}", response=response)
@@ -0,0 +1,240 @@
+"""
+Per-stage timing and counters for the scraper - where a slow run spends its time (fetch, parse, each CafeData
+extractor, geocode, save) and how many pages, bytes, geocode fallbacks and extraction failures there were.
+Exported as a JSON file and a Prometheus text-format file, written periodically by a background thread.
+
+Disabled by default - timers and counters then return straight away, so the overhead is a single flag check.
+
+    metrics.enable()
+    with metrics.timer("fetch"):
+        ...
+    metrics.increment("pages_fetched")
+    exporter = MetricsExporter(metrics, "metrics.json", "metrics.prom", interval=30).start()
+"""
+import functools
+import json
+import os
+import threading
+import time
+
+# histogram bucket upper bounds in seconds
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+METRIC_PREFIX = "cafe_scraper"
+
+
+class Histogram:
+    """cumulative latency histogram of one stage"""
+    def __init__(self):
+        self.bucket_counts = [0] * (len(LATENCY_BUCKETS) + 1)  # last bucket is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds):
+        self.count += 1
+        self.sum += seconds
+        for position, upper_bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= upper_bound:
+                self.bucket_counts[position] += 1
+                return
+        self.bucket_counts[-1] += 1
+
+    def cumulative_counts(self):
+        """(upper bound, count of observations <= bound) including '+Inf'"""
+        total = 0
+        counts = []
+        for upper_bound, bucket_count in zip(list(LATENCY_BUCKETS) + ["+Inf"], self.bucket_counts):
+            total += bucket_count
+            counts.append((upper_bound, total))
+        return counts
+
+
+class NullTimer:
+    """timer used while disabled - does nothing"""
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_TIMER = NullTimer()
+
+
+class StageTimer:
+    def __init__(self, metrics, stage):
+        self.metrics = metrics
+        self.stage = stage
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.stage, time.perf_counter() - self.start)
+        return False
+
+
+class Metrics:
+    """thread safe stage histograms and counters"""
+    def __init__(self):
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.histograms = {}  # stage: Histogram
+        self.counters = {}  # (name, ((label, value), ...)): count
+        self.started = time.time()
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        with self.lock:
+            self.histograms = {}
+            self.counters = {}
+            self.started = time.time()
+
+    def collect(self):
+        """returns (histograms, counters) recorded since the last collect and clears them - e.g. in a worker process"""
+        with self.lock:
+            collected = (self.histograms, self.counters)
+            self.histograms = {}
+            self.counters = {}
+        return collected
+
+    def merge(self, collected):
+        """adds the histograms and counters collected in another process"""
+        if not self.enabled:
+            return
+        histograms, counters = collected
+        with self.lock:
+            for stage, other in histograms.items():
+                histogram = self.histograms.get(stage)
+                if histogram is None:
+                    histogram = self.histograms[stage] = Histogram()
+                histogram.count += other.count
+                histogram.sum += other.sum
+                histogram.bucket_counts = [count + other_count for count, other_count
+                                           in zip(histogram.bucket_counts, other.bucket_counts)]
+            for key, value in counters.items():
+                self.counters[key] = self.counters.get(key, 0) + value
+
+    def timer(self, stage):
+        """context manager timing the stage"""
+        if not self.enabled:
+            return NULL_TIMER
+        return StageTimer(self, stage)
+
+    def observe(self, stage, seconds):
+        if not self.enabled:
+            return
+        with self.lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = Histogram()
+            histogram.observe(seconds)
+
+    def increment(self, name, amount=1, **labels):
+        """adds to a counter, e.g. increment("extraction_failures", field="opening")"""
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def to_dict(self):
+        """snapshot of all metrics"""
+        with self.lock:
+            stages = {stage: {"count": histogram.count,
+                              "sum_seconds": round(histogram.sum, 6),
+                              "mean_seconds": round(histogram.sum / histogram.count, 6) if histogram.count else None,
+                              "buckets": {str(bound): count for bound, count in histogram.cumulative_counts()}}
+                      for stage, histogram in self.histograms.items()}
+            counters = {}
+            for (name, labels), value in self.counters.items():
+                label_text = ",".join(f"{label}={label_value}" for label, label_value in labels)
+                counters[f"{name}{{{label_text}}}" if label_text else name] = value
+        return {"started": self.started, "updated": time.time(), "stages": stages, "counters": counters}
+
+    def to_prometheus(self):
+        """metrics in the Prometheus text exposition format"""
+        lines = []
+        with self.lock:
+            histogram_name = f"{METRIC_PREFIX}_stage_seconds"
+            lines.append(f"# HELP {histogram_name} Time spent in each scraper stage.")
+            lines.append(f"# TYPE {histogram_name} histogram")
+            for stage, histogram in sorted(self.histograms.items()):
+                for bound, count in histogram.cumulative_counts():
+                    lines.append(f'{histogram_name}_bucket{{stage="{stage}",le="{bound}"}} {count}')
+                lines.append(f'{histogram_name}_sum{{stage="{stage}"}} {histogram.sum:.6f}')
+                lines.append(f'{histogram_name}_count{{stage="{stage}"}} {histogram.count}')
+
+            names = sorted({name for name, _ in self.counters})
+            for name in names:
+                counter_name = f"{METRIC_PREFIX}_{name}_total"
+                lines.append(f"# TYPE {counter_name} counter")
+                for (key_name, labels), value in sorted(self.counters.items()):
+                    if key_name != name:
+                        continue
+                    label_text = ",".join(f'{label}="{label_value}"' for label, label_value in labels)
+                    lines.append(f"{counter_name}{{{label_text}}} {value}" if label_text
+                                 else f"{counter_name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def timed(stage):
+    """decorator timing each call of the function as the stage"""
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not metrics.enabled:
+                return function(*args, **kwargs)
+            with StageTimer(metrics, stage):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def write_atomic(filename, text):
+    """writes to a temporary file then renames - readers never see a partly written file"""
+    temp_filename = f"{filename}.tmp"
+    with open(temp_filename, "w") as file:
+        file.write(text)
+    os.replace(temp_filename, filename)
+
+
+class MetricsExporter:
+    """writes the metrics to the json and / or prometheus file every 'interval' seconds, and once more on stop"""
+    def __init__(self, metrics_registry, json_filename=None, prometheus_filename=None, interval=30.0):
+        self.metrics = metrics_registry
+        self.json_filename = json_filename
+        self.prometheus_filename = prometheus_filename
+        self.interval = interval
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def export(self):
+        if self.json_filename:
+            write_atomic(self.json_filename, json.dumps(self.metrics.to_dict(), indent=2))
+        if self.prometheus_filename:
+            write_atomic(self.prometheus_filename, self.metrics.to_prometheus())
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            self.export()
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.export()
+
+
+metrics = Metrics()  # shared registry used by all modules
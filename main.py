@@ -4,43 +4,75 @@ then passes extracted links to extractCafeData.py to extract the information fro
 Cafe information extracted: 
     "ID", "Cafe Name", "Link to website", "City", "Street", "Opening times", "Postcode", 
     "Url Location (currently None)", "Has Free Wifi", "Is Laptop Friendly", "Is Pet Friendly", 
-    "Latitude", "Longitude".
+    "Latitude", "Longitude", "Country", "Status".
 Latitude and Longitude collected for potential geolocation use with interactive map functionality. 
 links to extract
+Selenium, requests, tqdm, the staged pipeline (pipeline.py) and the stores are only imported by the runs that use
+them - see cli.py for single stage commands.
 """
-import requests
-from bs4 import BeautifulSoup
+from parsers import parse_cafe_page, cafe_content_hash  # builds only the page containers CafeData needs
 from cafelinks import ExtractCafeLinks  # extracting cafe links from "https://europeancoffeetrip.com/uk/"
 from extractCafeData import CafeData  # extract and process individual cafe data from each cafe hyperlink
+from extractCafeData import use_geocode_cache, use_postcode_index, use_offline_geocoding
+from checkpoint import CheckpointJournal, read_last_line, DONE, UNCHANGED, UNAVAILABLE, FAILED, RETRY_STATUSES
+from writers import create_writer, row_from_dict  # batched csv / parquet output
+from refresh import PageHashStore, diff_links, read_links, save_page_state, update_csv_rows  # incremental refresh
+from instrumentation import metrics, MetricsExporter  # per-stage timing and counters
+from pagearchive import archive_page  # compressed copy of every fetched page
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+import argparse
 import csv
-import time
-from tqdm import tqdm
 import os
+import shutil
+import time
+
+
+def get_html_from_link(link, conditional=False):
+    """
+    returns a beautiful soup object from passed hyperlink, and the ETag / Last-Modified of the response (saved once the
+    cafe's row is written - see refresh.save_page_state).
+    If conditional, returns (None, None) when the page is unchanged since it was last fetched (304 response).
+    Raises requests.HTTPError for any other non 2xx response.
+    """
+    # pooled session shared by page and geocode requests
+    from httpclient import check_page_response, get_client, response_validators
+    with metrics.timer("fetch"):
+        response = get_client().get(link, conditional=conditional)
+    check_page_response(response)  # error pages (404, 429, 5xx ...) are failed fetches, not unavailable cafes
+    if response.status_code == 304:
+        metrics.increment("pages_not_modified")
+        return None, None
+    metrics.increment("pages_fetched")
+    metrics.increment("bytes_downloaded", len(response.content))
+    archive_page(link, response.text)
+    with metrics.timer("parse"):
+        soup = parse_cafe_page(response.text, html_parser_backend)
+    return soup, response_validators(response)
 
 
-def get_html_from_link(link):
-    """returns a beautiful soup object from passed hyperlink"""
-    response = requests.get(link)
-    soup = BeautifulSoup(response.text, 'html.parser')
-    return soup
+def ask_yes_no(question):
+    """asks the user a 'Y/N' question - unattended runs answer with the unattended_restart setting without asking"""
+    if unattended:
+        return unattended_restart
+    return input(question).lower() == 'y'
 
 
 def user_continue(start_number, csv_file):
-    """option for user to continue from last extracted cafe link - or to restart"""
+    """option for user to continue from last extracted cafe link - or to restart. Returns True to restart"""
     print(f"Information extraction will continue from link number: {start_number}\n")
-    restart = input("Would you like to DELETE saved CSV data and RESTART the cafe information extraction? "
-                    "'Y/N'\n")
-    if restart.lower() == 'y':  # delete saved csv file and set start to index 0
+    restart = ask_yes_no("Would you like to DELETE saved CSV data and RESTART the cafe information extraction? "
+                         "'Y/N'\n")
+    if restart:  # delete saved csv file
         delete_file(csv_file)
-        start_number = 0
 
-    return start_number
+    return restart
 
 
 def user_restart_csv(csv_file):
     print("All cafe information already extracted.")
-    re_do = input("Would you like to delete and restart the cafe information extraction? 'Y/N'\n")
-    if re_do.lower() == 'y':
+    re_do = ask_yes_no("Would you like to delete and restart the cafe information extraction? 'Y/N'\n")
+    if re_do:
         # delete previous csv file
         delete_file(csv_file)
         return True
@@ -50,79 +82,681 @@ def user_restart_csv(csv_file):
 
 def get_starting_link_number(cafe_data_csvfile):
     """
-    Gets the last processed cafe index. If none processed yet - returns index 0. Else (due to runtime stopped or
-    interrupted) gets the last cafe data saved index and returns this index
+    Gets the last processed cafe index from a CSV saved before the checkpoint journal was added. If none processed
+    yet - returns index 0. Else gets the last cafe data saved index and returns this index.
+    Only the header and last line are read, not the whole CSV.
     """
     starting_number = 0
     try:
         # get the last cafe index number
         with open(cafe_data_csvfile, "r") as file:
             print("\nCafe CSV data previously exists")
-            reader = csv.reader(file, delimiter=',')
-            rows = list(reader)
-            header = rows[0]
-            id_index = header.index('ID')
-            last_row = rows[-1]
+            header = next(csv.reader(file, delimiter=','))
+        id_index = header.index('ID')
+        last_row = next(csv.reader([read_last_line(cafe_data_csvfile)], delimiter=','))
+        if last_row != header:  # at least one cafe saved
             id_value = last_row[id_index]  # obtain last saved cafe index
             starting_number = int(id_value)
 
-            # option for user to delete csv and restart extraction
-            starting_number = user_continue(starting_number, cafe_data_csvfile)
-
-    except FileNotFoundError:  # no csv file created yet - do nothing
+    except (FileNotFoundError, StopIteration):  # no csv file created yet - do nothing
         pass
 
     return starting_number
 
 
+def get_links_to_process(links, journal, cafe_data_csvfile, retry_failed=False):
+    """
+    returns the indexes of the links still to be processed, from the checkpoint journal.
+    Option for the user to restart if a previous extraction exists.
+    :param retry_failed: only return the links that were unavailable or failed to fetch
+    """
+    if retry_failed:
+        return [index for index, link in enumerate(links) if journal.get_status(link) in RETRY_STATUSES]
+
+    if len(journal) == 0 and os.path.isfile(cafe_data_csvfile) and cafe_data_csvfile.endswith(".csv"):
+        # csv saved before the journal was added - mark the links up to the last saved ID as done
+        starting_number = get_starting_link_number(cafe_data_csvfile)
+        for index, link in enumerate(links[:starting_number]):
+            journal.record(link, index, DONE)
+
+    remaining = [index for index, link in enumerate(links) if not journal.is_processed(link)]
+
+    if len(journal) > 0:
+        if not remaining:
+            restart = user_restart_csv(cafe_data_csvfile)
+        else:
+            # option for user to delete csv and restart extraction
+            restart = user_continue(len(links) - len(remaining), cafe_data_csvfile)
+        if restart:
+            journal.clear()
+            remaining = list(range(len(links)))
+
+    return remaining
+
+
 def delete_file(file_name):
-    os.remove(f"./{file_name}")
+    if os.path.isdir(f"./{file_name}"):  # parquet dataset directory
+        shutil.rmtree(f"./{file_name}")
+    elif os.path.exists(f"./{file_name}"):
+        os.remove(f"./{file_name}")
+    for sqlite_file in (f"./{file_name}-wal", f"./{file_name}-shm"):  # sqlite output write ahead log
+        if os.path.exists(sqlite_file):
+            os.remove(sqlite_file)
+
+
+def get_output_filename(cafe_data_csvfile, output_format):
+    """
+    output file for the format, named after the csv - e.g. the sqlite database 'all_cafes_csv.sqlite' and the parquet
+    dataset directory 'all_cafes_csv.parquet'
+    """
+    if output_format in ("sqlite", "parquet"):
+        return f"{os.path.splitext(cafe_data_csvfile)[0]}.{output_format}"
+    return cafe_data_csvfile
 
 
-def create_cafe_data(link_filename, cafe_data_csvfile):
+def update_output_rows(cafe_data_csvfile, updated_rows, closed_links, output_format="csv"):
+    """
+    replaces / adds the updated rows and marks the closed links in the output - the csv is rewritten, the sqlite
+    database updated in place (parquet datasets are append only and not supported).
+    :param updated_rows: dict of link: row (CSV_HEADER order)
+    :return: (number of rows replaced, number of rows added, number of rows closed)
+    """
+    if output_format == "sqlite":
+        from resultstore import ResultStore  # sqlite output upserted by cafe link
+        store = ResultStore(cafe_data_csvfile)
+        try:
+            return store.update_rows(updated_rows, closed_links)
+        finally:
+            store.close()
+    if output_format == "csv":
+        return update_csv_rows(cafe_data_csvfile, updated_rows, closed_links)
+    raise ValueError(f"Rows can't be updated in place in {output_format} output. Options: csv, sqlite")
+
+
+def get_checkpoint_filename(cafe_data_csvfile):
+    """
+    checkpoint journal filename of the output file e.g. 'all_cafes_csv.csv' -> 'all_cafes_csv_checkpoint.log', and
+    'all_cafes_csv.sqlite' -> 'all_cafes_csv_sqlite_checkpoint.log' - each output format has its own journal
+    """
+    base, extension = os.path.splitext(cafe_data_csvfile)
+    if extension in ("", ".csv"):
+        return f"{base}_checkpoint.log"
+    return f"{base}_{extension[1:]}_checkpoint.log"
+
+
+def fetch_cafe_data(link, number, cafe_data_csvfile, detailed_report, rate_limiter, conditional=False,
+                    previous_hash=None, country="UK"):
+    """
+    waits for a rate limit token (if a rate_limiter is passed - the http client also rate limits each host), then
+    fetches and extracts the cafe data of a single link (runs in a worker).
+    Returns None if the page is unchanged - a 304 response to a conditional request, or the same cafe content hash
+    as previous_hash.
+    """
+    if rate_limiter is not None:
+        rate_limiter.acquire(link)
+    soup_html, validators = get_html_from_link(link, conditional)
+    if soup_html is None:
+        return None
+    content_hash = cafe_content_hash(soup_html)
+    if previous_hash is not None and content_hash == previous_hash:
+        save_page_state(None, {link: (content_hash, validators)})  # the saved row is still current
+        return None
+    # pass to CafeData class to extract cafe data
+    link_data = CafeData(soup_html, number, link, cafe_data_csvfile, detailed_report, country)
+    link_data.content_hash = content_hash
+    link_data.validators = validators
+    link_data.extract_all_data()
+    return link_data
+
+
+def process_links(link_items, cafe_data_csvfile, detailed_report, workers, rate_limiter, conditional=False,
+                  page_hashes=None, country="UK", catch_all=False):
+    """
+    fetches and extracts the links concurrently in a pool of worker threads, with a bounded number in flight so
+    memory stays flat for large link files.
+    :param link_items: iterable of (index, link) - the cafe ID is index + 1
+    :param page_hashes: PageHashStore - links with an unchanged content hash are returned as unchanged
+    :param country: country code of the cafes (see regions.py)
+    :param catch_all: any other error of a link is returned as its error too, instead of raised (unattended runs)
+    :return: generator of (index, link, link_data, error) in link_items order - link_data None if unchanged or error
+    """
+    import requests
+    caught_errors = Exception if catch_all else (AttributeError, requests.exceptions.RequestException)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = deque()  # futures in link index order
+        link_items = iter(link_items)
+
+        def submit_next():
+            """submits the next non-processed link to the pool - returns False when none left"""
+            item = next(link_items, None)
+            if item is None:
+                return False
+            index, link = item
+            previous_hash = page_hashes.get(link) if page_hashes is not None else None
+            pending.append((index, link, executor.submit(fetch_cafe_data, link, index+1, cafe_data_csvfile,
+                                                         detailed_report, rate_limiter, conditional,
+                                                         previous_hash, country)))
+            return True
+
+        for _ in range(workers * 2):
+            if not submit_next():
+                break
+
+        while pending:
+            index, link, future = pending.popleft()
+            try:
+                yield index, link, future.result(), None
+            except caught_errors as e:
+                yield index, link, None, e
+            submit_next()
+
+
+def create_cafe_data(link_filename, cafe_data_csvfile, workers=None, requests_per_second=None, conditional=False,
+                     retry_failed=False, checkpoint_filename=None, output_format="csv", page_hashes=None,
+                     country="UK", rate_limiter=None, detailed_report=None, staged=None):
     """
     opens the txt file with the individual cafe hyperlinks, passes to CafeData class to extract all the
-    required data. If data extraction is interrupted then it resumes from the next link not previously processed.
+    required data. If data extraction is interrupted then it resumes from the links not previously processed -
+    the status of each link is saved to a checkpoint journal.
+    Links are fetched concurrently by a pool of worker threads, but saved in link index order - or with 'staged',
+    fetched by async workers and parsed in a pool of processes, saved in the order they finish (see pipeline.py).
     :param link_filename: cafe links txt file
     :param cafe_data_csvfile: csv file for extracted cafe data
+    :param workers: number of concurrent fetch workers
+    :param requests_per_second: fixed maximum requests per second to each host - if None the http client's adaptive
+    rate limiter sets the pace
+    :param conditional: skip pages unchanged since they were last fetched (refresh runs)
+    :param retry_failed: only process the links previously unavailable or failed to fetch
+    :param checkpoint_filename: checkpoint journal file - defaults to the output filename with '_checkpoint.log'
+    :param output_format: 'csv', 'parquet' (cafe_data_csvfile is then the parquet dataset directory) or 'sqlite'
+    (cafe_data_csvfile is then the database - rows are upserted by link, see resultstore.py)
+    :param page_hashes: PageHashStore to save the content hash of each page to, for later refresh runs
+    :param country: country code of the cafes (see regions.py)
+    :param rate_limiter: HostRateLimiter shared between runs - one is created from requests_per_second if None
+    :param detailed_report: display each link's extracted information - the user is asked if None
+    :param staged: use the staged process pool pipeline - defaults to the staged_pipeline setting
     """
-    next_link_index = get_starting_link_number(cafe_data_csvfile)  # get next non-processed cafe link index
-    with open(link_filename, "r") as file:
+    workers = workers or fetch_workers
+    staged = staged_pipeline if staged is None else staged
+    if rate_limiter is None and requests_per_second:
+        from ratelimit import HostRateLimiter
+        rate_limiter = HostRateLimiter(requests_per_second)
+    journal = CheckpointJournal(checkpoint_filename or get_checkpoint_filename(cafe_data_csvfile))
+    links = read_links(link_filename)
+
+    link_indexes_to_process = get_links_to_process(links, journal, cafe_data_csvfile, retry_failed)
 
+    if detailed_report is None and (staged or unattended):  # staged extraction runs in other processes
+        detailed_report = False
+    elif detailed_report is None:
         level_needed = input("Display individual link extracted information?: 'Y/N'\n")
         detailed_report = True if level_needed.lower() == 'y' else False
 
-        links = file.readlines()
-        # loop through all non previously processed links
-        for link in tqdm(links[next_link_index:], desc="No. Links Processed", colour="green",
-                         initial=next_link_index, total=len(links)):
-            try:
-                if next_link_index == len(links):
-                    raise IndexError
-                link = link.strip()
-                """could make below function a part of the class methods"""
-                soup_html = get_html_from_link(link)
-                # pass to CafeData class to extract cafe data
-                link_data = CafeData(soup_html, next_link_index+1, link, cafe_data_csvfile, detailed_report)
-                link_data.extract_all_data()
-                link_data.save_entry()
-                time.sleep(2)
-            except AttributeError as e:
-                print(f"Cafe {next_link_index} unavailable")
-            next_link_index += 1
+    from tqdm import tqdm  # progress bar - only imported by the runs that show one
+    progress = tqdm(desc="No. Links Processed", colour="green", initial=len(links) - len(link_indexes_to_process),
+                    total=len(links))
+    writer = create_writer(output_format, cafe_data_csvfile, output_flush_rows, output_flush_seconds)
+    unsaved_indexes = []  # rows still buffered in the writer - only marked done in the journal once written
+    # link: (content hash, validators) of the buffered rows - saved with the rows, so a lost row is re-fetched
+    unsaved_pages = {}
+
+    def record_saved():
+        for saved_index in unsaved_indexes:
+            journal.record(links[saved_index], saved_index, DONE)
+        unsaved_indexes.clear()
+        save_page_state(page_hashes, unsaved_pages)
+        unsaved_pages.clear()
+
+    try:
+        link_items = ((index, links[index]) for index in link_indexes_to_process)
+        if staged:
+            from pipeline import run_staged_pipeline  # async fetch -> process pool extract -> single writer
+            run_staged_pipeline(link_items, writer, journal, rate_limiter, fetch_workers=workers,
+                                processes=parse_processes, geocode_workers=geocode_workers, queue_size=workers * 4,
+                                conditional=conditional, parser_backend=html_parser_backend, country=country,
+                                progress=progress, page_hashes=page_hashes)
+            return
+        # save results in link index order
+        for index, link, link_data, error in process_links(link_items, cafe_data_csvfile, detailed_report, workers,
+                                                           rate_limiter, conditional, country=country):
+            if isinstance(error, AttributeError):
+                print(f"Cafe {index} unavailable")
+                metrics.increment("extraction_failures", field="page")
+                journal.record(link, index, UNAVAILABLE)
+            elif error is not None:
+                print(f"Cafe {index} could not be fetched: {error}")
+                metrics.increment("fetch_failures")
+                journal.record(link, index, FAILED)
+            elif link_data is None:  # unchanged since last fetched
+                journal.record(link, index, UNCHANGED)
+            else:
+                unsaved_pages[link] = (link_data.content_hash, link_data.validators)
+                unsaved_indexes.append(index)
+                with metrics.timer("save"):
+                    saved = link_data.save_entry(writer)
+                if saved:
+                    record_saved()
+            progress.update(1)
+    finally:  # rows buffered in the writer are still saved if the run is interrupted
+        writer.close()
+        record_saved()
+        progress.close()
+        journal.close()
+
+
+def refresh_cafe_data(link_filename, current_links, cafe_data_csvfile, page_hashes, workers=None,
+                      requests_per_second=None, checkpoint_filename=None, country="UK", output_format="csv"):
+    """
+    incremental refresh - only scrapes new cafe links, and previously saved cafes whose page has changed (304
+    response or unchanged content hash are skipped). Cafes no longer listed are marked as closed in the csv - or
+    with output_format 'sqlite', updated in place in the database.
+    The links txt file is then updated to the current links.
+    :param link_filename: links txt file from the previous run
+    :param current_links: freshly discovered cafe links
+    :param page_hashes: PageHashStore of the content hash of each previously scraped page
+    """
+    workers = workers or fetch_workers
+    rate_limiter = None
+    if requests_per_second:
+        from ratelimit import HostRateLimiter
+        rate_limiter = HostRateLimiter(requests_per_second)
+    journal = CheckpointJournal(checkpoint_filename or get_checkpoint_filename(cafe_data_csvfile))
+    new_links, existing_links, removed_links = diff_links(read_links(link_filename), current_links)
+    print(f"Refresh: {len(new_links)} new, {len(existing_links)} existing, {len(removed_links)} removed cafes")
+
+    from tqdm import tqdm
+    link_indexes = {link: index for index, link in enumerate(current_links)}
+    links_to_check = sorted(new_links + existing_links, key=link_indexes.get)
+    updated_rows = {}
+    updated_pages = {}  # saved once the rows are written, so a row lost to an error is fetched again
+    try:
+        link_items = ((link_indexes[link], link) for link in links_to_check)
+        for index, link, link_data, error in tqdm(
+                process_links(link_items, cafe_data_csvfile, False, workers, rate_limiter, conditional=True,
+                              page_hashes=page_hashes, country=country),
+                desc="No. Links Checked", colour="green", total=len(links_to_check)):
+            if isinstance(error, AttributeError):
+                journal.record(link, index, UNAVAILABLE)
+            elif error is not None:
+                print(f"Cafe {index} could not be fetched: {error}")
+                journal.record(link, index, FAILED)
+            elif link_data is None:
+                journal.record(link, index, UNCHANGED)
+            else:
+                updated_pages[link] = (link_data.content_hash, link_data.validators)
+                updated_rows[link] = link_data.get_row()
+                journal.record(link, index, DONE)
+    finally:  # save the cafes refreshed so far if interrupted
+        replaced, added, closed = update_output_rows(cafe_data_csvfile, updated_rows, removed_links, output_format)
+        save_page_state(page_hashes, updated_pages)
+        journal.close()
+        print(f"Refresh: {replaced} cafes updated, {added} added, {closed} marked closed")
+
+    with open(link_filename, "w") as file:
+        for link in current_links:
+            file.write(link + '\n')
+
+
+def reextract_cafe_data(link_filename, cafe_data_csvfile, page_archive, processes=None, country="UK",
+                        output_format="csv"):
+    """
+    re-runs the cafe data extraction over the archived pages (pagearchive.py) without any network requests - e.g.
+    after fixing CafeData for a changed html class name. The pages are parsed in a pool of processes.
+    Latitude / longitude are kept from the previous row if the address is unchanged, else only taken from the
+    postcode index / geocode cache. IDs and status of previously saved cafes are kept, and rows of cafes without an
+    archived page are copied unchanged. The output file is replaced once all pages are re-extracted - or with
+    output_format 'sqlite', the rows are updated in place.
+    """
+    from tqdm import tqdm
+    from pipeline import extract_page  # parses an archived page in a worker process
+    links = read_links(link_filename)
+    in_place = output_format == "sqlite"
+    previous_rows = {}  # link: csv row dict
+    if output_format == "csv" and os.path.exists(cafe_data_csvfile):
+        with open(cafe_data_csvfile, "r", newline="") as file:
+            previous_rows = {row["Link"]: row for row in csv.DictReader(file)}
+    elif in_place and os.path.exists(cafe_data_csvfile):
+        from resultstore import ResultStore
+        store = ResultStore(cafe_data_csvfile)
+        previous_rows = {row["Link"]: row for row in store.query(status=None)}
+        store.close()
+    next_id = max([int(row["ID"]) for row in previous_rows.values() if row["ID"]] + [len(links)]) + 1
+
+    archived = [(index, link) for index, link in enumerate(links) if link in page_archive]
+    print(f"Re-extracting {len(archived)} archived cafe pages ({len(links) - len(archived)} not archived)")
+    use_offline_geocoding(True)
+    temp_output = cafe_data_csvfile if in_place else f"{cafe_data_csvfile}.reextract"
+    if not in_place:
+        delete_file(temp_output)
+    writer = create_writer(output_format, temp_output, output_flush_rows, output_flush_seconds)
+    unavailable = 0
+    batch_size = (processes or os.cpu_count() or 1) * 8  # pages in memory at a time
+    try:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=processes) as process_pool, \
+                tqdm(desc="No. Pages Re-extracted", colour="green", total=len(archived)) as progress:
+            for start in range(0, len(archived), batch_size):
+                batch = archived[start:start + batch_size]
+                pages = [page_archive.get(link) for _, link in batch]
+                cafes = process_pool.map(extract_page, [link for _, link in batch],
+                                         [index + 1 for index, _ in batch], pages,
+                                         [html_parser_backend] * len(batch), [country] * len(batch))
+                for (index, link), cafe in zip(batch, cafes):
+                    progress.update(1)
+                    previous = previous_rows.pop(link, None)
+                    if cafe is None:
+                        unavailable += 1
+                        if previous is not None and not in_place:  # keep the previously extracted data
+                            writer.write_row(row_from_dict(previous))
+                        continue
+                    if previous is not None:
+                        cafe.id = int(previous["ID"]) if previous["ID"] else cafe.id
+                        cafe.status = previous.get("Status") or cafe.status
+                        same_address = ((previous["Street"] or "", previous["City"] or "", previous["Postcode"] or "")
+                                        == (cafe.street_location or "", cafe.city or "", cafe.postcode or ""))
+                        if same_address and previous["Latitude"]:
+                            cafe.latitude, cafe.longitude = previous["Latitude"], previous["Longitude"]
+                    elif previous_rows:
+                        cafe.id = next_id
+                        next_id += 1
+                    if cafe.latitude is None:
+                        cafe.get_latitude_longitude()
+                    writer.write_row(cafe.to_record())
+
+            if not in_place:
+                for previous in previous_rows.values():  # cafes without an archived page, e.g. closed cafes
+                    writer.write_row(row_from_dict(previous))
+    except BaseException:
+        writer.close()
+        if not in_place:
+            delete_file(temp_output)
+        raise
+    finally:
+        use_offline_geocoding(False)
+    writer.close()
+    if not in_place:
+        delete_file(cafe_data_csvfile)
+        os.replace(temp_output, cafe_data_csvfile)
+    print(f"Re-extracted {len(archived) - unavailable} cafes, {unavailable} pages unavailable")
+
+
+def queue_worker_cafe_data(work_queue, worker, shard_filename, workers=None, output_format="csv", page_hashes=None,
+                           country="UK"):
+    """
+    one worker of a crawl split between several processes or machines (see workqueue.py) - claims batches of links
+    from the shared work queue and saves their cafe data to its own shard file, until no links are left.
+    A link is only marked done in the queue once its row is written to the shard. Leases are renewed while the
+    worker runs, and links not finished are released when it stops - or handed to other workers once their leases
+    expire if it crashes.
+    :param work_queue: WorkQueue shared by the workers
+    :param worker: unique worker name e.g. 'worker-1'
+    :param shard_filename: output shard of this worker (get_shard_filename)
+    """
+    from workqueue import LeaseKeeper
+    workers = workers or fetch_workers
+    lease_keeper = LeaseKeeper(work_queue, worker).start()
+    writer = create_writer(output_format, shard_filename, output_flush_rows, output_flush_seconds)
+    from tqdm import tqdm
+    progress = tqdm(desc=f"No. Links Processed ({worker})", colour="green")
+    unsaved_links = []  # rows still buffered in the writer - only marked done in the queue once written
+    unsaved_pages = {}  # link: (content hash, validators) of the buffered rows
+
+    def finish(links, status):
+        for finished_link in links:
+            work_queue.complete(worker, finished_link, status)
+        lease_keeper.drop(links)
+
+    def record_saved():
+        finish(unsaved_links, DONE)
+        unsaved_links.clear()
+        save_page_state(page_hashes, unsaved_pages)
+        unsaved_pages.clear()
+
+    try:
+        while True:
+            batch = work_queue.claim(worker, queue_batch_size)
+            if not batch:
+                writer.flush()
+                record_saved()
+                if work_queue.remaining() == 0:
+                    break
+                # other workers hold the remaining links - claimed here if their leases expire
+                time.sleep(queue_poll_seconds)
+                continue
+            lease_keeper.hold(link for _, link in batch)
+            for index, link, link_data, error in process_links(batch, shard_filename, False, workers, None,
+                                                               country=country):
+                if isinstance(error, AttributeError):
+                    metrics.increment("extraction_failures", field="page")
+                    finish([link], UNAVAILABLE)
+                elif error is not None:
+                    print(f"Cafe {index} could not be fetched: {error}")
+                    metrics.increment("fetch_failures")
+                    finish([link], FAILED)
+                else:
+                    unsaved_pages[link] = (link_data.content_hash, link_data.validators)
+                    unsaved_links.append(link)
+                    with metrics.timer("save"):
+                        saved = link_data.save_entry(writer)
+                    if saved:
+                        record_saved()
+                progress.update(1)
+    finally:  # buffered rows are saved, and links not finished are released to the other workers
+        writer.close()
+        record_saved()
+        lease_keeper.stop()
+        progress.close()
+
+
+def merge_cafe_data_shards(cafe_data_csvfile, output_format="csv", work_queue=None):
+    """
+    combines the worker shards into the output file, one row per cafe link in link order - replacing the output
+    file, or with output_format 'sqlite' upserted into it. The shards are deleted once merged.
+    :param work_queue: WorkQueue the links were crawled from - for the link order
+    """
+    from workqueue import find_shards, merge_shards
+    shard_filenames = find_shards(cafe_data_csvfile)
+    if not shard_filenames:
+        print("No worker shards to merge")
+        return
+    in_place = output_format == "sqlite"
+    temp_output = cafe_data_csvfile if in_place else f"{cafe_data_csvfile}.merge"
+    if not in_place:
+        delete_file(temp_output)
+    link_indexes = work_queue.link_indexes() if work_queue is not None else None
+    with create_writer(output_format, temp_output, output_flush_rows, output_flush_seconds) as writer:
+        total = merge_shards(shard_filenames, output_format, writer, link_indexes)
+    if not in_place:
+        delete_file(cafe_data_csvfile)
+        os.replace(temp_output, cafe_data_csvfile)
+    for shard_filename in shard_filenames:
+        delete_file(shard_filename)
+    print(f"Merged {total} cafes from {len(shard_filenames)} worker shards")
+
+
+def use_shared_clients(http=True):
+    """
+    sets up the pooled http client, geocode cache and postcode index shared by all page and geocode requests.
+    :param http: False for the runs that make no requests (offline geocoding, archived pages) - requests is then not
+    imported
+    """
+    from geocache import GeocodeCache  # persistent latitude / longitude cache between runs
+    from postcodeindex import PostcodeIndex  # offline postcode centroid latitude / longitude
+    if http:
+        from httpclient import HttpClient, use_client  # pooled session shared by page and geocode requests
+        from ratelimit import AdaptiveRateLimiter, CircuitBreaker  # in place of fixed sleeps
+        use_client(HttpClient(timeout=request_timeout, retries=request_retries, pool_size=fetch_workers,
+                              validator_db=http_validators_filename,
+                              rate_limiter=AdaptiveRateLimiter(start_requests_per_second, max_requests_per_second),
+                              circuit_breaker=CircuitBreaker(circuit_breaker_failures, circuit_breaker_reset_seconds)))
+
+    # reuse latitude / longitude from previous runs
+    use_geocode_cache(GeocodeCache(geocode_cache_filename))
+    if os.path.exists(postcode_index_filename):  # postcode centroids without openstreetmap requests
+        use_postcode_index(PostcodeIndex(postcode_index_filename), postcode_index_street_precision)
+
+
+def create_link_scraper():
+    """ExtractCafeLinks for the links file with the discovery settings - unattended runs answer its prompts"""
+    return ExtractCafeLinks(result_txt_filename=cafe_links_txt_filename, discovery_mode=link_discovery_mode,
+                            lean_browser=lean_browser, overwrite_links=unattended_restart if unattended else None)
 
 
 # define filenames
 cafe_links_txt_filename = "cafes_links.txt"  # filename for holding initial individual cafe hyperlinks
 extracted_cafe_data_csv = "all_cafes_csv.csv"  # csv filename for holding processed individual cafes data
+geocode_cache_filename = "geocode_cache.sqlite"  # sqlite cache of previously geocoded addresses
+postcode_index_filename = "postcodes.idx"  # offline postcode index built with postcodeindex.py (optional)
+postcode_index_street_precision = True  # full addresses still geocoded to the street - False: postcode centroids only
+http_validators_filename = "http_validators.sqlite"  # ETag / Last-Modified of fetched pages for conditional requests
+metrics_json_filename = "metrics.json"  # per-stage timings and counters, written with --metrics
+metrics_prometheus_filename = "metrics.prom"  # the same metrics in prometheus text format
+page_hashes_filename = "page_hashes.sqlite"  # content hash of each cafe page - to find changed cafes on refresh
+page_archive_filename = "pages.pack"  # compressed copy of every fetched page for --reextract (index "pages.pack.idx")
+work_queue_filename = "work_queue.sqlite"  # links shared between --worker processes (workqueue.py)
+# with --regions, each region uses "cafes_links_<region>.txt" and "all_cafes_<region>.csv" (see regions.py)
+
+# define fetch settings
+link_discovery_mode = "http"  # "http" (no browser - falls back to the browser if it fails) or "browser"
+fetch_workers = 4  # number of cafe links fetched concurrently
+region_workers = 4  # number of region listing pages read concurrently (--regions)
+region_browsers = 2  # maximum headless browsers open at the same time for the browser fallback (--regions)
+lean_browser = True  # browser fallback blocks images, css, fonts and other hosts, and reads the links in the page
+start_requests_per_second = 0.5  # per host - the previous fixed 2 second wait, sped up while responses are ok
+max_requests_per_second = 2.0  # per host - halved on each 429 / 503 response (Nominatim is limited to 1 by policy)
+request_timeout = (10, 30)  # connect and read timeout in seconds
+request_retries = 3  # retries on connection errors and 429 / 5xx responses, with exponential backoff and jitter
+circuit_breaker_failures = 5  # failures in a row before requests to a host are stopped
+circuit_breaker_reset_seconds = 60  # seconds requests to a stopped host wait before a trial request
+output_format = "csv"  # "csv", "parquet" (typed columns, requires pyarrow) or "sqlite" (upserted by link)
+output_flush_rows = 50  # rows buffered before writing to the output file
+output_flush_seconds = 5.0  # maximum seconds rows are buffered
+metrics_interval = 30  # seconds between metrics file updates
+html_parser_backend = None  # "html.parser", "strained" or "lxml" - None for the fastest installed (see parsers.py)
+archive_pages = True  # save every fetched page to page_archive_filename
+page_archive_compression = "gzip"  # "gzip", or "zstd" (requires zstandard)
+staged_pipeline = False  # parse / extract in a pool of processes fed by async fetchers (--staged)
+parse_processes = None  # staged pipeline parser processes - None for one per cpu core
+geocode_workers = 2  # staged pipeline concurrent geocode lookups
+unattended = False  # never prompt (cron / services, --unattended) - previous links and output are kept and resumed
+unattended_restart = False  # unattended runs delete the previous links and output and start again (--restart)
+queue_batch_size = 20  # links claimed from the work queue at a time (--worker)
+queue_lease_seconds = 300  # seconds a worker's claimed links are held without renewal before other workers take them
+queue_max_attempts = 3  # claims of a link before it is marked failed - e.g. a worker crashing on the page
+queue_poll_seconds = 10  # wait before checking again when the other workers hold all remaining links
 
 
 if __name__ == "__main__":
+    from regions import REGIONS, crawl_region_listings, get_region_filenames  # multi-country crawl
+    from pagearchive import PageArchive, use_page_archive
+    from workqueue import WorkQueue, get_shard_filename  # multi-worker crawl
+    parser = argparse.ArgumentParser(description="Extract UK cafe data from europeancoffeetrip to CSV")
+    parser.add_argument("--retry-failed", action="store_true",
+                        help="only re-process the cafe links that were unavailable or failed to fetch")
+    parser.add_argument("--refresh", action="store_true",
+                        help="only scrape new or changed cafes, and mark cafes no longer listed as closed")
+    parser.add_argument("--regions", nargs="+", choices=sorted(REGIONS) + ["all"], metavar="REGION",
+                        help=f"crawl these regions ('all' or any of: {', '.join(REGIONS)}) to per-region files")
+    parser.add_argument("--metrics", action="store_true",
+                        help=f"record per-stage timings and counters to {metrics_json_filename} and "
+                             f"{metrics_prometheus_filename}")
+    parser.add_argument("--reextract", action="store_true",
+                        help=f"re-extract the cafe data from the pages archived in {page_archive_filename} - "
+                             f"no network requests")
+    parser.add_argument("--staged", action="store_true",
+                        help="parse the cafe pages in a pool of processes fed by async fetchers")
+    parser.add_argument("--queue-links", action="store_true",
+                        help=f"discover the cafe links and add them to the work queue {work_queue_filename}")
+    parser.add_argument("--worker", metavar="NAME",
+                        help="crawl links from the work queue to this worker's own output shard")
+    parser.add_argument("--merge", action="store_true",
+                        help="combine the worker output shards into the output file")
+    parser.add_argument("--unattended", action="store_true",
+                        help="never prompt - keep and resume the previous links and output (see also --restart)")
+    parser.add_argument("--restart", action="store_true",
+                        help="with --unattended, delete the previous links and output and start again")
+    args = parser.parse_args()
+    staged_pipeline = staged_pipeline or args.staged
+    unattended = unattended or args.unattended
+    unattended_restart = unattended_restart or args.restart
+
+    exporter = None
+    if args.metrics:
+        metrics.enable()
+        exporter = MetricsExporter(metrics, metrics_json_filename, metrics_prometheus_filename,
+                                   metrics_interval).start()
+
+    # one pooled session for all page and geocode requests
+    use_shared_clients()
 
-    # get the initial cafe hyperlinks
-    cafe_scraper = ExtractCafeLinks(result_txt_filename=cafe_links_txt_filename)  # initialise
-    cafe_scraper.run_webscraping()  # get all target cafe links from website
+    page_archive = None
+    # the page pack is appended by one process only - not archived by queue workers
+    if (archive_pages and not args.worker) or args.reextract:
+        page_archive = PageArchive(page_archive_filename, page_archive_compression)
+        if not args.reextract:
+            use_page_archive(page_archive)
 
-    # pass txt file with links and destination csv file
-    create_cafe_data(cafe_scraper.get_txt_file_name(), extracted_cafe_data_csv)
+    cafe_scraper = create_link_scraper()  # initialise
+    page_hash_store = PageHashStore(page_hashes_filename)
+
+    try:
+        if args.reextract:
+            if args.regions:
+                region_slugs = list(REGIONS) if "all" in args.regions else args.regions
+                for slug in region_slugs:
+                    region_links_txt, region_csv = get_region_filenames(slug)
+                    if os.path.exists(region_links_txt):
+                        print(f"\nRe-extracting region: {slug}")
+                        reextract_cafe_data(region_links_txt, get_output_filename(region_csv, output_format),
+                                            page_archive, parse_processes, REGIONS[slug], output_format)
+            else:
+                reextract_cafe_data(cafe_links_txt_filename,
+                                    get_output_filename(extracted_cafe_data_csv, output_format), page_archive,
+                                    parse_processes, output_format=output_format)
+        elif args.queue_links or args.worker or args.merge:
+            work_queue = WorkQueue(work_queue_filename, queue_lease_seconds, queue_max_attempts)
+            output_filename = get_output_filename(extracted_cafe_data_csv, output_format)
+            if args.queue_links:
+                cafe_scraper.run_webscraping()
+                added = work_queue.add_links(read_links(cafe_scraper.get_txt_file_name()))
+                if args.retry_failed:
+                    added += work_queue.retry_failed()
+                print(f"{added} links added to the work queue: {work_queue.counts()}")
+            if args.worker:
+                queue_worker_cafe_data(work_queue, args.worker, get_shard_filename(output_filename, args.worker),
+                                       output_format=output_format, page_hashes=page_hash_store)
+            if args.merge:
+                merge_cafe_data_shards(output_filename, output_format, work_queue)
+            work_queue.close()
+        elif args.regions:
+            region_slugs = list(REGIONS) if "all" in args.regions else args.regions
+            # listing pages of all regions read in parallel
+            crawl_region_listings(region_slugs, link_discovery_mode, region_workers, region_browsers,
+                                  lean_browser)
+            # cafe pages all on the same host - regions extracted one after another sharing the client's rate limit
+            for slug in region_slugs:
+                region_links_txt, region_csv = get_region_filenames(slug)
+                if os.path.exists(region_links_txt):
+                    print(f"\nExtracting region: {slug}")
+                    create_cafe_data(region_links_txt, get_output_filename(region_csv, output_format),
+                                     retry_failed=args.retry_failed,
+                                     output_format=output_format, page_hashes=page_hash_store,
+                                     country=REGIONS[slug])
+        elif args.refresh:
+            # compare freshly discovered links with the previously saved links
+            refresh_cafe_data(cafe_links_txt_filename, cafe_scraper.discover_links(),
+                              get_output_filename(extracted_cafe_data_csv, output_format), page_hash_store,
+                              output_format=output_format)
+        else:
+            # get the initial cafe hyperlinks
+            cafe_scraper.run_webscraping()  # get all target cafe links from website
 
+            # pass txt file with links and destination csv file
+            create_cafe_data(cafe_scraper.get_txt_file_name(),
+                             get_output_filename(extracted_cafe_data_csv, output_format),
+                             retry_failed=args.retry_failed, output_format=output_format, page_hashes=page_hash_store)
+    finally:
+        if page_archive is not None:
+            page_archive.close()
+        if exporter is not None:
+            exporter.stop()  # final metrics written
@@ -0,0 +1,182 @@
+"""
+Structured opening hours - parses the opening times of a cafe ("Monday - Friday: 8am-5pm|Saturday: 9am-4pm|Sunday:
+Closed", or the page table rows) into per-day open / close minutes after midnight, and answers "which cafes are open
+at day D, time T" over the whole dataset in one vectorized pass (OpeningHoursIndex, requires numpy).
+
+Each cafe has 7 (open, close) pairs, Monday first. CLOSED (-1) for both if closed or the hours could not be read.
+A close after midnight is stored past 1440 (e.g. 8pm-2am is 1200, 1560) and counts as open early the next day.
+Split hours on one day (e.g. 8am-12pm, 1pm-5pm) are stored as the span from the first open to the last close.
+
+    index = OpeningHoursIndex.from_csv("all_cafes_csv.csv")
+    open_now = index.open_at("Saturday", "10:30")  # boolean array, one per cafe
+    python openinghours.py all_cafes_csv.csv --day saturday --time 10:30
+"""
+import argparse
+import csv
+import re
+
+DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+MINUTES_PER_DAY = 24 * 60
+CLOSED = -1
+
+TIME_PATTERN = re.compile(r"(\d{1,2})(?:[:.](\d{2}))?\s*(am|pm|a\.m\.|p\.m\.)?", re.IGNORECASE)
+RANGE_PATTERN = re.compile(TIME_PATTERN.pattern + r"\s*(?:-|–|—|to)\s*" + TIME_PATTERN.pattern, re.IGNORECASE)
+ALWAYS_OPEN_PATTERN = re.compile(r"24\s*(?:hours|hrs|h)|open all day", re.IGNORECASE)
+
+
+def day_number(day):
+    """0 (Monday) - 6 (Sunday) from a day name, its first three letters, or the number itself"""
+    if isinstance(day, int):
+        return day % 7
+    name = day.strip().lower()[:3]
+    for number, day_name in enumerate(DAYS):
+        if day_name.lower().startswith(name):
+            return number
+    raise ValueError(f"Unknown day: {day}")
+
+
+def to_minutes(hour, minute, meridiem):
+    """minutes after midnight of a matched time - 12 hour if am / pm is given, else 24 hour"""
+    hour = int(hour)
+    minute = int(minute) if minute else 0
+    if meridiem:
+        meridiem = meridiem.lower().replace(".", "")
+        if hour == 12:
+            hour = 0
+        if meridiem == "pm":
+            hour += 12
+    if hour > 24 or minute > 59:
+        raise ValueError(f"Not a time: {hour}:{minute}")
+    return hour * 60 + minute
+
+
+def parse_time(text):
+    """minutes after midnight from e.g. '8am', '8:30pm', '17.00' or '10:30' - None if not a time"""
+    match = TIME_PATTERN.fullmatch(text.strip())
+    if match is None:
+        return None
+    try:
+        return to_minutes(*match.groups())
+    except ValueError:
+        return None
+
+
+def parse_day_hours(text):
+    """
+    (open, close) minutes from the hours of one day e.g. '8am-5pm', '8:00 - 17:30' or 'Closed'.
+    (CLOSED, CLOSED) if closed or not readable.
+    """
+    if ALWAYS_OPEN_PATTERN.search(text):
+        return 0, MINUTES_PER_DAY
+    ranges = list(RANGE_PATTERN.finditer(text))
+    if not ranges:
+        return CLOSED, CLOSED
+    try:
+        open_hour, open_minute, open_meridiem = ranges[0].groups()[:3]
+        close_hour, close_minute, close_meridiem = ranges[-1].groups()[3:]
+        # '9-5pm' - the opening hour shares the closing am / pm if it would not be before the close
+        if open_meridiem is None and close_meridiem is not None:
+            shared = to_minutes(open_hour, open_minute, close_meridiem)
+            open_meridiem = close_meridiem if shared < to_minutes(close_hour, close_minute, close_meridiem) else "am"
+        opens = to_minutes(open_hour, open_minute, open_meridiem)
+        closes = to_minutes(close_hour, close_minute, close_meridiem)
+    except ValueError:
+        return CLOSED, CLOSED
+    if closes <= opens:  # closes after midnight
+        closes += MINUTES_PER_DAY
+    return opens, closes
+
+
+def day_range(label):
+    """day numbers of a label e.g. 'Monday', 'Monday - Friday' or 'Saturday - Sunday'"""
+    parts = [part for part in re.split(r"\s*(?:-|–|to)\s*", label.strip()) if part]
+    first = day_number(parts[0])
+    last = day_number(parts[-1])
+    return [(first + offset) % 7 for offset in range((last - first) % 7 + 1)]
+
+
+def parse_opening(opening):
+    """
+    per-day (open, close) minutes from an opening string (CafeData.get_opening_string) or list of table rows
+    'Day: hours'. Days not listed are CLOSED.
+    :return: list of 7 (open, close) tuples, Monday first
+    """
+    hours = [(CLOSED, CLOSED)] * 7
+    if not opening:
+        return hours
+    entries = opening.split("|") if isinstance(opening, str) else opening
+    for entry in entries:
+        if ":" not in entry:
+            continue
+        label, day_hours = entry.split(":", 1)
+        try:
+            days = day_range(label)
+        except ValueError:  # not a day label
+            continue
+        for day in days:
+            hours[day] = parse_day_hours(day_hours)
+    return hours
+
+
+class OpeningHoursIndex:
+    """
+    opening hours of N cafes as two (N, 7) int16 numpy arrays of open / close minutes, for vectorized queries.
+    Requires numpy.
+    :param opening_strings: opening string of each cafe (csv 'Opening' column)
+    :param ids: cafe ID of each row - returned by open_ids
+    """
+    def __init__(self, opening_strings, ids=None):
+        import numpy  # optional dependency - only needed for the queries
+        self.numpy = numpy
+        hours = numpy.array([parse_opening(opening) for opening in opening_strings], dtype=numpy.int16)
+        hours = hours.reshape(-1, 7, 2)
+        self.opens = hours[:, :, 0]
+        self.closes = hours[:, :, 1]
+        self.ids = numpy.asarray(ids if ids is not None else range(1, len(self.opens) + 1))
+
+    @classmethod
+    def from_csv(cls, csv_filename):
+        with open(csv_filename, "r", newline="") as file:
+            rows = list(csv.DictReader(file))
+        return cls([row["Opening"] for row in rows], [int(row["ID"]) for row in rows])
+
+    @classmethod
+    def from_records(cls, records):
+        """from CafeRecords (records.py)"""
+        records = list(records)
+        return cls([record.opening for record in records], [record.id for record in records])
+
+    def __len__(self):
+        return len(self.opens)
+
+    def open_at(self, day, time):
+        """
+        boolean array - True for each cafe open at the day and time.
+        :param day: day name or number (0 Monday)
+        :param time: minutes after midnight, or a time string e.g. '10:30' / '3pm'
+        """
+        day = day_number(day)
+        minute = parse_time(time) if isinstance(time, str) else time
+        if minute is None:
+            raise ValueError(f"Not a time: {time}")
+        previous_day = (day - 1) % 7
+        open_today = (self.opens[:, day] <= minute) & (minute < self.closes[:, day])
+        # still open from a previous day closing after midnight
+        open_overnight = minute + MINUTES_PER_DAY < self.closes[:, previous_day]
+        return open_today | open_overnight
+
+    def open_ids(self, day, time):
+        """IDs of the cafes open at the day and time"""
+        return self.ids[self.open_at(day, time)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="List the cafes open at a day and time")
+    parser.add_argument("csv_filename")
+    parser.add_argument("--day", required=True, help="e.g. saturday")
+    parser.add_argument("--time", required=True, help="e.g. 10:30 or 3pm")
+    args = parser.parse_args()
+
+    index = OpeningHoursIndex.from_csv(args.csv_filename)
+    open_ids = index.open_ids(args.day, args.time)
+    print(f"{len(open_ids)} of {len(index)} cafes open: {', '.join(str(cafe_id) for cafe_id in open_ids)}")
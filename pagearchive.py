@@ -0,0 +1,153 @@
+"""
+Compressed archive of every fetched cafe page, so the cafe data can be re-extracted (main.py --reextract) after a
+CafeData fix without downloading the pages again.
+
+Pages are appended to a single pack file, each as its own compressed frame (a gzip member - the pack is also a valid
+multi-member .gz file - or a zstd frame if the zstandard package is installed and chosen) holding a WARC style
+record: header lines (WARC-Target-URI, WARC-Date, Content-Length ...), a blank line, then the page html.
+An append-only index file (pack filename + '.idx') holds one tab separated line per record: url, offset, length,
+time, sha1 of the page - the last line for a url is its latest version. A page identical to the url's latest
+version is not stored again. Frames are written before their index line, so a frame cut short by an interrupted
+run has no index entry and is never read.
+"""
+import gzip
+import hashlib
+import os
+import threading
+import time
+
+COMPRESSIONS = ["gzip", "zstd"]
+
+
+def warc_record(url, html, fetched):
+    """the WARC style record bytes of a page"""
+    body = html.encode("utf-8")
+    header = (f"WARC/1.0\r\n"
+              f"WARC-Type: resource\r\n"
+              f"WARC-Target-URI: {url}\r\n"
+              f"WARC-Date: {time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(fetched))}\r\n"
+              f"Content-Type: text/html; charset=utf-8\r\n"
+              f"Content-Length: {len(body)}\r\n\r\n")
+    return header.encode("utf-8") + body + b"\r\n\r\n"
+
+
+def record_body(record):
+    """page html of a WARC style record"""
+    header, _, rest = record.partition(b"\r\n\r\n")
+    length = None
+    for line in header.split(b"\r\n"):
+        name, _, value = line.partition(b":")
+        if name.strip().lower() == b"content-length":
+            length = int(value)
+    return rest[:length].decode("utf-8")
+
+
+class PageArchive:
+    """
+    append-only compressed page pack with an offset index, safe to share between worker threads.
+    :param compression: 'gzip', or 'zstd' (requires zstandard) - a pack keeps the compression it was created with
+    """
+    def __init__(self, pack_filename, compression="gzip"):
+        self.pack_filename = pack_filename
+        self.index_filename = f"{pack_filename}.idx"
+        self.compression = self.pack_compression() or compression
+        if self.compression == "zstd":
+            import zstandard  # optional dependency - only needed for zstd packs
+            self.zstd_compressor = zstandard.ZstdCompressor(level=10)
+            self.zstd_decompressor = zstandard.ZstdDecompressor()
+        self.entries = {}  # url: (offset, length, time, sha1) of the latest version
+        self.lock = threading.Lock()
+        self.load_index()
+        self.pack_file = open(pack_filename, "ab")
+        self.index_file = open(self.index_filename, "a")
+        self.read_file = open(pack_filename, "rb")
+
+    def pack_compression(self):
+        """compression of an existing pack from its first bytes - None for a new pack"""
+        if not os.path.exists(self.pack_filename) or os.path.getsize(self.pack_filename) == 0:
+            return None
+        with open(self.pack_filename, "rb") as file:
+            magic = file.read(4)
+        return "zstd" if magic == b"\x28\xb5\x2f\xfd" else "gzip"
+
+    def load_index(self):
+        if not os.path.exists(self.index_filename):
+            return
+        pack_size = os.path.getsize(self.pack_filename) if os.path.exists(self.pack_filename) else 0
+        with open(self.index_filename, "r") as file:
+            for line in file:
+                parts = line.rstrip("\n").split("\t")
+                if len(parts) != 5:
+                    continue  # partly written last line
+                url, offset, length, fetched, sha1 = parts
+                if int(offset) + int(length) <= pack_size:
+                    self.entries[url] = (int(offset), int(length), float(fetched), sha1)
+
+    def compress(self, data):
+        if self.compression == "zstd":
+            return self.zstd_compressor.compress(data)
+        return gzip.compress(data, compresslevel=6, mtime=0)
+
+    def decompress(self, data):
+        if self.compression == "zstd":
+            return self.zstd_decompressor.decompress(data)
+        return gzip.decompress(data)
+
+    def put(self, url, html):
+        """archives the page - returns False if it is identical to the latest archived version"""
+        sha1 = hashlib.sha1(html.encode("utf-8")).hexdigest()
+        fetched = time.time()
+        with self.lock:
+            previous = self.entries.get(url)
+            if previous is not None and previous[3] == sha1:
+                return False
+            frame = self.compress(warc_record(url, html, fetched))
+            offset = self.pack_file.tell()
+            self.pack_file.write(frame)
+            self.pack_file.flush()
+            self.index_file.write(f"{url}\t{offset}\t{len(frame)}\t{fetched:.0f}\t{sha1}\n")
+            self.index_file.flush()
+            self.entries[url] = (offset, len(frame), fetched, sha1)
+        return True
+
+    def get(self, url):
+        """html of the latest archived version of the page - None if not archived"""
+        with self.lock:
+            entry = self.entries.get(url)
+            if entry is None:
+                return None
+            self.read_file.seek(entry[0])
+            frame = self.read_file.read(entry[1])
+        return record_body(self.decompress(frame))
+
+    def __contains__(self, url):
+        return url in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def urls(self):
+        """archived urls in the order their latest version was stored"""
+        with self.lock:
+            return sorted(self.entries, key=lambda url: self.entries[url][0])
+
+    def close(self):
+        with self.lock:
+            self.pack_file.close()
+            self.index_file.close()
+            self.read_file.close()
+
+
+archive = None  # shared PageArchive - fetched pages are only archived once set with use_page_archive()
+
+
+def use_page_archive(page_archive):
+    """sets the archive every fetched cafe page is saved to (None to stop archiving)"""
+    global archive
+    archive = page_archive
+
+
+def archive_page(url, html):
+    """saves the page to the shared archive, if one is set - only called with pages fetched with a 2xx response"""
+    if archive is not None:
+        archive.put(url, html)
@@ -0,0 +1,58 @@
+"""
+HTML parser backends for the individual cafe pages.
+CafeData only reads four containers from each page (cafe-name, cafe-address, cafe-open, cafe-services), so the fast
+backends only build those subtrees (SoupStrainer) instead of the whole page tree. The CafeData.get_* methods work
+unchanged on the smaller soup and extract identical data.
+
+Backends:
+    "html.parser" - full page tree with the built-in parser (original behaviour)
+    "strained" - only the four containers, built-in parser
+    "lxml" - only the four containers, lxml parser (requires lxml to be installed)
+Beautiful soup is only imported when the first page is parsed.
+"""
+import hashlib
+import importlib.util
+
+LXML_AVAILABLE = importlib.util.find_spec("lxml") is not None  # checked without importing lxml
+
+# html classes of the containers CafeData extracts from
+CAFE_CONTAINER_CLASSES = ["cafe-name", "cafe-address", "cafe-open", "cafe-services"]
+
+BACKENDS = ["html.parser", "strained", "lxml"]
+
+
+def default_backend():
+    """fastest backend available"""
+    return "lxml" if LXML_AVAILABLE else "strained"
+
+
+def cafe_containers_strainer():
+    """only keeps tags (with their subtree) having one of the cafe container classes"""
+    from bs4 import SoupStrainer
+    return SoupStrainer(class_=CAFE_CONTAINER_CLASSES)
+
+
+def parse_cafe_page(page_html, backend=None):
+    """returns a beautiful soup object of the cafe page html, built with the selected backend"""
+    from bs4 import BeautifulSoup
+    backend = backend or default_backend()
+    if backend == "html.parser":
+        return BeautifulSoup(page_html, 'html.parser')
+    if backend == "strained":
+        return BeautifulSoup(page_html, 'html.parser', parse_only=cafe_containers_strainer())
+    if backend == "lxml":
+        if not LXML_AVAILABLE:
+            raise ValueError("lxml parser backend selected but lxml is not installed")
+        return BeautifulSoup(page_html, 'lxml', parse_only=cafe_containers_strainer())
+    raise ValueError(f"Unknown parser backend: {backend}. Options: {', '.join(BACKENDS)}")
+
+
+def cafe_content_hash(soup):
+    """
+    hash of the cafe containers html - changes only when the data CafeData extracts may have changed (not when
+    adverts or other parts of the page change). Comparable between pages parsed with the same backend.
+    """
+    content = hashlib.sha256()
+    for container in soup.find_all(class_=CAFE_CONTAINER_CLASSES):
+        content.update(str(container).encode("utf-8"))
+    return content.hexdigest()
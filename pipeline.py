@@ -0,0 +1,255 @@
+"""
+Staged extraction pipeline - page fetching (I/O bound) and html parsing / extraction (CPU bound) run in separate
+stages connected by bounded queues, so a full queue makes the stage before it wait (backpressure):
+
+    async fetchers --raw html--> process pool (parse + extract) --rows--> geocoders --rows--> single writer
+
+The fetchers are asyncio tasks running the pooled HTTP client requests in threads, the parsing runs in a pool of
+processes (not limited by the GIL) and geocoding stays in this process so the geocode cache and postcode index are
+shared. Throughput scales with the number of cores once the network is not the bottleneck.
+"""
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
+from extractCafeData import CafeData
+from instrumentation import metrics
+from parsers import parse_cafe_page, cafe_content_hash
+from pagearchive import archive_page
+from refresh import save_page_state
+from checkpoint import DONE, UNCHANGED, UNAVAILABLE, FAILED
+
+STOP = None  # end of queue marker
+
+
+def extract_page(link, number, page_html, parser_backend, country):
+    """
+    parses the page and extracts the cafe data without geocoding (runs in a worker process).
+    :return: the CafeData without its soup (sent back to the main process), or None if the cafe data is unavailable
+    """
+    soup = parse_cafe_page(page_html, parser_backend)
+    cafe = CafeData(soup, number, link, None, False, country)
+    try:
+        cafe.extract_all_data(geocode=False)
+    except AttributeError:
+        return None
+    cafe.content_hash = cafe_content_hash(soup)
+    cafe.bSoup = None  # the soup is large and slow to pickle - only the extracted fields are needed
+    return cafe
+
+
+def extract_page_with_metrics(link, number, page_html, parser_backend, country, collect_metrics):
+    """
+    extract_page in a worker process - the extractor timings and failure counters recorded in the worker are
+    returned with the cafe to be merged into the main process metrics (None if not collected)
+    """
+    if not collect_metrics:
+        return extract_page(link, number, page_html, parser_backend, country), None
+    metrics.enable()
+    metrics.collect()  # drops metrics a forked worker inherited from the main process
+    cafe = extract_page(link, number, page_html, parser_backend, country)
+    return cafe, metrics.collect()
+
+
+def geocode_cafe(cafe):
+    """adds the latitude and longitude to the extracted cafe (runs in a thread of this process)"""
+    cafe.get_latitude_longitude()
+    return cafe
+
+
+class StagedPipeline:
+    """
+    :param link_items: iterable of (index, link) - the cafe ID is index + 1
+    :param writer: batched writer (writers.py) - only used by the writer stage
+    :param journal: CheckpointJournal - links recorded once their row is written
+    :param rate_limiter: HostRateLimiter for the page requests - None to leave it to the http client's limiter
+    :param fetch_workers: concurrent page fetches
+    :param processes: parse / extract worker processes
+    :param geocode_workers: concurrent geocode lookups
+    :param queue_size: maximum items waiting between two stages
+    :param progress: tqdm progress bar updated as each link finishes
+    :param page_hashes: PageHashStore to save the content hash of each page to
+    """
+    def __init__(self, link_items, writer, journal, rate_limiter, fetch_workers=4, processes=None,
+                 geocode_workers=2, queue_size=32, conditional=False, parser_backend=None, country="UK",
+                 progress=None, page_hashes=None):
+        self.link_items = link_items
+        self.writer = writer
+        self.journal = journal
+        self.rate_limiter = rate_limiter
+        self.fetch_workers = fetch_workers
+        self.processes = processes
+        self.geocode_workers = geocode_workers
+        self.queue_size = queue_size
+        self.conditional = conditional
+        self.parser_backend = parser_backend
+        self.country = country
+        self.progress = progress
+        self.page_hashes = page_hashes
+        self.unsaved = []  # (index, link) of rows still buffered in the writer
+        self.unsaved_pages = {}  # link: (content hash, validators) of the buffered rows - saved with the rows
+
+    def fetch(self, link):
+        """
+        blocking page request (runs in a thread) - returns the html and the ETag / Last-Modified of the response, or
+        (None, None) if not modified
+        """
+        # not imported to re-extract archived pages
+        from httpclient import check_page_response, get_client, response_validators
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire(link)
+        with metrics.timer("fetch"):
+            response = get_client().get(link, conditional=self.conditional)
+        check_page_response(response)  # error pages are failed fetches - neither archived nor parsed
+        if response.status_code == 304:
+            metrics.increment("pages_not_modified")
+            return None, None
+        metrics.increment("pages_fetched")
+        metrics.increment("bytes_downloaded", len(response.content))
+        archive_page(link, response.text)
+        return response.text, response_validators(response)
+
+    @staticmethod
+    async def fail(results_queue, index, link, stage, error):
+        """records the link as failed after an unexpected error in a stage - the stage carries on with the next link"""
+        print(f"Cafe {index} failed in the {stage} stage: {error!r}")
+        metrics.increment("pipeline_failures", stage=stage)
+        await results_queue.put((index, link, FAILED, None))
+
+    async def fetcher(self, links_queue, html_queue, results_queue):
+        import requests
+        while True:
+            item = await links_queue.get()
+            if item is STOP:
+                return
+            index, link = item
+            try:
+                page_html, validators = await asyncio.to_thread(self.fetch, link)
+            except requests.exceptions.RequestException as e:
+                print(f"Cafe {index} could not be fetched: {e}")
+                metrics.increment("fetch_failures")
+                await results_queue.put((index, link, FAILED, None))
+                continue
+            except Exception as e:  # e.g. the page archive failing to save the page
+                await self.fail(results_queue, index, link, "fetch", e)
+                continue
+            if page_html is None:
+                await results_queue.put((index, link, UNCHANGED, None))
+            else:
+                await html_queue.put((index, link, page_html, validators))  # waits while the parsers are behind
+
+    async def parser(self, process_pool, html_queue, geocode_queue, results_queue):
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await html_queue.get()
+            if item is STOP:
+                return
+            index, link, page_html, validators = item
+            try:
+                with metrics.timer("parse_extract"):
+                    cafe, worker_metrics = await loop.run_in_executor(
+                        process_pool, extract_page_with_metrics, link, index + 1, page_html, self.parser_backend,
+                        self.country, metrics.enabled)
+            except Exception as e:  # e.g. BrokenProcessPool after a worker process died
+                await self.fail(results_queue, index, link, "parse", e)
+                continue
+            if worker_metrics is not None:
+                metrics.merge(worker_metrics)
+            if cafe is None:
+                print(f"Cafe {index} unavailable")
+                metrics.increment("extraction_failures", field="page")
+                await results_queue.put((index, link, UNAVAILABLE, None))
+            else:
+                cafe.validators = validators
+                await geocode_queue.put((index, link, cafe))
+
+    async def geocoder(self, geocode_queue, results_queue):
+        while True:
+            item = await geocode_queue.get()
+            if item is STOP:
+                return
+            index, link, cafe = item
+            try:
+                cafe = await asyncio.to_thread(geocode_cafe, cafe)
+            except Exception as e:  # e.g. a geocode request or cache error
+                await self.fail(results_queue, index, link, "geocode", e)
+                continue
+            await results_queue.put((index, link, DONE, cafe))
+
+    def record_saved(self):
+        for index, link in self.unsaved:
+            self.journal.record(link, index, DONE)
+        self.unsaved = []
+        save_page_state(self.page_hashes, self.unsaved_pages)
+        self.unsaved_pages = {}
+
+    async def result_writer(self, results_queue):
+        """single writer - the only stage touching the output file and journal"""
+        while True:
+            item = await results_queue.get()
+            if item is STOP:
+                return
+            index, link, status, cafe = item
+            if status == DONE:
+                self.unsaved_pages[link] = (cafe.content_hash, cafe.validators)
+                self.unsaved.append((index, link))
+                with metrics.timer("save"):
+                    saved = self.writer.write_row(cafe.to_record())
+                if saved:
+                    self.record_saved()
+            else:
+                self.journal.record(link, index, status)
+            if self.progress is not None:
+                self.progress.update(1)
+
+    async def feed_and_stop(self, links_queue, html_queue, geocode_queue, results_queue, stages, writer_task):
+        """queues the links, then shuts down stage by stage so every queued item is finished"""
+        for item in self.link_items:
+            await links_queue.put(item)
+
+        for stage_tasks, queue in zip(stages, (links_queue, html_queue, geocode_queue)):
+            for _ in stage_tasks:
+                await queue.put(STOP)
+            await asyncio.gather(*stage_tasks)
+        await results_queue.put(STOP)
+        await writer_task
+
+    async def run(self):
+        """
+        runs every stage until all links are finished. An error escaping a stage (e.g. the writer failing to save)
+        cancels the other stages and is raised - the stages waiting on its queue would otherwise wait forever
+        """
+        links_queue = asyncio.Queue(self.queue_size)
+        html_queue = asyncio.Queue(self.queue_size)
+        geocode_queue = asyncio.Queue(self.queue_size)
+        results_queue = asyncio.Queue(self.queue_size)
+
+        processes = self.processes or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=processes) as process_pool:
+            parser_count = processes * 2  # a page queued for every process while another is returned
+            fetchers = [asyncio.create_task(self.fetcher(links_queue, html_queue, results_queue))
+                        for _ in range(self.fetch_workers)]
+            parsers = [asyncio.create_task(self.parser(process_pool, html_queue, geocode_queue, results_queue))
+                       for _ in range(parser_count)]
+            geocoders = [asyncio.create_task(self.geocoder(geocode_queue, results_queue))
+                         for _ in range(self.geocode_workers)]
+            writer_task = asyncio.create_task(self.result_writer(results_queue))
+            tasks = fetchers + parsers + geocoders + [writer_task]
+            tasks.append(asyncio.create_task(self.feed_and_stop(links_queue, html_queue, geocode_queue,
+                                                                results_queue, (fetchers, parsers, geocoders),
+                                                                writer_task)))
+
+            try:
+                done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+                for task in done:
+                    if not task.cancelled() and task.exception() is not None:
+                        raise task.exception()
+            finally:
+                for task in tasks:
+                    task.cancel()
+                self.writer.flush()
+                self.record_saved()
+
+
+def run_staged_pipeline(link_items, writer, journal, rate_limiter, **settings):
+    """runs the staged pipeline over the links - see StagedPipeline for the settings"""
+    asyncio.run(StagedPipeline(link_items, writer, journal, rate_limiter, **settings).run())
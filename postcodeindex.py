@@ -0,0 +1,115 @@
+"""
+Offline UK postcode to latitude / longitude lookup.
+Builds a compact sorted binary index from a postcode CSV (e.g. the ONS / ukpostcodes.csv dataset) once, then
+memory-maps the index so opening it is near-instant and each lookup is a binary search without any HTTP call.
+
+Build the index:
+    python postcodeindex.py ukpostcodes.csv postcodes.idx
+"""
+import argparse
+import csv
+import mmap
+import struct
+
+INDEX_MAGIC = b"PCIX"
+INDEX_VERSION = 1
+HEADER = struct.Struct("<4sII")  # magic, version, number of records
+RECORD = struct.Struct("<7sdd")  # postcode without space (null padded), latitude, longitude
+POSTCODE_LENGTH = 7
+
+
+def postcode_key(postcode):
+    """upper case postcode without spaces as fixed width bytes - None if it can not be a postcode"""
+    key = "".join(postcode.upper().split())
+    if not 5 <= len(key) <= POSTCODE_LENGTH or not key.isascii():
+        return None
+    return key.encode("ascii").ljust(POSTCODE_LENGTH, b"\0")
+
+
+def build_postcode_index(csv_filename, index_filename, postcode_column="postcode", latitude_column="latitude",
+                         longitude_column="longitude"):
+    """
+    reads the postcode CSV and writes the sorted binary index.
+    Rows with missing or invalid coordinates (the ONS data uses 99.999999 for unknown) are skipped.
+    :return: number of postcodes written
+    """
+    records = {}
+    with open(csv_filename, "r", newline="") as file:
+        reader = csv.DictReader(file)
+        for row in reader:
+            key = postcode_key(row[postcode_column])
+            try:
+                lat = float(row[latitude_column])
+                lon = float(row[longitude_column])
+            except (TypeError, ValueError):
+                continue
+            if key is None or not -90 <= lat <= 90 or not -180 <= lon <= 180:
+                continue
+            records[key] = (lat, lon)
+
+    with open(index_filename, "wb") as file:
+        file.write(HEADER.pack(INDEX_MAGIC, INDEX_VERSION, len(records)))
+        for key in sorted(records):
+            file.write(RECORD.pack(key, *records[key]))
+
+    return len(records)
+
+
+class PostcodeIndex:
+    """memory-mapped postcode index - postcode centroid lookups in microseconds"""
+    def __init__(self, index_filename):
+        self.index_filename = index_filename
+        self.file = open(index_filename, "rb")
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.count = HEADER.unpack_from(self.data, 0)
+        if magic != INDEX_MAGIC or version != INDEX_VERSION:
+            self.close()
+            raise ValueError(f"{index_filename} is not a postcode index - rebuild with postcodeindex.py")
+
+    def key_at(self, position):
+        offset = HEADER.size + position * RECORD.size
+        return self.data[offset:offset + POSTCODE_LENGTH]
+
+    def lookup(self, postcode):
+        """returns (latitude, longitude) for the postcode, or None if not in the index"""
+        if not postcode:
+            return None
+        key = postcode_key(postcode)
+        if key is None:
+            return None
+
+        # binary search the sorted fixed width records
+        low = 0
+        high = self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self.key_at(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+
+        if low < self.count and self.key_at(low) == key:
+            _, lat, lon = RECORD.unpack_from(self.data, HEADER.size + low * RECORD.size)
+            return lat, lon
+        return None
+
+    def __len__(self):
+        return self.count
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the offline postcode index from a postcode CSV")
+    parser.add_argument("csv_filename")
+    parser.add_argument("index_filename", nargs="?", default="postcodes.idx")
+    parser.add_argument("--postcode-column", default="postcode")
+    parser.add_argument("--latitude-column", default="latitude")
+    parser.add_argument("--longitude-column", default="longitude")
+    args = parser.parse_args()
+
+    total = build_postcode_index(args.csv_filename, args.index_filename, args.postcode_column,
+                                 args.latitude_column, args.longitude_column)
+    print(f"{total} postcodes saved to {args.index_filename}")
@@ -0,0 +1,220 @@
+"""
+Rate limiting for remote calls - token buckets shared between worker threads, one bucket per host.
+AdaptiveRateLimiter speeds a host up while its responses are ok and slows it down on 429 / 503 responses (pausing
+for the Retry-After time), within each host's maximum rate - e.g. 1 request per second for the public Nominatim api.
+CircuitBreaker holds back requests to a host that keeps failing, for a cool down time.
+"""
+import email.utils
+import random
+import threading
+import time
+from urllib.parse import urlparse
+
+# maximum requests per second allowed by the usage policy of a host
+HOST_RATE_LIMITS = {
+    "nominatim.openstreetmap.org": 1.0,  # https://operations.osmfoundation.org/policies/nominatim/
+}
+SLOW_DOWN_STATUSES = (429, 503)  # the server asks for fewer requests
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class TokenBucket:
+    """
+    Thread safe token bucket. Tokens refill at 'rate' per second up to 'capacity', each request takes one token
+    and blocks until one is available.
+    """
+    def __init__(self, rate, capacity=1):
+        self.rate = rate  # tokens added per second
+        self.capacity = capacity  # maximum burst size
+        self.tokens = capacity
+        self.last_refill = time.monotonic()
+        self.lock = threading.Lock()
+
+    def refill(self):
+        """adds the tokens accumulated since the last refill - lock must be held"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+    def set_rate(self, rate):
+        with self.lock:
+            self.refill()
+            self.rate = rate
+
+    def acquire(self):
+        """blocks until a token is available then takes it"""
+        while True:
+            with self.lock:
+                self.refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait_time = (1 - self.tokens) / self.rate
+            time.sleep(wait_time)
+
+
+class HostRateLimiter:
+    """holds a separate token bucket for each host so one slow host does not hold back the others"""
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def get_bucket(self, host):
+        with self.lock:
+            if host not in self.buckets:
+                self.buckets[host] = TokenBucket(self.rate, self.capacity)
+            return self.buckets[host]
+
+    def acquire(self, url):
+        """waits for a token for the host of the passed url"""
+        self.get_bucket(urlparse(url).netloc).acquire()
+
+
+def parse_retry_after(value):
+    """seconds to wait from a Retry-After header (seconds or an http date) - None if missing or unreadable"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_time = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_time.timestamp() - time.time())
+
+
+def backoff_delay(attempt, backoff_factor=1.0, max_delay=60.0):
+    """exponential backoff with full jitter - random wait up to backoff_factor * 2 ** attempt seconds"""
+    return random.uniform(0, min(max_delay, backoff_factor * 2 ** attempt))
+
+
+class HostState:
+    """rate and pause of one host in the AdaptiveRateLimiter"""
+    def __init__(self, rate, max_rate):
+        self.bucket = TokenBucket(rate) if rate else None  # None - no rate limit
+        self.max_rate = max_rate
+        self.paused_until = 0.0
+
+
+class AdaptiveRateLimiter:
+    """
+    per-host token buckets whose rate adapts to the responses - the rate grows by 'growth' times (at least
+    'increase') per ok response up to the host's maximum, and halves (down to min_rate) on a 429 / 503. A Retry-After
+    header pauses the host - the other 429s of the same burst, answered while it is paused, do not halve it again.
+    The rate recovers in a few seconds after a short burst of 429s rather than climbing back linearly.
+    :param rate: starting requests per second of a host - None for no limit on hosts without a HOST_RATE_LIMITS entry
+    :param max_rate: maximum requests per second of a host
+    :param host_rates: maximum requests per second of specific hosts (usage policies) - these hosts start at it
+    :param growth: rate multiplier per ok response
+    :param increase: smallest rate increase per ok response
+    """
+    def __init__(self, rate=0.5, max_rate=2.0, min_rate=0.05, increase=0.05, host_rates=None, growth=1.1):
+        self.rate = rate
+        self.max_rate = max(max_rate, rate) if rate else max_rate
+        self.min_rate = min_rate
+        self.increase = increase
+        self.growth = growth
+        self.host_rates = HOST_RATE_LIMITS if host_rates is None else host_rates
+        self.hosts = {}
+        self.lock = threading.Lock()
+
+    def get_host(self, host):
+        with self.lock:
+            if host not in self.hosts:
+                if host in self.host_rates:
+                    self.hosts[host] = HostState(self.host_rates[host], self.host_rates[host])
+                else:
+                    self.hosts[host] = HostState(self.rate, self.max_rate)
+            return self.hosts[host]
+
+    def acquire(self, url):
+        """waits out any Retry-After pause, then for a token for the host of the url"""
+        state = self.get_host(urlparse(url).netloc)
+        wait_time = state.paused_until - time.monotonic()
+        if wait_time > 0:
+            time.sleep(wait_time)
+        if state.bucket is not None:
+            state.bucket.acquire()
+
+    def record(self, url, status_code, retry_after=None):
+        """adjusts the host rate from a response status (None for a connection error)"""
+        state = self.get_host(urlparse(url).netloc)
+        already_paused = False
+        if retry_after:
+            with self.lock:
+                now = time.monotonic()
+                already_paused = state.paused_until > now  # a request sent before the host was paused
+                state.paused_until = max(state.paused_until, now + retry_after)
+        if state.bucket is None:
+            return
+        rate = state.bucket.rate
+        if status_code in SLOW_DOWN_STATUSES:
+            if not already_paused:
+                state.bucket.set_rate(max(self.min_rate, rate / 2))
+        elif status_code is not None and status_code < 500 and rate < state.max_rate:
+            state.bucket.set_rate(min(state.max_rate, max(rate * self.growth, rate + self.increase)))
+
+    def host_rate(self, url):
+        """current requests per second of the url's host - None if not limited"""
+        state = self.get_host(urlparse(url).netloc)
+        return state.bucket.rate if state.bucket is not None else None
+
+
+class CircuitBreaker:
+    """
+    per-host circuit breaker - after 'failure_threshold' failures in a row (connection errors, 429 / 5xx) requests
+    to the host wait for 'reset_timeout' seconds. One trial request is then let through - a success closes the
+    circuit and releases the waiting requests, a failure opens it again.
+    """
+    def __init__(self, failure_threshold=5, reset_timeout=60.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = {}  # host: failures in a row
+        self.opened_at = {}  # host: time the circuit opened
+        self.trial_running = set()  # hosts with a trial request in flight
+        self.condition = threading.Condition()
+
+    def wait(self, url):
+        """
+        blocks while the circuit of the host is open - returns once it is closed, or when this request is the trial
+        request after reset_timeout. The links are not failed during an outage, only each failed trial request.
+        """
+        host = urlparse(url).netloc
+        with self.condition:
+            while True:
+                opened_at = self.opened_at.get(host)
+                if opened_at is None:
+                    return
+                wait_time = None  # woken when the trial request finishes
+                if host not in self.trial_running:
+                    wait_time = opened_at + self.reset_timeout - time.monotonic()
+                    if wait_time <= 0:
+                        self.trial_running.add(host)  # half open - let one request through
+                        return
+                self.condition.wait(wait_time)
+
+    def record_success(self, url):
+        host = urlparse(url).netloc
+        with self.condition:
+            self.failures.pop(host, None)
+            self.opened_at.pop(host, None)
+            self.trial_running.discard(host)
+            self.condition.notify_all()
+
+    def record_failure(self, url):
+        host = urlparse(url).netloc
+        with self.condition:
+            self.failures[host] = self.failures.get(host, 0) + 1
+            self.trial_running.discard(host)
+            if self.failures[host] >= self.failure_threshold:
+                self.opened_at[host] = time.monotonic()
+            self.condition.notify_all()
+
+    def is_open(self, url):
+        host = urlparse(url).netloc
+        with self.condition:
+            return host in self.opened_at
@@ -0,0 +1,33 @@
+"""
+Immutable cafe record - the extracted data of one cafe without the soup, report flags or output filename of
+CafeData. Fields are in the csv column order (writers.CSV_HEADER), so a record can be passed to any writer as a row.
+"""
+from typing import NamedTuple, Optional
+from writers import typed_row
+from openinghours import parse_opening
+
+
+class CafeRecord(NamedTuple):
+    id: int
+    name: Optional[str]
+    link: str
+    city: Optional[str]
+    street: Optional[str]
+    opening: Optional[str]
+    postcode: Optional[str]
+    url_location: Optional[str]
+    wifi: Optional[str]  # "Free Wi-Fi" or None
+    laptop_friendly: Optional[str]  # "Laptop Friendly" or None
+    pet_friendly: Optional[str]  # "Pet Friendly" or None
+    latitude: Optional[float]
+    longitude: Optional[float]
+    country: str = "UK"
+    status: str = "open"
+
+    def typed(self):
+        """dict keyed by csv column with typed values - floats for coordinates, booleans for the service flags"""
+        return typed_row(self)
+
+    def opening_hours(self):
+        """per-day (open, close) minutes after midnight, Monday first (see openinghours.py)"""
+        return parse_opening(self.opening)
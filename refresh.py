@@ -0,0 +1,127 @@
+"""
+Incremental refresh helpers - only new cafes, and existing cafes whose page content has changed, are scraped again.
+Cafes no longer listed on the website are kept in the csv and marked as closed.
+"""
+import csv
+import os
+import sqlite3
+import threading
+import time
+from writers import CSV_HEADER, row_from_dict
+
+
+def read_links(link_filename):
+    """returns the cafe links saved in the links txt file - empty list if not created yet"""
+    if not os.path.exists(link_filename):
+        return []
+    with open(link_filename, "r") as file:
+        return [link.strip() for link in file if link.strip()]
+
+
+def diff_links(previous_links, current_links):
+    """
+    compares the previously saved links with the freshly discovered links.
+    :return: (new links, existing links, removed links) - each in website order
+    """
+    previous = set(previous_links)
+    current = set(current_links)
+    new_links = [link for link in current_links if link not in previous]
+    existing_links = [link for link in current_links if link in previous]
+    removed_links = [link for link in previous_links if link not in current]
+    return new_links, existing_links, removed_links
+
+
+class PageHashStore:
+    """saves the cafe containers content hash (parsers.cafe_content_hash) of each link in sqlite"""
+    def __init__(self, db_filename):
+        self.db_filename = db_filename
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(db_filename, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute("CREATE TABLE IF NOT EXISTS page_hashes ("
+                                    "link TEXT PRIMARY KEY, content_hash TEXT NOT NULL, checked REAL NOT NULL)")
+
+    def get(self, link):
+        """returns the saved content hash of the link - None if not saved"""
+        with self.lock:
+            row = self.connection.execute("SELECT content_hash FROM page_hashes WHERE link = ?", (link,)).fetchone()
+        return row[0] if row else None
+
+    def put(self, link, content_hash):
+        with self.lock, self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO page_hashes (link, content_hash, checked) "
+                                    "VALUES (?, ?, ?)", (link, content_hash, time.time()))
+
+    def put_many(self, content_hashes):
+        """saves the content hashes of the links (dict of link: hash) - once their rows are written to the output"""
+        checked = time.time()
+        with self.lock, self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO page_hashes (link, content_hash, checked) "
+                                        "VALUES (?, ?, ?)", [(link, content_hash, checked)
+                                                             for link, content_hash in content_hashes.items()])
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+def save_page_state(page_hashes, pages):
+    """
+    saves the content hash and ETag / Last-Modified of the pages whose rows are written to the output (dict of
+    link: (content_hash, validators)) - a row lost to an error is then fetched again, not skipped as unchanged
+    """
+    if page_hashes is not None:
+        page_hashes.put_many({link: content_hash for link, (content_hash, _) in pages.items()})
+    validators = {link: page_validators for link, (_, page_validators) in pages.items() if page_validators}
+    if validators:
+        from httpclient import get_client  # not imported by the offline runs
+        get_client().save_validators(validators)
+
+
+def update_csv_rows(cafe_data_csvfile, updated_rows, closed_links):
+    """
+    rewrites the csv with the refreshed cafes. Rows of updated links are replaced (keeping their ID), rows of closed
+    links are marked 'closed', and updated links not yet in the csv are added with the next IDs.
+    :param updated_rows: dict of link: row (CSV_HEADER order)
+    :param closed_links: links no longer listed on the website
+    :return: (number of rows replaced, number of rows added, number of rows closed)
+    """
+    updated_rows = dict(updated_rows)
+    closed_links = set(closed_links)
+    link_column = CSV_HEADER.index("Link")
+    id_column = CSV_HEADER.index("ID")
+    status_column = CSV_HEADER.index("Status")
+    replaced = closed = 0
+    last_id = 0
+
+    temp_filename = f"{cafe_data_csvfile}.tmp"
+    with open(temp_filename, "w", newline="") as temp_file:
+        writer = csv.writer(temp_file)
+        writer.writerow(CSV_HEADER)
+
+        if os.path.isfile(cafe_data_csvfile):
+            with open(cafe_data_csvfile, "r", newline="") as file:
+                for row_dict in csv.DictReader(file):
+                    row = row_from_dict(row_dict)
+                    link = row[link_column]
+                    if link in updated_rows:
+                        row_id = row[id_column]
+                        row = list(updated_rows.pop(link))
+                        row[id_column] = row_id
+                        replaced += 1
+                    elif link in closed_links and row[status_column] != "closed":
+                        row[status_column] = "closed"
+                        closed += 1
+                    if str(row[id_column]).isdigit():
+                        last_id = max(last_id, int(row[id_column]))
+                    writer.writerow(row)
+
+        # cafes not previously saved
+        for row in updated_rows.values():
+            last_id += 1
+            row = list(row)
+            row[id_column] = last_id
+            writer.writerow(row)
+
+    os.replace(temp_filename, cafe_data_csvfile)
+    return replaced, len(updated_rows), closed
@@ -0,0 +1,73 @@
+"""
+Regions (countries) listed on europeancoffeetrip and the crawl of their listing pages.
+Each region has its own links txt file, csv file and (from the csv filename) resume checkpoint. The listing pages are
+read in parallel by a bounded pool of workers sharing one pool of reusable browsers for the selenium fallback.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from cafelinks import ExtractCafeLinks, BrowserPool
+
+LISTING_URL_TEMPLATE = "https://europeancoffeetrip.com/{slug}/"
+
+# region slug (listing page path): country code - used for the address parser and geocoding
+REGIONS = {
+    "uk": "UK",
+    "ireland": "IE",
+    "france": "FR",
+    "germany": "DE",
+    "netherlands": "NL",
+    "belgium": "BE",
+    "spain": "ES",
+    "portugal": "PT",
+    "italy": "IT",
+    "switzerland": "CH",
+    "austria": "AT",
+    "czech-republic": "CZ",
+    "slovakia": "SK",
+    "poland": "PL",
+    "hungary": "HU",
+    "greece": "GR",
+    "denmark": "DK",
+    "norway": "NO",
+    "sweden": "SE",
+    "finland": "FI",
+}
+
+
+def get_region_filenames(slug):
+    """returns the (links txt filename, csv filename) of the region"""
+    return f"cafes_links_{slug}.txt", f"all_cafes_{slug}.csv"
+
+
+def discover_region_links(slug, discovery_mode, browser_pool):
+    """gets the cafe links of one region and saves them to the region links file - returns the links"""
+    links_filename, _ = get_region_filenames(slug)
+    scraper = ExtractCafeLinks(result_txt_filename=links_filename, discovery_mode=discovery_mode,
+                               browser_pool=browser_pool)
+    scraper.cafe_website = LISTING_URL_TEMPLATE.format(slug=slug)
+    links = scraper.discover_links()
+    with open(links_filename, "w") as file:
+        for cafe_link in links:
+            file.write(cafe_link + '\n')
+    return links
+
+
+def crawl_region_listings(slugs, discovery_mode="http", workers=4, browsers=2, lean_browser=False):
+    """
+    discovers the cafe links of each region in parallel.
+    :param workers: number of regions processed at the same time
+    :param browsers: maximum number of headless browsers open at the same time (only used for the fallback)
+    :param lean_browser: browsers block images, css, fonts and other hosts (see cafelinks.create_firefox_driver)
+    :return: dict of slug: number of links, or the exception if the region failed
+    """
+    results = {}
+    with BrowserPool(browsers, lean_browser) as browser_pool, ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {slug: executor.submit(discover_region_links, slug, discovery_mode, browser_pool)
+                   for slug in slugs}
+        for slug, future in futures.items():
+            try:
+                results[slug] = len(future.result())
+                print(f"{slug}: {results[slug]} cafe links")
+            except Exception as e:
+                results[slug] = e
+                print(f"{slug}: cafe links could not be obtained ({e})")
+    return results
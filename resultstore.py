@@ -0,0 +1,184 @@
+"""
+SQLite result store - one row per cafe link, upserted when a cafe is processed again, so re-runs and refreshes update
+rows in place instead of appending duplicates. Each cafe keeps its ID from when it was first seen, plus first seen /
+last updated times. The database is in WAL mode so other programs can query it while a scrape is writing.
+
+    store = ResultStore("all_cafes.sqlite")
+    store.query(city="London", wifi=True)  # list of dicts keyed by csv column
+    store.export_csv("all_cafes_csv.csv")
+Used as an output format with output_format = "sqlite" in main.py (SqliteWriter).
+"""
+import csv
+import sqlite3
+import threading
+import time
+from writers import CSV_HEADER, BatchedWriter, typed_row
+
+# csv column: sqlite column - 'ID' is the integer primary key
+COLUMNS = {"ID": "id", "Name": "name", "Link": "link", "City": "city", "Street": "street", "Opening": "opening",
+           "Postcode": "postcode", "Url Location": "url_location", "Wifi": "wifi",
+           "Laptop Friendly": "laptop_friendly", "Pet Friendly": "pet_friendly", "Latitude": "latitude",
+           "Longitude": "longitude", "Country": "country", "Status": "status"}
+SERVICE_LABELS = {"Wifi": "Free Wi-Fi", "Laptop Friendly": "Laptop Friendly", "Pet Friendly": "Pet Friendly"}
+DATA_COLUMNS = [column for column in CSV_HEADER if column not in ("ID", "Link")]  # updated on upsert
+
+
+class ResultStore:
+    """
+    :param db_filename: sqlite database file
+    :param read_only: open for queries only - e.g. from another program while a scrape is running
+    """
+    def __init__(self, db_filename, read_only=False):
+        self.db_filename = db_filename
+        self.lock = threading.Lock()
+        if read_only:
+            self.connection = sqlite3.connect(f"file:{db_filename}?mode=ro", uri=True, check_same_thread=False)
+        else:
+            self.connection = sqlite3.connect(db_filename, check_same_thread=False)
+            self.connection.execute("PRAGMA journal_mode=WAL")  # readers are not blocked by the writer
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+            self.create_tables()
+        self.connection.row_factory = sqlite3.Row
+
+    def create_tables(self):
+        with self.lock, self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS cafes ("
+                "id INTEGER PRIMARY KEY, link TEXT NOT NULL UNIQUE, name TEXT, city TEXT, street TEXT, opening TEXT, "
+                "postcode TEXT, url_location TEXT, wifi INTEGER NOT NULL DEFAULT 0, "
+                "laptop_friendly INTEGER NOT NULL DEFAULT 0, pet_friendly INTEGER NOT NULL DEFAULT 0, "
+                "latitude REAL, longitude REAL, country TEXT, status TEXT NOT NULL DEFAULT 'open', "
+                "first_seen REAL NOT NULL, last_updated REAL NOT NULL)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS cafes_city ON cafes (city)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS cafes_postcode ON cafes (postcode)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS cafes_services "
+                                    "ON cafes (wifi, laptop_friendly, pet_friendly)")
+
+    def upsert_rows(self, rows):
+        """
+        inserts or updates the rows (CSV_HEADER order, or CafeRecords) by link in one transaction.
+        New links keep the row ID (their position in the links file, like the csv output) - the next ID if the row
+        has none or its ID is taken by another link. Links already stored keep their ID.
+        :return: (number of rows updated, number of rows added)
+        """
+        now = time.time()
+        values = []
+        for row in rows:
+            record = typed_row(row)
+            values.append([record["ID"], record["ID"], record["Link"]] + [record[column] for column in DATA_COLUMNS]
+                          + [now, now])
+
+        data_names = [COLUMNS[column] for column in DATA_COLUMNS]
+        names = ["link"] + data_names + ["first_seen", "last_updated"]
+        updates = ", ".join(f"{name} = excluded.{name}" for name in data_names + ["last_updated"])
+        # a NULL id is assigned the next ID by sqlite
+        row_id = "(SELECT CASE WHEN EXISTS (SELECT 1 FROM cafes WHERE id = ?) THEN NULL ELSE ? END)"
+        with self.lock, self.connection:
+            existing = self.count_existing([value[2] for value in values])
+            self.connection.executemany(
+                f"INSERT INTO cafes (id, {', '.join(names)}) VALUES ({row_id}, {', '.join('?' * len(names))}) "
+                f"ON CONFLICT (link) DO UPDATE SET {updates}", values)
+        return existing, len(values) - existing
+
+    def count_existing(self, links):
+        """number of the links already stored - lock must be held"""
+        total = 0
+        for start in range(0, len(links), 500):  # within the sqlite variable limit
+            chunk = links[start:start + 500]
+            placeholders = ", ".join("?" * len(chunk))
+            total += self.connection.execute(f"SELECT COUNT(*) FROM cafes WHERE link IN ({placeholders})",
+                                             chunk).fetchone()[0]
+        return total
+
+    def mark_closed(self, links):
+        """sets the status of the links no longer listed to 'closed' - returns the number changed"""
+        now = time.time()
+        with self.lock, self.connection:
+            cursor = self.connection.executemany(
+                "UPDATE cafes SET status = 'closed', last_updated = ? WHERE link = ? AND status != 'closed'",
+                [(now, link) for link in links])
+        return cursor.rowcount
+
+    def update_rows(self, updated_rows, closed_links):
+        """
+        refresh update in place - same arguments and result as refresh.update_csv_rows.
+        :return: (number of rows replaced, number of rows added, number of rows closed)
+        """
+        replaced, added = self.upsert_rows(updated_rows.values()) if updated_rows else (0, 0)
+        return replaced, added, self.mark_closed(closed_links)
+
+    def to_row(self, db_row):
+        """csv row dict from a database row - service flags back to their labels"""
+        row = {}
+        for column in CSV_HEADER:
+            value = db_row[COLUMNS[column]]
+            if column in SERVICE_LABELS:
+                value = SERVICE_LABELS[column] if value else None
+            row[column] = value
+        row["First Seen"] = db_row["first_seen"]
+        row["Last Updated"] = db_row["last_updated"]
+        return row
+
+    def get(self, link):
+        """the cafe of the link as a row dict - None if not stored"""
+        with self.lock:
+            db_row = self.connection.execute("SELECT * FROM cafes WHERE link = ?", (link,)).fetchone()
+        return self.to_row(db_row) if db_row else None
+
+    def query(self, city=None, postcode=None, wifi=None, laptop=None, pet=None, status="open"):
+        """
+        cafes matching all the given filters, as row dicts ordered by ID.
+        :param postcode: full postcode, or the outward code only (e.g. 'E1')
+        :param status: 'open', 'closed', or None for both
+        """
+        conditions = []
+        parameters = []
+        if city is not None:
+            conditions.append("city = ? COLLATE NOCASE")
+            parameters.append(city)
+        if postcode is not None:
+            conditions.append("(postcode = ? OR postcode LIKE ?)")
+            parameters += [postcode.upper(), f"{postcode.upper()} %"]
+        for name, value in (("wifi", wifi), ("laptop_friendly", laptop), ("pet_friendly", pet)):
+            if value is not None:
+                conditions.append(f"{name} = ?")
+                parameters.append(int(value))
+        if status is not None:
+            conditions.append("status = ?")
+            parameters.append(status)
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        with self.lock:
+            db_rows = self.connection.execute(f"SELECT * FROM cafes{where} ORDER BY id", parameters).fetchall()
+        return [self.to_row(db_row) for db_row in db_rows]
+
+    def __len__(self):
+        with self.lock:
+            return self.connection.execute("SELECT COUNT(*) FROM cafes").fetchone()[0]
+
+    def export_csv(self, csv_filename):
+        """writes all cafes to a csv in the CSV_HEADER columns - returns the number of rows"""
+        rows = self.query(status=None)
+        with open(csv_filename, "w", newline="") as file:
+            writer = csv.writer(file)
+            writer.writerow(CSV_HEADER)
+            for row in rows:
+                writer.writerow([row[column] for column in CSV_HEADER])
+        return len(rows)
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+class SqliteWriter(BatchedWriter):
+    """batched writer upserting the rows into a ResultStore"""
+    def __init__(self, db_filename, flush_every=50, flush_interval=5.0):
+        super().__init__(flush_every, flush_interval)
+        self.store = ResultStore(db_filename)
+
+    def write_rows(self, rows):
+        self.store.upsert_rows(rows)
+
+    def close(self):
+        super().close()
+        self.store.close()
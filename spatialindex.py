@@ -0,0 +1,248 @@
+"""
+Nearest cafe and radius queries over the extracted dataset.
+Cafes with a latitude / longitude are bucketed into a grid of 'cell_size' degree cells - a query only looks at the
+cells around the point, so k-nearest and radius queries take well under a millisecond for tens of thousands of cafes.
+The index is saved to a compact binary file (records sorted by cell) so it is only rebuilt when the csv changes.
+
+    index = load_or_build_spatial_index("all_cafes_csv.csv", "cafes_spatial.idx")
+    index.nearest(51.5246, -0.0785, k=5, wifi=True)  # [(distance km, cafe ID), ...] nearest first
+    index.within(51.5246, -0.0785, radius_km=2, laptop=True)
+    python spatialindex.py all_cafes_csv.csv --near 51.5246 -0.0785 --k 5 --wifi
+"""
+import argparse
+import csv
+import heapq
+import math
+import os
+import struct
+from writers import to_float
+
+INDEX_MAGIC = b"SPIX"
+INDEX_VERSION = 1
+HEADER = struct.Struct("<4sIIdI")  # magic, version, number of cafes, cell size in degrees, number of cells
+CELL = struct.Struct("<iiII")  # cell column, cell row, first record position, number of records
+RECORD = struct.Struct("<IddB")  # cafe ID, latitude, longitude, flags
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+# record flags
+WIFI = 1
+LAPTOP_FRIENDLY = 2
+PET_FRIENDLY = 4
+CLOSED = 8
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """great circle distance in km"""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def row_flags(row):
+    """flags of a csv DictReader row"""
+    flags = 0
+    if row.get("Wifi"):
+        flags |= WIFI
+    if row.get("Laptop Friendly"):
+        flags |= LAPTOP_FRIENDLY
+    if row.get("Pet Friendly"):
+        flags |= PET_FRIENDLY
+    if row.get("Status") == "closed":
+        flags |= CLOSED
+    return flags
+
+
+def required_flags(wifi=False, laptop=False, pet=False):
+    return (WIFI if wifi else 0) | (LAPTOP_FRIENDLY if laptop else 0) | (PET_FRIENDLY if pet else 0)
+
+
+class SpatialIndex:
+    """
+    grid index of (cafe ID, latitude, longitude, flags) records.
+    :param records: iterable of (cafe ID, latitude, longitude, flags)
+    :param cell_size: grid cell size in degrees - about 5.5 km of latitude at the default 0.05
+    """
+    def __init__(self, records, cell_size=0.05):
+        self.cell_size = cell_size
+        self.cells = {}  # (column, row): [records]
+        self.count = 0
+        for record in records:
+            self.cells.setdefault(self.cell_of(record[1], record[2]), []).append(record)
+            self.count += 1
+        self.update_extent()
+
+    def update_extent(self):
+        """cell column / row range of the cafes - the nearest search stops once it covers all of them"""
+        columns = [column for column, _ in self.cells] or [0]
+        rows = [row for _, row in self.cells] or [0]
+        self.extent = (min(columns), max(columns), min(rows), max(rows))
+
+    def cell_of(self, lat, lon):
+        return math.floor(lon / self.cell_size), math.floor(lat / self.cell_size)
+
+    @classmethod
+    def from_csv(cls, csv_filename, cell_size=0.05):
+        """from the output csv - cafes without a latitude / longitude are skipped"""
+        records = []
+        with open(csv_filename, "r", newline="") as file:
+            for row in csv.DictReader(file):
+                try:
+                    lat = to_float(row.get("Latitude"))
+                    lon = to_float(row.get("Longitude"))
+                except ValueError:
+                    continue
+                if lat is None or lon is None:
+                    continue
+                records.append((int(row["ID"]), lat, lon, row_flags(row)))
+        return cls(records, cell_size)
+
+    def save(self, index_filename):
+        cells = sorted(self.cells)
+        with open(index_filename, "wb") as file:
+            file.write(HEADER.pack(INDEX_MAGIC, INDEX_VERSION, self.count, self.cell_size, len(cells)))
+            position = 0
+            for cell in cells:
+                file.write(CELL.pack(cell[0], cell[1], position, len(self.cells[cell])))
+                position += len(self.cells[cell])
+            for cell in cells:
+                for record in self.cells[cell]:
+                    file.write(RECORD.pack(*record))
+
+    @classmethod
+    def load(cls, index_filename):
+        with open(index_filename, "rb") as file:
+            data = file.read()
+        magic, version, count, cell_size, cell_count = HEADER.unpack_from(data, 0)
+        if magic != INDEX_MAGIC or version != INDEX_VERSION:
+            raise ValueError(f"{index_filename} is not a spatial index - rebuild with spatialindex.py")
+
+        records_offset = HEADER.size + cell_count * CELL.size
+        records = list(RECORD.iter_unpack(data[records_offset:records_offset + count * RECORD.size]))
+        index = cls([], cell_size)
+        for column, row, position, length in CELL.iter_unpack(data[HEADER.size:records_offset]):
+            index.cells[(column, row)] = records[position:position + length]
+        index.count = count
+        index.update_extent()
+        return index
+
+    def __len__(self):
+        return self.count
+
+    def matching(self, cell, required, include_closed):
+        """records of the cell with all the required flags"""
+        for record in self.cells.get(cell, ()):
+            flags = record[3]
+            if flags & required == required and (include_closed or not flags & CLOSED):
+                yield record
+
+    def nearest(self, lat, lon, k=5, wifi=False, laptop=False, pet=False, include_closed=False):
+        """
+        the k nearest cafes with the required services, searching rings of cells outwards from the point.
+        :return: list of (distance km, cafe ID) nearest first - empty if k is 0 or less
+        """
+        if k <= 0:
+            return []
+        required = required_flags(wifi, laptop, pet)
+        centre_column, centre_row = self.cell_of(lat, lon)
+        min_column, max_column, min_row, max_row = self.extent
+        max_ring = max(abs(centre_column - min_column), abs(centre_column - max_column),
+                       abs(centre_row - min_row), abs(centre_row - max_row))
+        best = []  # max heap of (-distance, ID)
+
+        for ring in range(max_ring + 1):
+            for cell in self.ring_cells(centre_column, centre_row, ring):
+                for cafe_id, cafe_lat, cafe_lon, _ in self.matching(cell, required, include_closed):
+                    distance = haversine_km(lat, lon, cafe_lat, cafe_lon)
+                    if len(best) < k:
+                        heapq.heappush(best, (-distance, cafe_id))
+                    elif distance < -best[0][0]:
+                        heapq.heapreplace(best, (-distance, cafe_id))
+            # cafes outside the searched rings are at least this far away
+            if len(best) == k and -best[0][0] <= self.searched_km(lat, ring):
+                break
+
+        return sorted((-negative_distance, cafe_id) for negative_distance, cafe_id in best)
+
+    def ring_cells(self, centre_column, centre_row, ring):
+        """cells on the square ring 'ring' cells from the centre cell"""
+        if ring == 0:
+            yield centre_column, centre_row
+            return
+        for column in range(centre_column - ring, centre_column + ring + 1):
+            yield column, centre_row - ring
+            yield column, centre_row + ring
+        for row in range(centre_row - ring + 1, centre_row + ring):
+            yield centre_column - ring, row
+            yield centre_column + ring, row
+
+    def searched_km(self, lat, ring):
+        """minimum distance from the point to a cell outside the searched rings"""
+        furthest_lat = min(90.0, abs(lat) + (ring + 1) * self.cell_size)
+        return ring * self.cell_size * KM_PER_DEGREE * math.cos(math.radians(furthest_lat))
+
+    def within(self, lat, lon, radius_km, wifi=False, laptop=False, pet=False, include_closed=False):
+        """
+        the cafes within radius_km of the point with the required services.
+        :return: list of (distance km, cafe ID) nearest first - empty if k is 0 or less
+        """
+        if k <= 0:
+            return []
+        required = required_flags(wifi, laptop, pet)
+        lat_degrees = radius_km / KM_PER_DEGREE
+        furthest_lat = min(89.9, abs(lat) + lat_degrees)
+        lon_degrees = min(180.0, radius_km / (KM_PER_DEGREE * math.cos(math.radians(furthest_lat))))
+        min_column, min_row = self.cell_of(lat - lat_degrees, lon - lon_degrees)
+        max_column, max_row = self.cell_of(lat + lat_degrees, lon + lon_degrees)
+
+        if (max_column - min_column + 1) * (max_row - min_row + 1) > len(self.cells):
+            cells = list(self.cells)  # radius covers more cells than exist - check every cafe cell
+        else:
+            cells = [(column, row) for column in range(min_column, max_column + 1)
+                     for row in range(min_row, max_row + 1)]
+
+        results = []
+        for cell in cells:
+            for cafe_id, cafe_lat, cafe_lon, _ in self.matching(cell, required, include_closed):
+                distance = haversine_km(lat, lon, cafe_lat, cafe_lon)
+                if distance <= radius_km:
+                    results.append((distance, cafe_id))
+        return sorted(results)
+
+
+def load_or_build_spatial_index(csv_filename, index_filename, cell_size=0.05):
+    """loads the saved index, or builds and saves it if missing or older than the csv"""
+    if (os.path.exists(index_filename)
+            and os.path.getmtime(index_filename) >= os.path.getmtime(csv_filename)):
+        try:
+            return SpatialIndex.load(index_filename)
+        except (ValueError, struct.error):
+            pass  # old or damaged index - rebuilt below
+    index = SpatialIndex.from_csv(csv_filename, cell_size)
+    index.save(index_filename)
+    return index
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Find the nearest cafes, or the cafes within a radius")
+    parser.add_argument("csv_filename")
+    parser.add_argument("--index", default="cafes_spatial.idx", help="saved index file (rebuilt if out of date)")
+    parser.add_argument("--near", nargs=2, type=float, required=True, metavar=("LATITUDE", "LONGITUDE"))
+    parser.add_argument("--k", type=int, default=5, help="number of nearest cafes")
+    parser.add_argument("--radius", type=float, help="km - all cafes within the radius instead of the k nearest")
+    parser.add_argument("--wifi", action="store_true")
+    parser.add_argument("--laptop", action="store_true")
+    parser.add_argument("--pet", action="store_true")
+    args = parser.parse_args()
+
+    spatial_index = load_or_build_spatial_index(args.csv_filename, args.index)
+    filters = {"wifi": args.wifi, "laptop": args.laptop, "pet": args.pet}
+    if args.radius is not None:
+        found = spatial_index.within(*args.near, radius_km=args.radius, **filters)
+    else:
+        found = spatial_index.nearest(*args.near, k=args.k, **filters)
+
+    with open(args.csv_filename, "r", newline="") as csv_file:
+        names = {row["ID"]: row["Name"] for row in csv.DictReader(csv_file)}
+    for distance_km, found_id in found:
+        print(f"{distance_km:8.3f} km  {found_id:>6}  {names.get(str(found_id), '')}")
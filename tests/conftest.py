@@ -0,0 +1,44 @@
+"""
+Shared fixtures - the stand-in server of benchmarks/standin_server.py in place of the real site, and a fresh
+working directory for the output files of each test.
+"""
+import os
+import sys
+
+import pytest
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PACKAGE_DIR)
+sys.path.insert(0, os.path.join(PACKAGE_DIR, "benchmarks"))
+
+import extractCafeData  # noqa: E402
+import httpclient  # noqa: E402
+import main  # noqa: E402
+from ratelimit import AdaptiveRateLimiter  # noqa: E402
+from standin_server import StandInServer  # noqa: E402
+
+
+@pytest.fixture
+def standin():
+    with StandInServer(link_count=20) as server:
+        yield server
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """runs in a temporary directory, unattended, without geocode requests and with the rate limit lifted"""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(main, "unattended", True)
+    monkeypatch.setattr(main, "unattended_restart", False)
+    monkeypatch.setattr(main, "output_flush_rows", 5)
+    extractCafeData.use_offline_geocoding(True)
+    httpclient.use_client(httpclient.HttpClient(retries=0, rate_limiter=AdaptiveRateLimiter(None)))
+    yield tmp_path
+    extractCafeData.use_offline_geocoding(False)
+    httpclient.use_client(None)
+
+
+def write_links(links, filename="cafes_links.txt"):
+    with open(filename, "w") as file:
+        file.write("\n".join(links) + "\n")
+    return filename
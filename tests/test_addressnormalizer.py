@@ -0,0 +1,25 @@
+import re
+
+import pytest
+
+import addressnormalizer
+from addressnormalizer import AddressNormalizer
+from bench_addresses import check_corpus, load_corpus
+
+
+def test_corpus():
+    assert check_corpus(load_corpus(), AddressNormalizer().normalise) == []
+
+
+@pytest.mark.parametrize("address", [
+    "12 High Street, Shoreditch, London E1 6AN, UK",
+    "Unit 2,  18 Bold Street , Liverpool L1 4DS, united kingdom",
+    "3 The Arcade, Newcastle upon Tyne ne1 5an",
+    "4 Londonderry Road, London SW1A 1AA, UK",
+    "Flat 1; 2 Leeds Road, Bath BA1 5LJ, Wales",
+])
+def test_well_formed_fast_path_matches_full_grammar(address, monkeypatch):
+    assert addressnormalizer.WELL_FORMED_REGEX.fullmatch(address) is not None
+    fast_path = AddressNormalizer().parse(address)
+    monkeypatch.setattr(addressnormalizer, "WELL_FORMED_REGEX", re.compile(r"(?!)"))  # never matches
+    assert fast_path == AddressNormalizer().parse(address)
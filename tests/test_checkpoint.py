@@ -0,0 +1,22 @@
+from checkpoint import CheckpointJournal, DONE, FAILED, UNAVAILABLE
+
+
+def test_journal_is_compacted_on_open(tmp_path):
+    journal_filename = str(tmp_path / "out_checkpoint.log")
+    journal = CheckpointJournal(journal_filename)
+    for attempt in range(3):  # e.g. a link failing on each --retry-failed run
+        journal.record("a", 0, FAILED)
+    journal.record("b", 1, UNAVAILABLE)
+    journal.record("a", 0, DONE)
+    journal.close()
+    with open(journal_filename, "a") as file:
+        file.write("done\t2\tc")  # partly written line of an interrupted run
+
+    journal = CheckpointJournal(journal_filename)
+    assert journal.get_status("a") == DONE and journal.get_status("b") == UNAVAILABLE
+    assert not journal.is_processed("c")
+    journal.record("c", 2, DONE)
+    journal.close()
+    with open(journal_filename) as file:
+        assert [line.split("\t")[:3] for line in file] == [["unavailable", "1", "b"], ["done", "0", "a"],
+                                                           ["done", "2", "c"]]
@@ -0,0 +1,32 @@
+import threading
+
+from conftest import write_links
+from checkpoint import CheckpointJournal, DONE, FAILED
+import httpclient
+import main
+from ratelimit import AdaptiveRateLimiter, CircuitBreaker
+from workqueue import read_shard
+
+
+def test_outage_then_recovery(standin, workdir):
+    httpclient.use_client(httpclient.HttpClient(retries=0, rate_limiter=AdaptiveRateLimiter(None),
+                                                circuit_breaker=CircuitBreaker(2, reset_timeout=0.2)))
+    links = standin.cafe_links()
+    links_filename = write_links(links)
+    standin.settings["failure_rate"] = 1.0  # the site is down when the run starts ...
+    recovery = threading.Timer(1.0, standin.settings.update, kwargs={"failure_rate": 0.0})  # ... and back after 1s
+    recovery.start()
+    try:
+        main.create_cafe_data(links_filename, "out.csv", workers=2, detailed_report=False)
+    finally:
+        recovery.cancel()
+
+    # only the requests that reached the failing site are failed - the rest waited for the circuit to close
+    journal = CheckpointJournal(main.get_checkpoint_filename("out.csv"))
+    statuses = [journal.get_status(link) for link in links]
+    journal.close()
+    assert statuses.count(FAILED) == standin.counts["failure"] < 10
+    assert statuses.count(DONE) == len(read_shard("out.csv", "csv")) == len(links) - statuses.count(FAILED)
+
+    main.create_cafe_data(links_filename, "out.csv", retry_failed=True, detailed_report=False)
+    assert len(read_shard("out.csv", "csv")) == len(links)
@@ -0,0 +1,34 @@
+from conftest import write_links
+import main
+from workqueue import read_shard
+from writers import create_writer, row_from_dict
+
+
+def test_each_output_format_has_its_own_journal(standin, workdir):
+    links_filename = write_links(standin.cafe_links())
+    sqlite_output = main.get_output_filename("out.csv", "sqlite")
+    main.create_cafe_data(links_filename, sqlite_output, output_format="sqlite", detailed_report=False)
+
+    # switching format in the same directory starts a new extraction rather than resuming the sqlite one
+    parquet_output = main.get_output_filename("out.csv", "parquet")
+    assert main.get_checkpoint_filename(parquet_output) != main.get_checkpoint_filename(sqlite_output)
+    main.create_cafe_data(links_filename, parquet_output, output_format="parquet", detailed_report=False)
+
+    assert len(read_shard(sqlite_output, "sqlite")) == 20
+    assert len(read_shard(parquet_output, "parquet")) == 20
+
+
+def test_csv_journal_keeps_its_name():
+    assert main.get_checkpoint_filename("all_cafes_csv.csv") == "all_cafes_csv_checkpoint.log"
+
+
+def test_sqlite_export_keeps_link_file_ids(standin, workdir):
+    links_filename = write_links(standin.cafe_links())
+    main.create_cafe_data(links_filename, "out.csv", detailed_report=False)
+    csv_rows = read_shard("out.csv", "csv")[5:]  # e.g. the first cafes were unavailable
+
+    with create_writer("sqlite", "out.sqlite") as writer:
+        for row in csv_rows:
+            writer.write_row(row_from_dict(row))
+    sqlite_ids = {row["Link"]: row["ID"] for row in read_shard("out.sqlite", "sqlite")}
+    assert sqlite_ids == {row["Link"]: int(row["ID"]) for row in csv_rows}
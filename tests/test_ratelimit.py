@@ -0,0 +1,16 @@
+from ratelimit import AdaptiveRateLimiter
+
+URL = "http://cafes.test/cafe/1/"
+
+
+def test_rate_recovers_quickly_after_a_429_burst():
+    limiter = AdaptiveRateLimiter(20, 20)
+    for _ in range(4):  # the 429s of concurrent requests halve the rate once - the host is paused after the first
+        limiter.record(URL, 429, retry_after=0.01)
+    assert limiter.host_rate(URL) == 10
+
+    responses = 0
+    while limiter.host_rate(URL) < 20:
+        limiter.record(URL, 200)
+        responses += 1
+    assert responses <= 10
@@ -0,0 +1,36 @@
+import pytest
+
+from conftest import write_links
+import httpclient
+import main
+from ratelimit import AdaptiveRateLimiter
+from writers import CsvWriter
+
+
+def test_validators_saved_only_with_the_rows(standin, workdir, monkeypatch):
+    client = httpclient.HttpClient(retries=0, rate_limiter=AdaptiveRateLimiter(None), validator_db="validators.db")
+    httpclient.use_client(client)
+    links = standin.cafe_links()
+    links_filename = write_links(links)
+
+    write_rows = CsvWriter.write_rows
+    flushes = []
+
+    def failing_write_rows(self, rows):
+        if flushes:
+            raise OSError("disk full")
+        flushes.append(len(rows))
+        write_rows(self, rows)
+
+    monkeypatch.setattr(CsvWriter, "write_rows", failing_write_rows)
+    with pytest.raises(OSError):
+        main.create_cafe_data(links_filename, "out.csv", detailed_report=False)
+
+    # the rows lost with the failed flush get no ETag - else the next refresh would get a 304 and never save them
+    saved = [link for link in links if client.validators.get(link) != (None, None)]
+    assert saved == links[:flushes[0]]
+
+    monkeypatch.setattr(CsvWriter, "write_rows", write_rows)
+    main.create_cafe_data(links_filename, "out.csv", conditional=True, detailed_report=False)
+    assert all(client.validators.get(link) != (None, None) for link in links)
+    client.close()
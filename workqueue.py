@@ -0,0 +1,228 @@
+"""
+Shared work queue of cafe links, so a crawl can be split between several worker processes (or machines sharing the
+queue file). Workers claim batches of links under time limited leases, renew the leases while they work and mark
+each link done once its row is saved to their own output shard. The links of a worker that crashes or is stopped
+are handed to the other workers once their leases expire. merge_shards then combines the shards into one output.
+
+    queue = WorkQueue("work_queue.sqlite")
+    queue.add_links(links)
+    batch = queue.claim("worker-1", 20)  # [(index, link)]
+    queue.complete("worker-1", link, DONE)
+
+The queue is a sqlite file (WAL mode, claims in an immediate transaction) - another store only needs the same
+WorkQueue methods.
+"""
+import csv
+import glob
+import os
+import sqlite3
+import threading
+import time
+from checkpoint import DONE, UNAVAILABLE, FAILED
+from writers import row_from_dict
+
+PENDING = "pending"  # waiting to be claimed
+LEASED = "leased"  # claimed by a worker - claimable again once the lease expires
+
+
+class WorkQueue:
+    """
+    :param queue_filename: sqlite queue file shared by the workers
+    :param lease_seconds: seconds a claimed link is held by a worker without being renewed
+    :param max_attempts: claims of a link before it is marked failed - e.g. a page that crashes every worker
+    """
+    def __init__(self, queue_filename, lease_seconds=300, max_attempts=3):
+        self.queue_filename = queue_filename
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.lock = threading.Lock()
+        # autocommit - transactions are started explicitly, claims with BEGIN IMMEDIATE so two workers can't
+        # claim the same links
+        self.connection = sqlite3.connect(queue_filename, timeout=30, isolation_level=None, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS links ("
+            "link TEXT PRIMARY KEY, link_index INTEGER NOT NULL, status TEXT NOT NULL DEFAULT 'pending', "
+            "worker TEXT, lease_expires REAL, attempts INTEGER NOT NULL DEFAULT 0, updated REAL)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS links_claim ON links (status, link_index)")
+
+    def add_links(self, links):
+        """adds the links not already queued - the link index is its position in 'links'. Returns number added"""
+        with self.lock:
+            before = self.connection.total_changes
+            self.connection.execute("BEGIN IMMEDIATE")
+            self.connection.executemany("INSERT OR IGNORE INTO links (link, link_index, updated) VALUES (?, ?, ?)",
+                                        [(link, index, time.time()) for index, link in enumerate(links)])
+            self.connection.execute("COMMIT")
+            return self.connection.total_changes - before
+
+    def claim(self, worker, batch_size):
+        """
+        leases up to batch_size pending links, or links whose lease has expired, to the worker - lowest index first.
+        Links already claimed max_attempts times are marked failed instead.
+        :return: list of (index, link)
+        """
+        now = time.time()
+        with self.lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                self.connection.execute(
+                    "UPDATE links SET status = ?, worker = NULL, lease_expires = NULL, updated = ? "
+                    "WHERE status = ? AND lease_expires < ? AND attempts >= ?",
+                    (FAILED, now, LEASED, now, self.max_attempts))
+                rows = self.connection.execute(
+                    "SELECT link_index, link FROM links WHERE status = ? OR (status = ? AND lease_expires < ?) "
+                    "ORDER BY link_index LIMIT ?", (PENDING, LEASED, now, batch_size)).fetchall()
+                self.connection.executemany(
+                    "UPDATE links SET status = ?, worker = ?, lease_expires = ?, attempts = attempts + 1, updated = ? "
+                    "WHERE link = ?", [(LEASED, worker, now + self.lease_seconds, now, link) for _, link in rows])
+                self.connection.execute("COMMIT")
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+        return [(index, link) for index, link in rows]
+
+    def renew(self, worker, links):
+        """extends the leases the worker still holds on the links - returns the number renewed"""
+        return self.update_leased(worker, links, "status = ?, lease_expires = ?",
+                                  (LEASED, time.time() + self.lease_seconds))
+
+    def release(self, worker, links):
+        """hands the worker's leased links back to the queue unprocessed, e.g. when stopping"""
+        return self.update_leased(worker, links, "status = ?, worker = NULL, lease_expires = NULL, "
+                                                 "attempts = MAX(attempts - 1, 0)", (PENDING,))
+
+    def complete(self, worker, link, status=DONE):
+        """marks a link finished - DONE, UNAVAILABLE or FAILED. False if the worker's lease was lost"""
+        return self.update_leased(worker, [link], "status = ?, lease_expires = NULL", (status,)) == 1
+
+    def update_leased(self, worker, links, assignments, values):
+        """updates the links still leased to the worker - returns the number updated"""
+        if not links:
+            return 0
+        with self.lock:
+            before = self.connection.total_changes
+            self.connection.execute("BEGIN IMMEDIATE")
+            self.connection.executemany(
+                f"UPDATE links SET {assignments}, updated = ? WHERE link = ? AND worker = ? AND status = ?",
+                [values + (time.time(), link, worker, LEASED) for link in links])
+            self.connection.execute("COMMIT")
+            return self.connection.total_changes - before
+
+    def retry_failed(self):
+        """puts the unavailable and failed links back in the queue - returns the number re-queued"""
+        with self.lock:
+            cursor = self.connection.execute(
+                "UPDATE links SET status = ?, worker = NULL, attempts = 0, updated = ? WHERE status IN (?, ?)",
+                (PENDING, time.time(), UNAVAILABLE, FAILED))
+            return cursor.rowcount
+
+    def counts(self):
+        """number of links in each status - expired leases are still counted as leased"""
+        with self.lock:
+            rows = self.connection.execute("SELECT status, COUNT(*) FROM links GROUP BY status").fetchall()
+        return dict(rows)
+
+    def remaining(self):
+        """number of links pending or leased"""
+        counts = self.counts()
+        return counts.get(PENDING, 0) + counts.get(LEASED, 0)
+
+    def link_indexes(self):
+        """link: index of every queued link"""
+        with self.lock:
+            return dict(self.connection.execute("SELECT link, link_index FROM links").fetchall())
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+class LeaseKeeper:
+    """
+    background thread renewing a worker's leases every lease_seconds / 3, so slow batches are not handed to other
+    workers. Stops renewing when the worker dies - the leases then expire.
+    """
+    def __init__(self, queue, worker):
+        self.queue = queue
+        self.worker = worker
+        self.held = set()
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def hold(self, links):
+        with self.lock:
+            self.held.update(links)
+
+    def drop(self, links):
+        with self.lock:
+            self.held.difference_update(links)
+
+    def run(self):
+        while not self.stopped.wait(self.queue.lease_seconds / 3):
+            with self.lock:
+                links = list(self.held)
+            self.queue.renew(self.worker, links)
+
+    def stop(self):
+        """stops renewing and releases the links still held back to the queue"""
+        self.stopped.set()
+        self.thread.join()
+        with self.lock:
+            links = list(self.held)
+            self.held.clear()
+        self.queue.release(self.worker, links)
+
+
+def get_shard_filename(output_filename, worker):
+    """output shard of a worker e.g. 'all_cafes_csv.csv' -> 'all_cafes_csv_shard_worker-1.csv'"""
+    base, extension = os.path.splitext(output_filename)
+    return f"{base}_shard_{worker}{extension}"
+
+
+def find_shards(output_filename):
+    """shard files of all workers for the output file"""
+    base, extension = os.path.splitext(output_filename)
+    return sorted(glob.glob(f"{glob.escape(base)}_shard_*{extension}"))
+
+
+def read_shard(shard_filename, output_format):
+    """row dicts of a worker's shard"""
+    if output_format == "csv":
+        with open(shard_filename, "r", newline="") as file:
+            return list(csv.DictReader(file))
+    if output_format == "parquet":
+        import pyarrow.parquet  # optional dependency - only needed for parquet output
+        return pyarrow.parquet.read_table(shard_filename).to_pylist()
+    if output_format == "sqlite":
+        from resultstore import ResultStore
+        store = ResultStore(shard_filename, read_only=True)
+        rows = store.query(status=None)
+        store.close()
+        return rows
+    raise ValueError(f"Unknown output format: {output_format}. Options: csv, parquet, sqlite")
+
+
+def merge_shards(shard_filenames, output_format, writer, link_indexes=None):
+    """
+    writes the rows of the worker shards to the writer, one row per link in link index order - a link saved by two
+    workers (its lease expired while the first was still working on it) is only written once.
+    :param link_indexes: link: index from the queue - rows are ordered by ID if None
+    :return: number of rows written
+    """
+    rows = {}
+    for shard_filename in shard_filenames:
+        for row in read_shard(shard_filename, output_format):
+            rows[row["Link"]] = row
+    if link_indexes is not None:
+        order = sorted(rows, key=lambda link: link_indexes.get(link, len(link_indexes)))
+    else:
+        order = sorted(rows, key=lambda link: int(rows[link]["ID"] or 0))
+    for link in order:
+        writer.write_row(row_from_dict(rows[link]))
+    return len(order)
@@ -0,0 +1,197 @@
+"""
+Output writers for the extracted cafe rows.
+The file is kept open for the whole run and rows are written in batches, instead of opening the file for every cafe.
+CsvWriter - the original csv output. ParquetWriter - columnar output with proper column types (float latitude /
+longitude, boolean wifi / laptop / pet flags) so the dataset can be loaded without re-parsing csv text.
+SqliteWriter (resultstore.py) - rows upserted by cafe link.
+"""
+from abc import ABC, abstractmethod
+import csv
+import os
+import time
+
+# csv header - update row headers and column position if editing or re-ordering data (see CafeData.get_row)
+CSV_HEADER = ["ID", "Name", "Link", "City", "Street", "Opening", "Postcode", "Url Location",
+              "Wifi", "Laptop Friendly", "Pet Friendly", "Latitude", "Longitude", "Country", "Status"]
+COLUMN_DEFAULTS = {"Country": "UK", "Status": "open"}  # value for columns missing from csv files saved by earlier versions
+
+BOOLEAN_COLUMNS = ["Wifi", "Laptop Friendly", "Pet Friendly"]  # label string if true, empty / None if false
+FLOAT_COLUMNS = ["Latitude", "Longitude"]
+INTEGER_COLUMNS = ["ID"]
+
+
+def to_float(value):
+    """float from a csv / api string - None if empty"""
+    if value is None or value == "":
+        return None
+    return float(value)
+
+
+def typed_row(row):
+    """returns the row as a dict with typed values - floats for coordinates, booleans for the service flags"""
+    record = {}
+    for column, value in zip(CSV_HEADER, row):
+        if column in BOOLEAN_COLUMNS:
+            record[column] = bool(value)
+        elif column in FLOAT_COLUMNS:
+            record[column] = to_float(value)
+        elif column in INTEGER_COLUMNS:
+            record[column] = int(value) if value not in (None, "") else None
+        else:
+            record[column] = value if value != "" else None
+    return record
+
+
+def row_from_dict(row_dict):
+    """returns a csv DictReader row in the CSV_HEADER column order - missing columns get their default"""
+    return [row_dict.get(column, COLUMN_DEFAULTS.get(column, "")) for column in CSV_HEADER]
+
+
+def upgrade_csv_header(filename):
+    """rewrites a csv saved with an older header to the current CSV_HEADER columns - returns True if rewritten"""
+    with open(filename, "r", newline="") as file:
+        header = next(csv.reader(file), None)
+    if header is None or header == CSV_HEADER:
+        return False
+
+    temp_filename = f"{filename}.tmp"
+    with open(filename, "r", newline="") as file, open(temp_filename, "w", newline="") as temp_file:
+        writer = csv.writer(temp_file)
+        writer.writerow(CSV_HEADER)
+        for row_dict in csv.DictReader(file):
+            writer.writerow(row_from_dict(row_dict))
+    os.replace(temp_filename, filename)
+    return True
+
+
+class BatchedWriter(ABC):
+    """
+    buffers rows and writes them once 'flush_every' rows are buffered or 'flush_interval' seconds have passed.
+    write_row returns True when the buffered rows were written - so callers know which rows are saved.
+    A row is a list in the CSV_HEADER column order, or a CafeRecord (records.py).
+    """
+    def __init__(self, flush_every=50, flush_interval=5.0):
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self.buffer = []
+        self.last_flush = time.monotonic()
+
+    def write_row(self, row):
+        self.buffer.append(row)
+        if len(self.buffer) >= self.flush_every or time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+            return True
+        return False
+
+    def flush(self):
+        if self.buffer:
+            self.write_rows(self.buffer)
+            self.buffer = []
+        self.last_flush = time.monotonic()
+
+    @abstractmethod
+    def write_rows(self, rows):
+        """writes the buffered rows to the output"""
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class CsvWriter(BatchedWriter):
+    """appends rows to the csv file - creates the header if the file is new, or upgrades an older header"""
+    def __init__(self, filename, flush_every=50, flush_interval=5.0):
+        super().__init__(flush_every, flush_interval)
+        self.filename = filename
+        new_file = not os.path.isfile(filename) or os.path.getsize(filename) == 0
+        if not new_file:
+            upgrade_csv_header(filename)
+        self.file = open(filename, "a", newline="")
+        self.writer = csv.writer(self.file)
+        if new_file:
+            self.writer.writerow(CSV_HEADER)
+            self.file.flush()
+
+    def write_rows(self, rows):
+        self.writer.writerows(rows)
+        self.file.flush()
+
+    def close(self):
+        super().close()
+        self.file.close()
+
+
+class ParquetWriter(BatchedWriter):
+    """
+    writes rows to a parquet dataset directory with typed columns - each flush is a row group.
+    Each run writes a new part file so a resumed run adds to the dataset, e.g. read with
+    pyarrow.dataset.dataset(directory) or pandas.read_parquet(directory).
+    Requires pyarrow.
+    """
+    def __init__(self, directory, flush_every=500, flush_interval=30.0):
+        super().__init__(flush_every, flush_interval)
+        import pyarrow  # optional dependency - only needed for parquet output
+        import pyarrow.parquet
+        self.pyarrow = pyarrow
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.filename = os.path.join(directory, f"part-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.parquet")
+        self.schema = parquet_schema()
+        self.writer = pyarrow.parquet.ParquetWriter(self.filename, self.schema)
+
+    def write_rows(self, rows):
+        records = [typed_row(row) for row in rows]
+        self.writer.write_table(self.pyarrow.Table.from_pylist(records, schema=self.schema))
+
+    def close(self):
+        super().close()
+        self.writer.close()
+
+
+def parquet_schema():
+    """arrow schema of the cafe data columns"""
+    import pyarrow as pa
+    fields = []
+    for column in CSV_HEADER:
+        if column in BOOLEAN_COLUMNS:
+            fields.append(pa.field(column, pa.bool_()))
+        elif column in FLOAT_COLUMNS:
+            fields.append(pa.field(column, pa.float64()))
+        elif column in INTEGER_COLUMNS:
+            fields.append(pa.field(column, pa.int32()))
+        else:
+            fields.append(pa.field(column, pa.string()))
+    return pa.schema(fields)
+
+
+def create_writer(output_format, filename, flush_every=None, flush_interval=None):
+    """returns the writer for 'csv', 'parquet' or 'sqlite' output"""
+    settings = {}
+    if flush_every is not None:
+        settings["flush_every"] = flush_every
+    if flush_interval is not None:
+        settings["flush_interval"] = flush_interval
+
+    if output_format == "csv":
+        return CsvWriter(filename, **settings)
+    if output_format == "parquet":
+        return ParquetWriter(filename, **settings)
+    if output_format == "sqlite":
+        from resultstore import SqliteWriter  # resultstore imports this module
+        return SqliteWriter(filename, **settings)
+    raise ValueError(f"Unknown output format: {output_format}. Options: csv, parquet, sqlite")
+
+
+def csv_to_parquet(csv_filename, parquet_directory):
+    """converts a previously saved cafe data csv to a typed parquet dataset - returns number of rows"""
+    total = 0
+    with open(csv_filename, "r", newline="") as file, ParquetWriter(parquet_directory) as writer:
+        for row_dict in csv.DictReader(file):
+            writer.write_row(row_from_dict(row_dict))
+            total += 1
+    return total